@@ -40,3 +40,16 @@ def check_password(self, raw_password: str) -> bool:
 
     def touch(self):
         self.updated_at = now_utc()
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        # import tardio: apps.accounts.profiles importa este módulo
+        from apps.accounts.profiles import invalidate_profile
+        invalidate_profile(self.id)
+        return result
+
+    def delete(self, *args, **kwargs):
+        user_id = self.id
+        super().delete(*args, **kwargs)
+        from apps.accounts.profiles import invalidate_profile
+        invalidate_profile(user_id)
@@ -0,0 +1,132 @@
+# apps/accounts/profiles.py
+"""
+Perfil da conta logada (`session["user_id"]`), resolvido uma vez por requisição.
+
+- `AccountProfileMiddleware` carrega o perfil no início da requisição e o
+  deixa em `request.account` e no contexto da requisição; `get_profile(uid)`
+  do mesmo uid devolve esse objeto sem consultar nada.
+- Fora da requisição atual, os perfis ficam num LRU do processo por
+  ACCOUNT_PROFILE_CACHE_TTL segundos (0 desliga). `User.save()`/`delete()`
+  removem a entrada; nos outros workers ela expira pelo TTL, por isso ele é
+  curto.
+
+O perfil é um retrato só-leitura (SimpleNamespace) com os campos que as
+regras de permissão e a auditoria usam, não o documento User.
+"""
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+from apps.accounts.models import User
+
+PROFILE_FIELDS = ("id", "full_name", "email", "is_company", "is_superuser", "is_active")
+
+_MISSING = object()
+_request_profile = contextvars.ContextVar("account_profile", default=None)  # (uid, perfil)
+_cache: "OrderedDict[str, tuple]" = OrderedDict()  # uid -> (expira em, perfil ou None)
+_cache_lock = threading.Lock()
+
+
+def _ttl() -> float:
+    return float(getattr(settings, "ACCOUNT_PROFILE_CACHE_TTL", 30))
+
+
+def _max_entries() -> int:
+    return int(getattr(settings, "ACCOUNT_PROFILE_CACHE_MAX_ENTRIES", 5000))
+
+
+def load_profile(uid: str) -> Optional[SimpleNamespace]:
+    """Consulta a coleção accounts (só PROFILE_FIELDS); None se a conta não existe."""
+    user = User.objects(id=uid).only(*PROFILE_FIELDS).first()
+    if user is None:
+        return None
+    return SimpleNamespace(**{name: getattr(user, name, None) for name in PROFILE_FIELDS})
+
+
+def _cached(uid: str):
+    with _cache_lock:
+        item = _cache.get(uid)
+        if item is None:
+            return _MISSING
+        expires_at, profile = item
+        if expires_at < time.monotonic():
+            del _cache[uid]
+            return _MISSING
+        _cache.move_to_end(uid)
+        return profile
+
+
+def _remember(uid: str, profile) -> None:
+    ttl = _ttl()
+    if ttl <= 0:
+        return
+    with _cache_lock:
+        _cache[uid] = (time.monotonic() + ttl, profile)
+        _cache.move_to_end(uid)
+        while len(_cache) > _max_entries():
+            _cache.popitem(last=False)
+
+
+def get_profile(uid) -> Optional[SimpleNamespace]:
+    """Perfil de `uid`: o da requisição atual, o do cache do processo ou do Mongo."""
+    if not uid:
+        return None
+    uid = str(uid)
+    scoped = _request_profile.get()
+    if scoped is not None and scoped[0] == uid:
+        return scoped[1]
+    profile = _cached(uid)
+    if profile is _MISSING:
+        try:
+            profile = load_profile(uid)
+        except Exception:
+            # id inválido ou Mongo fora: trata como sem perfil, sem guardar no cache
+            return None
+        _remember(uid, profile)
+    return profile
+
+
+def invalidate_profile(uid) -> None:
+    """Chamado em User.save()/delete()."""
+    if not uid:
+        return
+    uid = str(uid)
+    with _cache_lock:
+        _cache.pop(uid, None)
+    scoped = _request_profile.get()
+    if scoped is not None and scoped[0] == uid:
+        _request_profile.set(None)
+
+
+def actor_info(uid) -> Tuple[Optional[str], str]:
+    """(id, nome) de quem fez a alteração, para a auditoria."""
+    if not uid:
+        return None, "Unknown"
+    profile = get_profile(uid)
+    if profile is None:
+        return str(uid), f"User {uid}"
+    # tenta nome completo -> email -> ID
+    return str(profile.id), profile.full_name or profile.email or f"User {uid}"
+
+
+class AccountProfileMiddleware:
+    """Resolve o perfil da sessão uma vez e o expõe em `request.account`."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        session = getattr(request, "session", None)
+        uid = session.get("user_id") if session is not None else None
+        request.account = get_profile(uid)
+        token = _request_profile.set((str(uid), request.account)) if uid else None
+        try:
+            return self.get_response(request)
+        finally:
+            if token is not None:
+                _request_profile.reset(token)
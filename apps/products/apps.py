@@ -13,6 +13,11 @@ def ready(self):
         if os.environ.get("RUN_MAIN") != "true":
             return
 
+        from django.conf import settings
+        # Em produção a ingestão roda em `manage.py run_ingest`, fora do web
+        if not getattr(settings, "MQTT_RUN_IN_WEB", True):
+            return
+
         print(">>> ProductsConfig.ready() chamado (inicializando app products)")
 
         from .mqtt_worker import start_mqtt_worker
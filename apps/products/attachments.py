@@ -0,0 +1,79 @@
+# apps/products/attachments.py
+"""
+Índice dos anexos de uso (manutenção/reparo) no próprio produto.
+
+`Products.attachmentIndex` é uma lista plana
+`[{"id": attachmentId, "file": grid_id, "filename", "contentType"}]`,
+recalculada em todo `save()` (Products.clean) a partir de
+usageData.maintenanceHistory/repairHistory. Com o índice multikey em
+`attachmentIndex.id`, o download resolve o anexo numa consulta com
+projeção `$elemMatch`, sem hidratar o produto nem percorrer o histórico.
+
+Produtos gravados antes do índice: `manage.py backfill_attachment_index`.
+"""
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from apps.products.models import Products
+
+ATTACHMENT_LISTS = ("maintenanceHistory", "repairHistory")
+
+
+def build_attachment_index(usage: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Lista do attachmentIndex a partir de usageData em formato Mongo (dict)."""
+    index = []
+    for list_name in ATTACHMENT_LISTS:
+        for item in (usage or {}).get(list_name) or []:
+            for att in (item or {}).get("attachments") or []:
+                if not att or not att.get("attachmentId"):
+                    continue
+                index.append({
+                    "id": att["attachmentId"],
+                    "file": att.get("file"),
+                    "filename": att.get("filename"),
+                    "contentType": att.get("contentType"),
+                })
+    return index
+
+
+def find_attachment(product_id, attachment_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Produto (só os campos de permissão) + a entrada do anexo, numa consulta.
+    None se o produto não existe; sem a chave "attachment" se o anexo não existe.
+    """
+    if not ObjectId.is_valid(str(product_id)):
+        return None
+    raw = Products._get_collection().find_one(
+        {"_id": ObjectId(str(product_id))},
+        {
+            "createdById": 1,
+            "ownerUserId": 1,
+            "attachmentIndex": {"$elemMatch": {"id": attachment_id}},
+        },
+    )
+    if raw is None:
+        return None
+    matches = raw.pop("attachmentIndex", None) or []
+    if matches:
+        raw["attachment"] = matches[0]
+    return raw
+
+
+def backfill_attachment_index(batch_size: int = 500, only_missing: bool = True) -> int:
+    """Grava o attachmentIndex direto no Mongo (sem save/auditoria). Devolve quantos produtos mudaram."""
+    collection = Products._get_collection()
+    query = {"attachmentIndex": {"$exists": False}} if only_missing else {}
+    ops, updated = [], 0
+    for raw in collection.find(query, {"usageData.maintenanceHistory": 1, "usageData.repairHistory": 1}):
+        ops.append(UpdateOne(
+            {"_id": raw["_id"]},
+            {"$set": {"attachmentIndex": build_attachment_index(raw.get("usageData"))}},
+        ))
+        if len(ops) >= batch_size:
+            updated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += collection.bulk_write(ops, ordered=False).modified_count
+    return updated
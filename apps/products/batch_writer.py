@@ -0,0 +1,323 @@
+# apps/products/batch_writer.py
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from apps.products.models import Products
+from apps.products.services import (
+    OPERATIONAL_PATH,
+    PATH_NOT_VIABLE,
+    clean_operational_delta,
+    ensure_operational_container,
+    operational_set_doc,
+)
+from apps.products.passport_cache import invalidate_passport
+from apps.products.telemetry import record_telemetry_many
+from apps.tracking.models import ProductAudit
+from apps.tracking.utils import build_operational_audit, operational_audit_mode, upsert_operational_bucket
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30.0
+
+
+class OperationalBatchWriter:
+    """
+    Agrupa deltas de operationalData por produto e grava em lote.
+
+    - Deltas do mesmo produto são mesclados na ordem de chegada (a última
+      leitura de cada chave vence), então a ordem por produto é preservada.
+    - O flush ocorre a cada `window_ms` ou quando `max_messages` mensagens
+      foram acumuladas, com um único `bulk_write` de `$set` por chave.
+    - Flushes nunca rodam em paralelo, para que um lote mais novo não
+      ultrapasse um mais antigo do mesmo produto.
+    - Falha do Mongo antes do estado ser gravado (rede, troca de primário...):
+      o lote volta para a fila, na frente dos deltas que chegaram depois, e o
+      próximo flush espera um backoff exponencial (RETRY_BASE_SECONDS até
+      RETRY_MAX_SECONDS).
+    """
+
+    def __init__(self, *, window_ms: int = 250, max_messages: int = 500, audit: bool = True):
+        self.window = max(window_ms, 1) / 1000.0
+        self.max_messages = max(max_messages, 1)
+        self.audit = audit
+
+        # product_id -> {"delta": {}, "messages": int, "topics": set, "points": [(received_at, delta)]}
+        self._pending = OrderedDict()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+        self.stats = {
+            "flushes": 0,
+            "messages": 0,
+            "products": 0,
+            "unknownProducts": 0,
+            "errors": 0,
+            "retries": 0,
+            "lastFlushMessages": 0,
+            "lastFlushProducts": 0,
+            "lastFlushMs": 0.0,
+            "maxFlushMs": 0.0,
+            "totalFlushMs": 0.0,
+        }
+
+    # ---------------- ciclo de vida ----------------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mqtt-batch-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=self.window * 4 + 5)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.window)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.stats["errors"] += 1
+                logger.exception("Falha no flush do batch writer de operationalData")
+
+    # ---------------- entrada ----------------
+
+    def add(self, product_id: str, delta: dict, *, topic: str | None = None, received_at: datetime | None = None):
+        if not delta:
+            return
+        received_at = received_at or datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._pending.get(product_id)
+            if entry is None:
+                entry = {"delta": {}, "messages": 0, "topics": set(), "points": []}
+                self._pending[product_id] = entry
+            entry["delta"].update(delta)
+            entry["points"].append((received_at, delta))
+            entry["messages"] += 1
+            if topic:
+                entry["topics"].add(topic)
+            self._count += 1
+            full = self._count >= self.max_messages
+        if full:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._count
+
+    # ---------------- flush ----------------
+
+    def flush(self) -> dict:
+        with self._flush_lock:
+            if not self._stop.is_set() and time.monotonic() < self._retry_at:
+                return {"messages": 0, "products": 0, "ms": 0.0}
+            with self._lock:
+                batch, self._pending = self._pending, OrderedDict()
+                messages, self._count = self._count, 0
+            if not batch:
+                return {"messages": 0, "products": 0, "ms": 0.0}
+            try:
+                return self._flush_batch(batch, messages)
+            except PyMongoError as exc:
+                # só a leitura e o bulk_write do estado propagam: nada do lote foi perdido
+                self._requeue(batch, messages)
+                self._failures += 1
+                delay = min(RETRY_BASE_SECONDS * 2 ** (self._failures - 1), RETRY_MAX_SECONDS)
+                self._retry_at = time.monotonic() + delay
+                self.stats["errors"] += 1
+                self.stats["retries"] += 1
+                logger.warning("Falha ao gravar lote de operationalData (%s); nova tentativa em %.1fs",
+                               exc, delay)
+                return {"messages": 0, "products": 0, "ms": 0.0}
+
+    def _requeue(self, batch, messages):
+        """Devolve `batch` à fila antes do que chegou depois (a ordem por produto se mantém)."""
+        with self._lock:
+            newer, self._pending = self._pending, batch
+            for pid, entry in newer.items():
+                old = batch.get(pid)
+                if old is None:
+                    batch[pid] = entry
+                    continue
+                old["delta"].update(entry["delta"])
+                old["points"].extend(entry["points"])
+                old["messages"] += entry["messages"]
+                old["topics"] |= entry["topics"]
+            self._count += messages
+
+    def _flush_batch(self, batch, messages) -> dict:
+        started = time.perf_counter()
+        collection = Products._get_collection()
+        oids = {pid: ObjectId(pid) for pid in batch}
+
+        # Estado anterior de todos os produtos do lote numa única consulta
+        # (também descarta ids que não existem).
+        before = {
+            str(doc["_id"]): ((doc.get("usageData") or {}).get("operationalData") or {})
+            for doc in collection.find({"_id": {"$in": list(oids.values())}}, {OPERATIONAL_PATH: 1})
+        }
+        ops, op_pids = [], []
+        for pid, entry in batch.items():
+            if pid not in before:
+                continue
+            set_doc = operational_set_doc(entry["delta"])
+            if not set_doc:
+                continue
+            ops.append(UpdateOne({"_id": oids[pid]}, {"$set": set_doc}))
+            op_pids.append(pid)
+        if ops:
+            self._bulk_write(collection, ops, op_pids, oids)
+        self._failures = 0
+        self._retry_at = 0.0
+
+        unknown = [pid for pid in batch if pid not in before]
+        for pid in unknown:
+            logger.warning("Produto %s não encontrado, descartando %d mensagem(ns)", pid, batch[pid]["messages"])
+
+        # Daqui em diante o estado já foi gravado: falhas não devolvem o lote
+        # (o histórico e a auditoria sairiam duplicados no próximo flush).
+        try:
+            # Histórico: cada mensagem vira um ponto (o merge é só para o estado atual)
+            record_telemetry_many(
+                (pid, delta, received_at)
+                for pid in op_pids
+                for received_at, delta in batch[pid]["points"]
+            )
+            for pid in op_pids:
+                invalidate_passport(pid)
+            if ops and self.audit:
+                self._write_audits(batch, op_pids, before)
+        except Exception:
+            self.stats["errors"] += 1
+            logger.exception("Falha no histórico/auditoria do lote de operationalData (estado já gravado)")
+
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self._record(messages, len(batch), len(unknown), elapsed_ms)
+        logger.info(
+            "Batch operationalData: %d mensagens, %d produtos, %.1f ms",
+            messages, len(batch), elapsed_ms,
+        )
+        return {"messages": messages, "products": len(batch), "ms": elapsed_ms}
+
+    def _bulk_write(self, collection, ops, op_pids, oids):
+        try:
+            collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as exc:
+            retry, retry_pids = [], []
+            for err in exc.details.get("writeErrors", []):
+                idx = err.get("index")
+                if err.get("code") == PATH_NOT_VIABLE:
+                    ensure_operational_container(collection, oids[op_pids[idx]])
+                    retry.append(ops[idx])
+                    retry_pids.append(op_pids[idx])
+                else:
+                    self._write_error(op_pids[idx], err)
+            if retry:
+                try:
+                    collection.bulk_write(retry, ordered=False)
+                except BulkWriteError as retry_exc:
+                    # não propaga: o flush ainda grava auditorias e estatísticas do lote
+                    for err in retry_exc.details.get("writeErrors", []):
+                        self._write_error(retry_pids[err.get("index")], err)
+
+    def _write_error(self, pid, err):
+        self.stats["errors"] += 1
+        logger.error("Erro no bulk_write do produto %s: %s", pid, err.get("errmsg"))
+
+    def _write_audits(self, batch, op_pids, before):
+        """Auditoria do lote conforme OPERATIONAL_AUDIT_MODE (ver apps.tracking.utils)."""
+        mode = operational_audit_mode()
+        audits = []
+        for pid in op_pids:
+            entry = batch[pid]
+            previous_ops = before[pid]
+            new_ops = {**previous_ops, **clean_operational_delta(entry["delta"])}
+            if new_ops == previous_ops:
+                continue
+            notes = (
+                f"Atualização de dados operacionais via MQTT (lote de {entry['messages']} mensagem(ns))"
+                f" | topic={','.join(sorted(entry['topics']))}"
+            )
+            if mode == "bucket":
+                upsert_operational_bucket(
+                    product_id=pid,
+                    previous_ops=previous_ops,
+                    new_ops=new_ops,
+                    source="broker",
+                    source_channel="mqtt_backend_batch",
+                    notes=notes,
+                )
+                continue
+            audit = build_operational_audit(
+                product_id=pid,
+                previous_ops=previous_ops,
+                new_ops=new_ops,
+                source="broker",
+                source_channel="mqtt_backend_batch",
+                notes=notes,
+                mode=mode,
+            )
+            if audit is not None:
+                audits.append(audit)
+        if audits:
+            ProductAudit.objects.insert(audits, load_bulk=False)
+
+    def _record(self, messages, products, unknown, elapsed_ms):
+        s = self.stats
+        s["flushes"] += 1
+        s["messages"] += messages
+        s["products"] += products
+        s["unknownProducts"] += unknown
+        s["lastFlushMessages"] = messages
+        s["lastFlushProducts"] = products
+        s["lastFlushMs"] = round(elapsed_ms, 2)
+        s["maxFlushMs"] = round(max(s["maxFlushMs"], elapsed_ms), 2)
+        s["totalFlushMs"] += elapsed_ms
+
+    def snapshot_stats(self) -> dict:
+        s = dict(self.stats)
+        s["pending"] = self.pending()
+        s["avgFlushMs"] = round(s["totalFlushMs"] / s["flushes"], 2) if s["flushes"] else 0.0
+        s["avgFlushMessages"] = round(s["messages"] / s["flushes"], 2) if s["flushes"] else 0.0
+        return s
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_batch_writer() -> OperationalBatchWriter:
+    """Instância única (por processo) do batch writer, já iniciada."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = OperationalBatchWriter(
+                window_ms=int(getattr(settings, "MQTT_BATCH_WINDOW_MS", 250)),
+                max_messages=int(getattr(settings, "MQTT_BATCH_MAX_MESSAGES", 500)),
+                audit=bool(getattr(settings, "MQTT_BATCH_AUDIT", True)),
+            )
+            _writer.start()
+            atexit.register(_writer.stop)
+        return _writer
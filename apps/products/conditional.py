@@ -0,0 +1,97 @@
+# apps/products/conditional.py
+"""
+GET condicional (ETag / Last-Modified) dos produtos e dos arquivos do GridFS.
+
+- Documentos (retrieve, passaporte público): a versão é `updatedAt` (ou
+  `createdAt`) + um digest de usageData.operationalData, que é escrito direto
+  pelo MQTT sem mexer em updatedAt. Por isso esses endpoints só usam ETag:
+  um Last-Modified baseado em updatedAt responderia 304 com dados
+  operacionais velhos.
+- Arquivos: o GridFS não altera arquivos, um arquivo novo ganha outro _id.
+  ETag = md5 (quando o driver gravou) ou o _id; Last-Modified = uploadDate.
+"""
+import calendar
+import hashlib
+from typing import Iterable, List, Optional
+
+import bson
+from bson import ObjectId
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from apps.products.models import Products
+
+# Campos lidos para montar a versão (e checar permissão) sem trazer o documento
+VERSION_FIELDS = {
+    "updatedAt": 1,
+    "createdAt": 1,
+    "usageData.operationalData": 1,
+    "createdById": 1,
+    "ownerUserId": 1,
+    "childIds": 1,
+}
+
+
+def product_version(raw: dict) -> str:
+    """Versão de um documento cru lido com VERSION_FIELDS."""
+    stamp = raw.get("updatedAt") or raw.get("createdAt")
+    stamp = stamp.isoformat() if hasattr(stamp, "isoformat") else str(stamp or "")
+    operational = (raw.get("usageData") or {}).get("operationalData")
+    if not operational:
+        return stamp
+    digest = hashlib.sha1(bson.encode({"o": operational})).hexdigest()[:16]
+    return f"{stamp}:{digest}"
+
+
+def find_version(query: dict) -> Optional[dict]:
+    """Documento cru só com VERSION_FIELDS, ou None."""
+    return Products._get_collection().find_one(query, VERSION_FIELDS)
+
+
+def children_versions(child_ids: Iterable) -> List[str]:
+    """Versões dos filhos (o retrieve devolve childSummaries)."""
+    oids = [ObjectId(str(c)) for c in child_ids if ObjectId.is_valid(str(c))]
+    if not oids:
+        return []
+    cursor = Products._get_collection().find({"_id": {"$in": oids}}, {"updatedAt": 1, "createdAt": 1})
+    return sorted(f"{doc['_id']}@{product_version(doc)}" for doc in cursor)
+
+
+def make_etag(*parts, weak: bool = True) -> str:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32]
+    return f'W/"{digest}"' if weak else f'"{digest}"'
+
+
+def file_validators(grid_out):
+    """(etag, last_modified em segundos) de um GridOut (None, None se o arquivo sumiu)."""
+    if grid_out is None:
+        return None, None
+    md5 = getattr(grid_out, "md5", None)
+    etag = f'"{md5 or grid_out._id}"'
+    uploaded = getattr(grid_out, "upload_date", None)
+    last_modified = calendar.timegm(uploaded.utctimetuple()) if uploaded else None
+    return etag, last_modified
+
+
+def set_validators(response, *, etag=None, last_modified=None, cache_control="private, no-cache"):
+    """ETag / Last-Modified / Cache-Control na resposta (no-cache = sempre revalida)."""
+    if etag:
+        response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    if cache_control:
+        response["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified(request, *, etag=None, last_modified=None, cache_control="private, no-cache"):
+    """
+    304 (ou 412 em If-Match/If-Unmodified-Since) quando as precondições da
+    requisição batem com os validadores; None quando é preciso responder o corpo.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    headers = set_validators(HttpResponse(), etag=etag, last_modified=last_modified, cache_control=cache_control)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified, response=headers)
+    return None if response is headers else response
@@ -0,0 +1,227 @@
+# apps/products/consumer_pool.py
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "spill")
+
+
+class _Shard:
+    def __init__(self, index: int, queue_size: int, spill_path: str | None):
+        self.index = index
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.spill_path = spill_path
+        self.spill_lock = threading.Lock()
+        self.spilled_pending = 0
+        self.thread = None
+
+
+class ShardedConsumerPool:
+    """
+    Fila limitada + N threads consumidoras, com sharding por chave (id do produto).
+
+    - Mensagens com a mesma chave sempre caem no mesmo shard/thread, então
+      cada produto continua sendo aplicado na ordem de chegada.
+    - `policy` define o que fazer com a fila cheia:
+        "block"       -> quem submete espera (comportamento clássico)
+        "drop_oldest" -> descarta a mensagem mais antiga do shard
+        "spill"       -> grava em disco (JSONL por shard) e reprocessa depois,
+                         sem perder a ordem; os itens precisam ser serializáveis em JSON
+    """
+
+    def __init__(
+        self,
+        handler,
+        *,
+        workers: int = 4,
+        queue_size: int = 1000,
+        policy: str = "block",
+        spill_dir: str | None = None,
+        name: str = "consumer",
+    ):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Política de backpressure inválida: {policy} (use {', '.join(BACKPRESSURE_POLICIES)})")
+        if policy == "spill" and not spill_dir:
+            raise ValueError("A política 'spill' exige spill_dir")
+
+        self.handler = handler
+        self.policy = policy
+        self.name = name
+        self._stop = threading.Event()
+
+        if policy == "spill":
+            os.makedirs(spill_dir, exist_ok=True)
+        else:
+            spill_dir = None
+        self._shards = [
+            _Shard(
+                i,
+                max(queue_size, 1),
+                os.path.join(spill_dir, f"{name}-shard-{i}.jsonl") if spill_dir else None,
+            )
+            for i in range(max(workers, 1))
+        ]
+
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "processed": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "errors": 0,
+            "lastLagMs": 0.0,
+            "maxLagMs": 0.0,
+        }
+
+    # ---------------- ciclo de vida ----------------
+
+    def start(self):
+        for shard in self._shards:
+            if shard.thread and shard.thread.is_alive():
+                continue
+            # Reaproveita o que ficou em disco de uma execução anterior
+            if shard.spill_path and (
+                os.path.exists(shard.spill_path) or os.path.exists(f"{shard.spill_path}.draining")
+            ):
+                shard.spilled_pending = 1
+            shard.thread = threading.Thread(
+                target=self._run, args=(shard,), name=f"{self.name}-{shard.index}", daemon=True
+            )
+            shard.thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Para as threads depois de esvaziar as filas em memória."""
+        deadline = time.monotonic() + timeout
+        for shard in self._shards:
+            while not shard.queue.empty() and time.monotonic() < deadline:
+                time.sleep(0.05)
+        self._stop.set()
+        for shard in self._shards:
+            if shard.thread:
+                shard.thread.join(timeout=max(deadline - time.monotonic(), 0.1))
+
+    # ---------------- entrada ----------------
+
+    def shard_for(self, key: str) -> int:
+        return zlib.crc32(str(key).encode("utf-8")) % len(self._shards)
+
+    def submit(self, key: str, item) -> bool:
+        """Enfileira `item` no shard de `key`. Retorna False se algo foi descartado."""
+        shard = self._shards[self.shard_for(key)]
+        entry = (time.time(), item)
+        self._inc("submitted")
+
+        if self.policy == "block":
+            shard.queue.put(entry)
+            return True
+
+        if self.policy == "drop_oldest":
+            dropped = False
+            while True:
+                try:
+                    shard.queue.put_nowait(entry)
+                    return not dropped
+                except queue.Full:
+                    try:
+                        shard.queue.get_nowait()
+                        shard.queue.task_done()
+                        dropped = True
+                        self._inc("dropped")
+                    except queue.Empty:
+                        pass
+
+        # spill: depois que o shard começou a derramar, tudo vai para o disco
+        # até ser drenado, para não passar na frente de mensagens mais antigas.
+        with shard.spill_lock:
+            if not shard.spilled_pending:
+                try:
+                    shard.queue.put_nowait(entry)
+                    return True
+                except queue.Full:
+                    pass
+            with open(shard.spill_path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps({"enqueuedAt": entry[0], "item": item}) + "\n")
+            shard.spilled_pending += 1
+        self._inc("spilled")
+        return True
+
+    # ---------------- consumo ----------------
+
+    def _run(self, shard: _Shard):
+        while True:
+            try:
+                enqueued_at, item = shard.queue.get(timeout=0.25)
+            except queue.Empty:
+                if shard.spilled_pending:
+                    self._drain_spill(shard)
+                    continue
+                if self._stop.is_set():
+                    return
+                continue
+            try:
+                self._process(enqueued_at, item)
+            finally:
+                shard.queue.task_done()
+
+    def _drain_spill(self, shard: _Shard):
+        draining = f"{shard.spill_path}.draining"
+        # Sobra de uma queda anterior é mais antiga que o spill atual: vem primeiro
+        if os.path.exists(draining):
+            self._replay_file(draining)
+        with shard.spill_lock:
+            shard.spilled_pending = 0
+            if not os.path.exists(shard.spill_path):
+                return
+            os.replace(shard.spill_path, draining)
+        self._replay_file(draining)
+
+    def _replay_file(self, path: str):
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.error("Linha inválida no spill %s, ignorando", path)
+                    continue
+                self._process(record.get("enqueuedAt") or time.time(), record.get("item"))
+        os.remove(path)
+
+    def _process(self, enqueued_at: float, item):
+        lag_ms = (time.time() - enqueued_at) * 1000.0
+        try:
+            self.handler(item)
+        except Exception:
+            self._inc("errors")
+            logger.exception("Erro processando item no pool %s", self.name)
+        with self._stats_lock:
+            self.stats["processed"] += 1
+            self.stats["lastLagMs"] = round(lag_ms, 2)
+            self.stats["maxLagMs"] = round(max(self.stats["maxLagMs"], lag_ms), 2)
+
+    # ---------------- métricas ----------------
+
+    def _inc(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def depth(self) -> int:
+        return sum(shard.queue.qsize() for shard in self._shards)
+
+    def snapshot_stats(self) -> dict:
+        with self._stats_lock:
+            s = dict(self.stats)
+        s["workers"] = len(self._shards)
+        s["policy"] = self.policy
+        s["depth"] = self.depth()
+        s["depthByShard"] = [shard.queue.qsize() for shard in self._shards]
+        s["spillPending"] = sum(shard.spilled_pending for shard in self._shards)
+        return s
@@ -0,0 +1,230 @@
+# apps/products/fast_serializers.py
+"""
+Leitura rápida de produtos: dicts crus do pymongo -> mesmo JSON do ProductsSerializer.
+
+O caminho padrão hidrata o documento no mongoengine e passa por ~25
+serializers DRF aninhados. Aqui o "plano" de conversão é montado uma vez a
+partir dos próprios ProductsSerializer/Products (campos, defaults do model,
+allow_null/required do serializer), e cada documento é convertido numa
+única passada. Mudou o serializer ou o model, o plano acompanha.
+
+Paridade com o DRF: apps/products/tests.py; tempos: `manage.py bench_serialization`.
+"""
+import json
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import serializers
+from rest_framework.fields import empty
+
+from apps.products.models import Products
+from apps.products.serializers import ProductsSerializer
+
+try:
+    import orjson
+except ImportError:  # dependência opcional
+    orjson = None
+
+_MISSING = object()
+
+_plan = None
+_plan_lock = threading.Lock()
+
+
+def fast_serialization_enabled() -> bool:
+    return bool(getattr(settings, "PRODUCTS_FAST_SERIALIZATION", True))
+
+
+# ---------------- montagem do plano ----------------
+
+def _missing_value(field: serializers.Field, model_field, empty_doc):
+    """
+    O que o DRF devolveria para a chave ausente no documento. Para campos do
+    model, vale o que o mongoengine põe num documento vazio (ex: ListField
+    com null=True fica None, sem null=True fica []).
+    """
+    if model_field is not None:
+        value = getattr(empty_doc, model_field.name, None)
+        if value is not None and callable(model_field.default):
+            return ("call", model_field.default)  # ex: datas com default "agora"
+        return ("value", value)
+    # Atributo inexistente no documento (Field.get_attribute -> AttributeError)
+    if field.default is not empty:
+        return ("call", field.get_default)
+    if field.allow_null:
+        return ("value", None)
+    return ("skip", None)
+
+
+def _null_value(model_field):
+    """
+    Valor explícito None: o mongoengine troca pelo default quando o campo não
+    é null=True (ex: uploadedAt, isActive, childIds).
+    """
+    if model_field is None or model_field.null or model_field.default is None:
+        return None
+    default = model_field.default
+    return ("call", default) if callable(default) else ("value", default)
+
+
+def _scalar(field: serializers.Field, model_field):
+    """Conversor de um valor não nulo (já no formato do Mongo)."""
+    if isinstance(field, serializers.DateTimeField):
+        return field.to_representation
+    if isinstance(field, serializers.DateField):
+        def date_repr(value, _repr=field.to_representation):
+            if isinstance(value, datetime):
+                value = value.date()  # mongoengine DateField devolve date
+            return _repr(value)
+        return date_repr
+    if isinstance(field, (serializers.ChoiceField, serializers.BooleanField)):
+        return field.to_representation
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, serializers.FloatField):
+        return float
+    if isinstance(field, serializers.CharField):
+        return str
+    if isinstance(field, serializers.ListField):
+        child = _scalar(field.child, None)
+        return lambda value: [child(v) if v is not None else None for v in value]
+    if isinstance(field, serializers.DictField):
+        return lambda value: {str(k): v for k, v in value.items()}
+    return field.to_representation
+
+
+def _compile(serializer: serializers.Serializer, doc_cls) -> List[tuple]:
+    """
+    Lista de (nome, tipo, missing, null, conversor) na ordem dos campos do serializer.
+    tipo: "nested" | "many" | "scalar" | "id" | "oid".
+    """
+    plan = []
+    model_fields = getattr(doc_cls, "_fields", {}) if doc_cls else {}
+    empty_doc = doc_cls._from_son({}) if doc_cls else None
+    for name, field in serializer.fields.items():
+        if name == "id" and doc_cls is Products:
+            plan.append((name, "id", None, None, None))
+            continue
+        if name == "_id" and isinstance(field, serializers.SerializerMethodField):
+            plan.append((name, "oid", None, None, None))
+            continue
+
+        model_field = model_fields.get(name)
+        missing = _missing_value(field, model_field, empty_doc)
+        null = _null_value(model_field)
+
+        if isinstance(field, serializers.ListSerializer):
+            child_cls = getattr(getattr(model_field, "field", None), "document_type", None)
+            plan.append((name, "many", missing, null, _compile(field.child, child_cls)))
+        elif isinstance(field, serializers.Serializer):
+            child_cls = getattr(model_field, "document_type", None)
+            plan.append((name, "nested", missing, null, _compile(field, child_cls)))
+        else:
+            plan.append((name, "scalar", missing, null, _scalar(field, model_field)))
+    return plan
+
+
+def get_plan():
+    global _plan
+    if _plan is None:
+        with _plan_lock:
+            if _plan is None:
+                _plan = _compile(ProductsSerializer(), Products)
+    return _plan
+
+
+# ---------------- conversão ----------------
+
+def _convert(plan, raw: dict) -> Dict[str, Any]:
+    out = {}
+    for name, kind, missing, null, conv in plan:
+        if kind == "id":
+            out[name] = str(raw["_id"])
+            continue
+        if kind == "oid":
+            out[name] = {"$oid": str(raw["_id"])}
+            continue
+
+        value = raw.get(name, _MISSING)
+        if value is _MISSING:
+            how, default = missing
+            if how == "skip":
+                continue
+            value = default() if how == "call" else default
+        elif value is None and null is not None:
+            how, default = null
+            value = default() if how == "call" else default
+
+        if value is None:
+            out[name] = None
+        elif kind == "scalar":
+            out[name] = conv(value)
+        elif kind == "nested":
+            out[name] = _convert(conv, value)
+        else:
+            out[name] = [_convert(conv, item) for item in value]
+    return out
+
+
+def serialize_product(raw: dict) -> Dict[str, Any]:
+    """Documento cru do Mongo -> mesmo dict de `ProductsSerializer(product).data`."""
+    return _convert(get_plan(), raw)
+
+
+def serialize_products(raws: Iterable[dict]) -> List[Dict[str, Any]]:
+    plan = get_plan()
+    return [_convert(plan, raw) for raw in raws]
+
+
+# ---------------- helpers das views ----------------
+
+def raw_product(raw: dict) -> SimpleNamespace:
+    """
+    Objeto mínimo com os atributos que as views consultam (permissões, URLs
+    de arquivos, filhos), sem hidratar o documento. `imageFile`/`manualFile`
+    trazem só o `filename`: o do produto (`imageFileName`/`manualFileName`)
+    ou, em produtos antigos, o do GridFS, lido numa única consulta.
+    """
+    files = {}
+    file_ids = [raw[k] for k in ("imageFile", "manualFile") if raw.get(k) and not raw.get(k + "Name")]
+    if file_ids:
+        fs_files = Products._get_db()[Products._fields["imageFile"].collection_name + ".files"]
+        files = {f["_id"]: f for f in fs_files.find({"_id": {"$in": file_ids}}, {"filename": 1})}
+
+    def file_ref(key):
+        grid_id = raw.get(key)
+        if not grid_id:
+            return None
+        filename = raw.get(key + "Name") or (files.get(grid_id) or {}).get("filename")
+        return SimpleNamespace(grid_id=grid_id, filename=filename)
+
+    return SimpleNamespace(
+        id=raw["_id"],
+        createdById=raw.get("createdById"),
+        ownerUserId=raw.get("ownerUserId"),
+        companyUserId=raw.get("companyUserId"),
+        parentId=raw.get("parentId"),
+        childIds=raw.get("childIds") or [],
+        imageFile=file_ref("imageFile"),
+        manualFile=file_ref("manualFile"),
+    )
+
+
+def dumps(data) -> str:
+    """
+    json.dumps(data, cls=DjangoJSONEncoder), via orjson quando instalado.
+
+    Datas/horas passam pelo DjangoJSONEncoder também no orjson, para o texto
+    sair igual ao do caminho antigo.
+    """
+    if orjson is None:
+        return json.dumps(data, cls=DjangoJSONEncoder)
+    return orjson.dumps(
+        data,
+        default=DjangoJSONEncoder().default,
+        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+    ).decode("utf-8")
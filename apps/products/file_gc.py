@@ -0,0 +1,218 @@
+# apps/products/file_gc.py
+"""
+Coleta de arquivos órfãos do GridFS (`manage.py gc_files`).
+
+As referências saem da coleção products (manualFile, imageFile e os `file`
+dos anexos de manutenção/reparo) por uma agregação que devolve
+`(grid_id, nº de referências)` ordenado por _id, com allowDiskUse: a
+memória do lado do Python não cresce com o tamanho da base. fs.files é
+lido também ordenado por _id e as duas listas são cruzadas num merge.
+
+- Órfão = arquivo sem referência, enviado há mais de `grace_seconds` (o
+  upload acontece antes do `save()` do produto). Arquivo deduplicado que
+  ganhou referência há menos que isso (metadata.lastRefAt, gravado por
+  apps.products.file_store.store) também fica: o produto ainda vai ser
+  salvo. A remoção confere lastRefAt de novo no próprio delete.
+- Derivadas de imagem (metadata.derivativeOf) não são referenciadas pelos
+  produtos: saem quando a original não existe mais.
+- Chunks sem documento em fs.files (upload interrompido, apagamento pela
+  metade) também são removidos, mas só os de files_id gerado antes do
+  período de carência: o GridFS grava os chunks antes do documento.
+- Com `fix_refcounts`, metadata.refCount dos arquivos deduplicados
+  (apps.products.file_store) é corrigido para o número real de referências.
+
+A remoção é em lotes de `batch_size`, com pausa de `sleep` segundos entre
+eles para não disputar I/O com a aplicação. Só entram _ids ObjectId (os que
+o GridFS gera); no dry-run as derivadas de originais órfãs não aparecem,
+porque as originais ainda existem.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from apps.products.models import Products
+
+
+def reference_pipeline() -> list:
+    """
+    `<lista>.attachments.file` vira uma lista de listas (uma por item), então
+    tudo é montado como lista de listas e desenrolado duas vezes.
+    """
+    def nested(path):
+        return {"$ifNull": [f"${path}.attachments.file", []]}
+
+    return [
+        {"$project": {"_id": 0, "ids": {"$concatArrays": [
+            [["$manualFile", "$imageFile"]],
+            nested("usageData.maintenanceHistory"),
+            nested("usageData.repairHistory"),
+        ]}}},
+        {"$unwind": "$ids"},
+        {"$unwind": "$ids"},
+        {"$match": {"ids": {"$type": "objectId"}}},
+        {"$group": {"_id": "$ids", "refs": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+def iter_references() -> Iterator[Tuple[ObjectId, int]]:
+    """(grid_id, referências) de todos os produtos, em ordem de _id."""
+    cursor = Products._get_collection().aggregate(reference_pipeline(), allowDiskUse=True, batchSize=1000)
+    for doc in cursor:
+        yield doc["_id"], doc["refs"]
+
+
+def merge_references(files: Iterator[dict], refs: Iterator[Tuple[ObjectId, int]]):
+    """Cruza fs.files e referências (ambos por _id) e devolve (arquivo, referências)."""
+    pending = next(refs, None)
+    for doc in files:
+        while pending is not None and pending[0] < doc["_id"]:
+            pending = next(refs, None)  # referência a arquivo que não existe
+        if pending is not None and pending[0] == doc["_id"]:
+            yield doc, pending[1]
+            pending = next(refs, None)
+        else:
+            yield doc, 0
+
+
+class _Batch:
+    def __init__(self, db, bucket: str, size: int, sleep: float, dry_run: bool, stats: dict, cutoff: datetime):
+        self.files = db[f"{bucket}.files"]
+        self.chunks = db[f"{bucket}.chunks"]
+        self.cutoff = cutoff
+        self.size = max(1, size)
+        self.sleep = sleep
+        self.dry_run = dry_run
+        self.stats = stats
+        self.ids = []
+
+    def add(self, grid_id) -> None:
+        self.ids.append(grid_id)
+        if len(self.ids) >= self.size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.ids:
+            return
+        ids, self.ids = self.ids, []
+        self.stats["batches"] += 1
+        if self.dry_run:
+            return
+        # não apaga o que ganhou referência (store) depois da varredura
+        self.files.delete_many({"_id": {"$in": ids}, "metadata.lastRefAt": {"$not": {"$gt": self.cutoff}}})
+        kept = {d["_id"] for d in self.files.find({"_id": {"$in": ids}}, {"_id": 1})}
+        if kept:
+            self.stats["recent_skipped"] += len(kept)
+            ids = [i for i in ids if i not in kept]
+        if ids:
+            self.stats["chunks_deleted"] += self.chunks.delete_many({"files_id": {"$in": ids}}).deleted_count
+        if self.sleep:
+            time.sleep(self.sleep)
+
+
+def collect_garbage(
+    *,
+    bucket: str = "fs",
+    dry_run: bool = True,
+    batch_size: int = 500,
+    sleep: float = 0.0,
+    grace_seconds: int = 3600,
+    fix_refcounts: bool = False,
+    log: Optional[Callable[[str], None]] = None,
+) -> dict:
+    db = Products._get_db()
+    files = db[f"{bucket}.files"]
+    chunks = db[f"{bucket}.chunks"]
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    stats = {
+        "files": 0, "referenced": 0, "orphans": 0, "orphan_bytes": 0, "recent_skipped": 0,
+        "derivatives": 0, "orphan_derivatives": 0, "orphan_chunk_files": 0,
+        "refcounts_fixed": 0, "batches": 0, "chunks_deleted": 0,
+    }
+    log = log or (lambda msg: None)
+    batch = _Batch(db, bucket, batch_size, sleep, dry_run, stats, cutoff)
+
+    # 1) arquivos sem referência (derivadas ficam para o passo 2)
+    cursor = files.find(
+        {"_id": {"$type": "objectId"}},
+        {"_id": 1, "length": 1, "uploadDate": 1, "metadata.derivativeOf": 1, "metadata.refCount": 1,
+         "metadata.lastRefAt": 1},
+        batch_size=1000,
+    ).sort("_id", 1)
+    refcount_ops = []
+    for doc, refs in merge_references(cursor, iter_references()):
+        stats["files"] += 1
+        metadata = doc.get("metadata") or {}
+        if metadata.get("derivativeOf") is not None:
+            stats["derivatives"] += 1
+            continue
+        if refs:
+            stats["referenced"] += 1
+            if fix_refcounts and "refCount" in metadata and metadata["refCount"] != refs:
+                refcount_ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"metadata.refCount": refs}}))
+            continue
+        touched = [d.replace(tzinfo=None) for d in (doc.get("uploadDate"), metadata.get("lastRefAt")) if d]
+        if any(d > cutoff for d in touched):
+            stats["recent_skipped"] += 1
+            continue
+        stats["orphans"] += 1
+        stats["orphan_bytes"] += doc.get("length") or 0
+        batch.add(doc["_id"])
+    batch.flush()
+    log(f"arquivos: {stats['files']}, referenciados: {stats['referenced']}, órfãos: {stats['orphans']} "
+        f"({stats['orphan_bytes'] / 1024 / 1024:.1f} MB), recentes ignorados: {stats['recent_skipped']}")
+
+    if refcount_ops:
+        stats["refcounts_fixed"] = len(refcount_ops)
+        if not dry_run:
+            files.bulk_write(refcount_ops, ordered=False)
+
+    # 2) derivadas cuja original saiu (consulta em lotes das originais)
+    def check_derivatives(group):
+        sources = {d["metadata"]["derivativeOf"] for d in group}
+        alive = {d["_id"] for d in files.find({"_id": {"$in": list(sources)}}, {"_id": 1})}
+        for d in group:
+            if d["metadata"]["derivativeOf"] not in alive:
+                stats["orphan_derivatives"] += 1
+                stats["orphan_bytes"] += d.get("length") or 0
+                batch.add(d["_id"])
+
+    group = []
+    for doc in files.find({"metadata.derivativeOf": {"$exists": True}},
+                          {"_id": 1, "length": 1, "metadata.derivativeOf": 1}, batch_size=1000):
+        group.append(doc)
+        if len(group) >= 500:
+            check_derivatives(group)
+            group = []
+    if group:
+        check_derivatives(group)
+    batch.flush()
+    log(f"derivadas: {stats['derivatives']}, órfãs: {stats['orphan_derivatives']}")
+
+    # 3) chunks sem arquivo (files_id gerado antes do cutoff: upload em andamento fica)
+    chunk_ids = chunks.aggregate(
+        [
+            {"$match": {"files_id": {"$type": "objectId", "$lt": ObjectId.from_datetime(cutoff)}}},
+            {"$group": {"_id": "$files_id"}},
+            {"$sort": {"_id": 1}},
+        ],
+        allowDiskUse=True, batchSize=1000,
+    )
+    file_ids = (
+        d["_id"] for d in files.find({"_id": {"$type": "objectId"}}, {"_id": 1}, batch_size=1000).sort("_id", 1)
+    )
+    current = next(file_ids, None)
+    for doc in chunk_ids:
+        files_id = doc["_id"]
+        while current is not None and current < files_id:
+            current = next(file_ids, None)
+        if current == files_id:
+            continue
+        stats["orphan_chunk_files"] += 1
+        if not dry_run:
+            stats["chunks_deleted"] += chunks.delete_many({"files_id": files_id}).deleted_count
+    log(f"chunks sem arquivo: {stats['orphan_chunk_files']} arquivo(s)")
+    return stats
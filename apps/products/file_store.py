@@ -0,0 +1,135 @@
+# apps/products/file_store.py
+"""
+Uploads no GridFS com deduplicação por conteúdo (sha256) e contagem de referências.
+
+O mesmo manual/anexo enviado para várias unidades de um modelo vira um
+único arquivo no GridFS:
+
+- `store` calcula o sha256 lendo o upload em blocos (o arquivo já está na
+  memória/disco temporário do Django, então reler com `seek` é barato) e, se
+  já existe um arquivo com o mesmo hash e tamanho, só incrementa
+  `metadata.refCount`, sem gravar nada no GridFS; senão grava com
+  `metadata = {"sha256": ..., "refCount": 1}`.
+- O arquivo compartilhado não guarda nome nem tipo de quem enviou primeiro:
+  isso é de cada referência (`Products.manualFileName`/`imageFileName`...,
+  `UsageAttachment.filename`), senão um dono veria o nome dado por outro.
+- `release` decrementa e só apaga o arquivo quando a última referência sai.
+  Arquivos antigos (sem refCount) caem em -1 e são apagados como antes.
+
+As operações sobre refCount são atômicas no documento de fs.files: um
+arquivo com refCount <= 0 não é mais reaproveitado por `store`.
+"""
+import hashlib
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from mongoengine.connection import get_db
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK = 1024 * 1024
+
+
+def dedup_enabled() -> bool:
+    return bool(getattr(settings, "FILE_DEDUP_ENABLED", True))
+
+
+def _files(proxy):
+    return get_db(proxy.db_alias)[proxy.collection_name + ".files"]
+
+
+def ensure_blob_index(db_alias: str = "default", collection_name: str = "fs") -> None:
+    get_db(db_alias)[collection_name + ".files"].create_index(
+        [("metadata.sha256", 1), ("length", 1)], sparse=True
+    )
+
+
+def _iter_blocks(file_obj):
+    if hasattr(file_obj, "chunks"):
+        yield from file_obj.chunks(HASH_BLOCK)
+        return
+    while True:
+        block = file_obj.read(HASH_BLOCK)
+        if not block:
+            return
+        yield block
+
+
+def content_hash(file_obj):
+    """(sha256 hex, tamanho) do conteúdo; o arquivo volta para o início."""
+    digest = hashlib.sha256()
+    size = 0
+    file_obj.seek(0)
+    for block in _iter_blocks(file_obj):
+        digest.update(block)
+        size += len(block)
+    file_obj.seek(0)
+    return digest.hexdigest(), size
+
+
+def _point_to(proxy, grid_id) -> None:
+    proxy.grid_id = grid_id
+    proxy.gridout = None
+    proxy._mark_as_changed()
+
+
+def store(proxy, file_obj, *, content_type=None, filename=None):
+    """
+    Grava `file_obj` no campo FileField representado por `proxy` (GridFSProxy
+    vazio, ex: `product.manualFile`), reaproveitando um arquivo idêntico.
+    Devolve o grid_id. Com a deduplicação ligada, `filename` não vai para o
+    GridFS: quem chama guarda o nome na própria referência.
+    """
+    if not dedup_enabled():
+        proxy.put(file_obj, content_type=content_type, filename=filename)
+        return proxy.grid_id
+
+    sha256, size = content_hash(file_obj)
+    existing = _files(proxy).find_one_and_update(
+        {"metadata.sha256": sha256, "length": size, "metadata.refCount": {"$gte": 1}},
+        # lastRefAt: o gc_files não apaga o arquivo antes do save() do produto
+        {"$inc": {"metadata.refCount": 1}, "$set": {"metadata.lastRefAt": datetime.utcnow()}},
+        projection={"_id": 1},
+    )
+    if existing:
+        _point_to(proxy, existing["_id"])
+        return existing["_id"]
+
+    grid_id = proxy.fs.put(file_obj, content_type=content_type, metadata={"sha256": sha256, "refCount": 1})
+    _point_to(proxy, grid_id)
+    return grid_id
+
+
+def release(proxy) -> bool:
+    """
+    Solta a referência de `proxy` ao arquivo (substitui `proxy.delete()`).
+    Devolve True se o arquivo foi apagado (era a última referência).
+    """
+    grid_id = proxy.grid_id
+    if grid_id is None:
+        return False
+    files = _files(proxy)
+    after = files.find_one_and_update(
+        {"_id": grid_id},
+        {"$inc": {"metadata.refCount": -1}},
+        projection={"metadata.refCount": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    deleted = False
+    if after is None:
+        logger.warning("Arquivo %s já não existe no GridFS", grid_id)
+    elif ((after.get("metadata") or {}).get("refCount") or 0) <= 0:
+        # só apaga se ninguém reaproveitou nesse meio tempo
+        if files.delete_one({"_id": grid_id, "metadata.refCount": {"$lte": 0}}).deleted_count:
+            get_db(proxy.db_alias)[proxy.collection_name + ".chunks"].delete_many({"files_id": grid_id})
+            deleted = True
+    _point_to(proxy, None)
+    return deleted
+
+
+def replace(proxy, file_obj, *, content_type=None, filename=None):
+    """`proxy.replace(...)` com contagem de referências."""
+    release(proxy)
+    return store(proxy, file_obj, content_type=content_type, filename=filename)
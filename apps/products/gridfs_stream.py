@@ -0,0 +1,159 @@
+# apps/products/gridfs_stream.py
+"""
+Download de arquivos do GridFS (manual, imagem, anexos de uso).
+
+- Content-Length e Accept-Ranges sempre; `Range: bytes=...` (um intervalo)
+  responde 206 com Content-Range, intervalo inválido responde 416.
+- Leitura alinhada aos chunks do GridFS (`GridOut.readchunk`): cada bloco
+  enviado é um documento de fs.chunks, sem remontar pedaços.
+- ETag / Last-Modified / If-Range via apps.products.conditional.
+- GRIDFS_ACCEL_REDIRECT: o arquivo é copiado uma vez para
+  GRIDFS_ACCEL_ROOT (arquivos do GridFS não mudam, a cópia vale para sempre)
+  e o nginx serve pelo `X-Accel-Redirect` (ver nginx/web-project-django.conf),
+  inclusive os Ranges. O Django só faz autenticação/permissão.
+"""
+import os
+import re
+import uuid
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+
+from apps.products.conditional import file_validators, not_modified, set_validators
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], length: int):
+    """
+    (início, fim) inclusivos de um `Range: bytes=...` com um único intervalo.
+    None = sem Range utilizável (responde o arquivo inteiro, como permite a RFC
+    para múltiplos intervalos); "invalid" = intervalo fora do arquivo (416).
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # sufixo: últimos N bytes
+        suffix = int(last)
+        if suffix == 0:
+            return "invalid"
+        return max(0, length - suffix), length - 1
+    start = int(first)
+    end = int(last) if last else length - 1
+    if start >= length or end < start:
+        return "invalid"
+    return start, min(end, length - 1)
+
+
+def _if_range_ok(request, etag: Optional[str], last_modified: Optional[int]) -> bool:
+    """If-Range: só aplica o Range se o validador ainda é o atual."""
+    value = request.META.get("HTTP_IF_RANGE")
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith("W/"):
+        return bool(etag) and value == etag and not value.startswith("W/")
+    return last_modified is not None and value == http_date(last_modified)
+
+
+def iter_gridfs(grid_out, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Bytes [start, end] do arquivo, um chunk do GridFS por vez."""
+    end = grid_out.length - 1 if end is None else end
+    remaining = end - start + 1
+    if remaining <= 0:
+        return
+    grid_out.seek(start)
+    while remaining > 0:
+        data = grid_out.readchunk()
+        if not data:
+            break
+        if len(data) > remaining:
+            data = data[:remaining]
+        remaining -= len(data)
+        yield data
+
+
+def accel_enabled() -> bool:
+    return bool(getattr(settings, "GRIDFS_ACCEL_REDIRECT", False))
+
+
+def _accel_relpath(grid_out) -> str:
+    grid_id = str(grid_out._id)
+    return f"{grid_id[-2:]}/{grid_id}"
+
+
+def materialize(grid_out) -> str:
+    """Copia o arquivo para GRIDFS_ACCEL_ROOT (uma vez) e devolve o caminho relativo."""
+    root = settings.GRIDFS_ACCEL_ROOT
+    relpath = _accel_relpath(grid_out)
+    path = os.path.join(root, relpath)
+    if os.path.exists(path):
+        return relpath
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp, "wb") as fh:
+            for block in iter_gridfs(grid_out):
+                fh.write(block)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return relpath
+
+
+def _content_disposition(filename: str, disposition: str) -> str:
+    return f'{disposition}; filename="{filename}"'
+
+
+def gridfs_response(request, grid_out, *, content_type: Optional[str], filename: str,
+                    disposition: str = "inline"):
+    """Resposta HTTP para um GridOut (304 / 206 / 416 / 200, ou X-Accel-Redirect)."""
+    if grid_out is None:
+        return HttpResponse(status=404)
+
+    etag, last_modified = file_validators(grid_out)
+    response = not_modified(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    content_type = content_type or "application/octet-stream"
+
+    if accel_enabled():
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.GRIDFS_ACCEL_PREFIX.rstrip("/") + "/" + materialize(grid_out)
+        response["Content-Disposition"] = _content_disposition(filename, disposition)
+        return set_validators(response, etag=etag, last_modified=last_modified)
+
+    length = int(grid_out.length)
+    byte_range = None
+    if _if_range_ok(request, etag, last_modified):
+        byte_range = parse_range(request.META.get("HTTP_RANGE"), length)
+
+    if byte_range == "invalid":
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{length}"
+        return response
+
+    head = request.method == "HEAD"
+    if byte_range:
+        start, end = byte_range
+        body = iter(()) if head else iter_gridfs(grid_out, start, end)
+        response = StreamingHttpResponse(body, status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{length}"
+        response["Content-Length"] = str(end - start + 1)
+    else:
+        body = iter(()) if head else iter_gridfs(grid_out)
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response["Content-Length"] = str(length)
+
+    response["Accept-Ranges"] = "bytes"
+    response["Content-Disposition"] = _content_disposition(filename, disposition)
+    return set_validators(response, etag=etag, last_modified=last_modified)
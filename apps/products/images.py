@@ -0,0 +1,214 @@
+# apps/products/images.py
+"""
+Derivadas da imagem principal do produto (miniatura, média, WebP).
+
+Ficam no mesmo bucket GridFS da original, com
+`metadata = {"derivativeOf": <id da original>, "variant": "thumb.webp"}`.
+Como o GridFS não altera arquivos (trocar a imagem gera outro _id), a
+derivada de um _id nunca fica velha: quando a imagem muda, as derivadas da
+antiga são apagadas e as da nova geradas no pool em segundo plano.
+
+Se a derivada ainda não existe (upload antigo, pool atrasado), ela é gerada
+na própria requisição, uma vez por variante (lock por chave).
+"""
+import io
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import gridfs
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from apps.products.models import Products
+
+logger = logging.getLogger(__name__)
+
+# nome -> caixa máxima (largura, altura); a proporção é mantida
+IMAGE_SIZES = {
+    "thumb": (320, 320),
+    "medium": (1024, 1024),
+}
+IMAGE_FORMATS = ("webp", "jpeg", "png")
+FORMAT_MIME = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+_executor = None
+_executor_lock = threading.Lock()
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+_lookup = OrderedDict()  # (id da original, variante) -> id da derivada
+_lookup_lock = threading.Lock()
+LOOKUP_MAX = 4096
+
+
+def derivatives_on_upload() -> bool:
+    return bool(getattr(settings, "IMAGE_DERIVATIVES_ON_UPLOAD", True))
+
+
+def _fs() -> gridfs.GridFS:
+    return gridfs.GridFS(Products._get_db(), Products._fields["imageFile"].collection_name)
+
+
+def _files():
+    return Products._get_db()[Products._fields["imageFile"].collection_name + ".files"]
+
+
+def ensure_derivative_index() -> None:
+    _files().create_index([("metadata.derivativeOf", 1), ("metadata.variant", 1)])
+
+
+def pick_format(requested: Optional[str], accept: str, source_content_type: Optional[str]) -> str:
+    """`type` pedido; sem ele, WebP se o cliente aceita, senão PNG (original PNG) ou JPEG."""
+    if requested:
+        return requested
+    if "image/webp" in (accept or ""):
+        return "webp"
+    return "png" if source_content_type == "image/png" else "jpeg"
+
+
+def render_derivative(source: bytes, size: str, fmt: str) -> bytes:
+    """Redimensiona `source` para a caixa de `size` e codifica em `fmt`."""
+    box = IMAGE_SIZES[size]
+    with Image.open(io.BytesIO(source)) as img:
+        # JPEG: decodifica já reduzido (escala 1/2, 1/4, 1/8), bem mais rápido
+        img.draft("RGB", box)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(box, Image.Resampling.LANCZOS)
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+
+        out = io.BytesIO()
+        if fmt == "jpeg":
+            img.convert("RGB").save(out, "JPEG", quality=85, optimize=True, progressive=True)
+        elif fmt == "png":
+            img.convert("RGBA" if has_alpha else "RGB").save(out, "PNG", optimize=True)
+        else:
+            img.convert("RGBA" if has_alpha else "RGB").save(out, "WEBP", quality=80, method=4)
+        return out.getvalue()
+
+
+def _remember(key, grid_id) -> None:
+    with _lookup_lock:
+        _lookup[key] = grid_id
+        _lookup.move_to_end(key)
+        while len(_lookup) > LOOKUP_MAX:
+            _lookup.popitem(last=False)
+
+
+def _find(source_id, variant: str):
+    key = (source_id, variant)
+    with _lookup_lock:
+        grid_id = _lookup.get(key)
+    if grid_id is not None:
+        return grid_id
+    doc = _files().find_one({"metadata.derivativeOf": source_id, "metadata.variant": variant}, {"_id": 1})
+    if doc:
+        _remember(key, doc["_id"])
+        return doc["_id"]
+    return None
+
+
+def _key_lock(key) -> threading.Lock:
+    with _key_locks_guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def get_or_create_derivative(source, size: str, fmt: str):
+    """
+    GridOut da derivada de `source` (GridOut da original), gerando se preciso.
+    Devolve None se a original não é uma imagem que o Pillow abre.
+    """
+    variant = f"{size}.{fmt}"
+    fs = _fs()
+    grid_id = _find(source._id, variant)
+    if grid_id is None:
+        key = (source._id, variant)
+        with _key_lock(key):
+            grid_id = _find(source._id, variant)
+            if grid_id is None:
+                try:
+                    source.seek(0)
+                    data = render_derivative(source.read(), size, fmt)
+                except (OSError, ValueError, Image.DecompressionBombError):
+                    logger.warning("Não foi possível gerar %s da imagem %s", variant, source._id, exc_info=True)
+                    return None
+                stem = (source.filename or "image").rsplit(".", 1)[0]
+                grid_id = fs.put(
+                    data,
+                    filename=f"{stem}-{size}.{fmt}",
+                    content_type=FORMAT_MIME[fmt],
+                    metadata={"derivativeOf": source._id, "variant": variant},
+                )
+                _remember(key, grid_id)
+        with _key_locks_guard:
+            _key_locks.pop(key, None)
+    try:
+        return fs.get(grid_id)
+    except gridfs.NoFile:
+        with _lookup_lock:
+            _lookup.pop((source._id, variant), None)
+        return None
+
+
+def delete_derivatives(source_id) -> int:
+    """
+    Apaga as derivadas de uma original que saiu do GridFS. Com a deduplicação
+    (apps.products.file_store) a mesma original pode servir outros produtos:
+    enquanto ela existir, as derivadas ficam.
+    """
+    if _files().find_one({"_id": source_id}, {"_id": 1}):
+        return 0
+    fs = _fs()
+    removed = 0
+    for doc in _files().find({"metadata.derivativeOf": source_id}, {"_id": 1}):
+        fs.delete(doc["_id"])
+        removed += 1
+    with _lookup_lock:
+        for key in [k for k in _lookup if k[0] == source_id]:
+            _lookup.pop(key, None)
+    return removed
+
+
+def generate_all(source_id) -> None:
+    """Gera as variantes que as páginas pedem: cada tamanho em WebP e no formato de fallback."""
+    try:
+        source = _fs().get(source_id)
+    except gridfs.NoFile:
+        return
+    fallback = pick_format(None, "", source.content_type)
+    for size in IMAGE_SIZES:
+        for fmt in ("webp", fallback):
+            if get_or_create_derivative(source, size, fmt) is None:
+                return
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(getattr(settings, "IMAGE_DERIVATIVE_WORKERS", 2)),
+                    thread_name_prefix="image-derivatives",
+                )
+    return _executor
+
+
+def _run(fn, *args) -> None:
+    try:
+        fn(*args)
+    except Exception:
+        logger.exception("Erro no processamento de derivadas de imagem")
+
+
+def image_changed(old_id=None, new_id=None) -> None:
+    """
+    Chamado quando a imagem principal é criada, trocada ou removida: apaga as
+    derivadas da antiga e gera as da nova no pool em segundo plano.
+    """
+    executor = _get_executor()
+    if old_id is not None and old_id != new_id:
+        executor.submit(_run, delete_derivatives, old_id)
+    if new_id is not None and derivatives_on_upload():
+        executor.submit(_run, generate_all, new_id)
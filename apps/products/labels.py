@@ -0,0 +1,267 @@
+# apps/products/labels.py
+"""
+Folhas de etiquetas com QR code (`manage.py qr_labels` e POST
+/products/api/products/qr-labels/).
+
+- Os produtos saem do Mongo por cursor (só marca, modelo e SKU), ordenados
+  por _id, e são agrupados em páginas de `cols x rows` etiquetas.
+- Cada página é desenhada inteira num processo do pool (QR + texto, Pillow,
+  1 bit por pixel) e volta já comprimida; no máximo `2 x workers` páginas
+  ficam em andamento, então a memória não cresce com o lote.
+- O PDF é escrito página a página (`PdfSheetWriter`); a árvore de páginas e
+  o xref só vão no fim. `Image.save(..., append=True)` do Pillow relê o
+  arquivo a cada página e fica quadrático em lotes grandes.
+
+As URLs do QR (passaporte público) são montadas no processo principal; o
+que vai para o pool é só texto e números.
+"""
+import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from bson import ObjectId
+from PIL import Image, ImageDraw, ImageFont, PdfParser
+
+from apps.products.models import Products
+from apps.products.qr import qr_image
+
+# tamanhos de papel em milímetros
+PAGE_SIZES = {"a4": (210.0, 297.0), "letter": (215.9, 279.4)}
+DEFAULT_COLS = 3
+DEFAULT_ROWS = 8
+DEFAULT_DPI = 300
+PAGE_MARGIN_MM = 5.0
+LABEL_PADDING_MM = 2.0
+
+LABEL_PROJECTION = {"identification.brandName": 1, "identification.modelName": 1, "identification.sku": 1}
+
+
+def sheet_layout(cols: int = DEFAULT_COLS, rows: int = DEFAULT_ROWS, dpi: int = DEFAULT_DPI,
+                 page: str = "a4") -> Dict[str, int]:
+    """Medidas da folha em pixels (página, célula, margem)."""
+    if cols < 1 or rows < 1:
+        raise ValueError("cols e rows precisam ser >= 1")
+    if page not in PAGE_SIZES:
+        raise ValueError(f"page inválido. Use: {', '.join(PAGE_SIZES)}")
+    width_mm, height_mm = PAGE_SIZES[page]
+
+    def px(mm):
+        return int(round(mm * dpi / 25.4))
+
+    width, height, margin = px(width_mm), px(height_mm), px(PAGE_MARGIN_MM)
+    return {
+        "dpi": dpi,
+        "cols": cols,
+        "rows": rows,
+        "width": width,
+        "height": height,
+        "margin": margin,
+        "padding": px(LABEL_PADDING_MM),
+        "cell_w": (width - 2 * margin) // cols,
+        "cell_h": (height - 2 * margin) // rows,
+    }
+
+
+def label_query(base: dict, *, ids: Optional[Iterable[str]] = None, brand: Optional[str] = None,
+                model: Optional[str] = None, sku: Optional[str] = None) -> dict:
+    """`base` (ex: visible_filter) + os filtros simples de etiqueta (igualdade)."""
+    query = dict(base)
+    if ids is not None:
+        oids = [ObjectId(str(i)) for i in ids if ObjectId.is_valid(str(i))]
+        query["_id"] = {"$in": oids}
+    for field, value in (("brandName", brand), ("modelName", model), ("sku", sku)):
+        if value:
+            query[f"identification.{field}"] = value
+    return query
+
+
+def label_items(raws: Iterable[dict], url_for: Callable[[str], str]) -> Iterator[dict]:
+    """Documentos crus (LABEL_PROJECTION) -> o que o pool precisa para desenhar."""
+    for raw in raws:
+        ident = raw.get("identification") or {}
+        pid = str(raw["_id"])
+        yield {
+            "id": pid,
+            "url": url_for(pid),
+            "brand": ident.get("brandName") or "",
+            "model": ident.get("modelName") or "",
+            "sku": ident.get("sku") or "",
+        }
+
+
+def _fit(draw, text: str, font, width: int) -> str:
+    """Corta `text` com reticências até caber em `width` pixels."""
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…" if text else ""
+
+
+@lru_cache(maxsize=8)
+def _font(size: int):
+    return ImageFont.load_default(size=size)
+
+
+def draw_label(page, item: dict, x: int, y: int, layout: Dict[str, int]) -> None:
+    """QR à esquerda; marca, modelo e SKU à direita (o id já está no QR)."""
+    pad = layout["padding"]
+    side = layout["cell_h"] - 2 * pad
+    qr = qr_image(item["url"], side)
+    page.paste(qr, (x + pad, y + pad + (side - qr.height) // 2))
+
+    draw = ImageDraw.Draw(page)
+    text_x = x + 2 * pad + side
+    text_w = layout["cell_w"] - side - 3 * pad
+    if text_w <= 0:
+        return
+    lines = [(item["brand"], _font(max(8, side // 7))), (item["model"], _font(max(7, side // 9)))]
+    if item["sku"]:
+        lines.append((f"SKU {item['sku']}", _font(max(6, side // 10))))
+    text_y = y + 2 * pad
+    for text, font in lines:
+        draw.text((text_x, text_y), _fit(draw, text, font, text_w), font=font, fill=0)
+        text_y += int(font.size * 1.35)
+
+
+def render_page(items: List[dict], layout: Dict[str, int]) -> bytes:
+    """Uma página (até cols x rows etiquetas) em 1 bit, comprimida para o PDF."""
+    page = Image.new("1", (layout["width"], layout["height"]), 1)
+    for i, item in enumerate(items):
+        row, col = divmod(i, layout["cols"])
+        x = layout["margin"] + col * layout["cell_w"]
+        y = layout["margin"] + row * layout["cell_h"]
+        draw_label(page, item, x, y, layout)
+    return zlib.compress(page.tobytes(), 6)
+
+
+class PdfSheetWriter:
+    """PDF escrito página a página: cada página é uma imagem 1 bit (FlateDecode)."""
+
+    def __init__(self, path: str, layout: Dict[str, int]):
+        self.layout = layout
+        self.pdf = PdfParser.PdfParser(filename=path, mode="w+b")
+        self.pdf.start_writing()
+        self.pdf.write_header()
+        self.pages_ref = self.pdf.next_object_id(0)
+        self.page_refs = []
+
+    def add_page(self, data: bytes) -> None:
+        width, height, dpi = self.layout["width"], self.layout["height"], self.layout["dpi"]
+        pdf = self.pdf
+        image_ref = pdf.write_obj(
+            None,
+            stream=data,
+            Type=PdfParser.PdfName("XObject"),
+            Subtype=PdfParser.PdfName("Image"),
+            Width=width,
+            Height=height,
+            ColorSpace=PdfParser.PdfName("DeviceGray"),
+            BitsPerComponent=1,
+            Filter=PdfParser.PdfName("FlateDecode"),
+        )
+        pt_w, pt_h = width * 72.0 / dpi, height * 72.0 / dpi
+        contents_ref = pdf.write_obj(None, stream=b"q %f 0 0 %f 0 0 cm /image Do Q\n" % (pt_w, pt_h))
+        self.page_refs.append(pdf.write_obj(
+            None,
+            Type=PdfParser.PdfName("Page"),
+            Parent=self.pages_ref,
+            Resources=PdfParser.PdfDict(XObject=PdfParser.PdfDict(image=image_ref)),
+            MediaBox=[0, 0, pt_w, pt_h],
+            Contents=contents_ref,
+        ))
+
+    def close(self) -> None:
+        pdf = self.pdf
+        pdf.write_obj(self.pages_ref, Type=PdfParser.PdfName("Pages"),
+                      Count=len(self.page_refs), Kids=self.page_refs)
+        pdf.root_ref = pdf.write_obj(None, Type=PdfParser.PdfName("Catalog"), Pages=self.pages_ref)
+        pdf.write_xref_and_trailer()
+        pdf.f.flush()
+        pdf.close()
+
+
+def _pages(items: Iterable[dict], per_page: int) -> Iterator[List[dict]]:
+    page = []
+    for item in items:
+        page.append(item)
+        if len(page) == per_page:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+class _Inline:
+    """Executor no próprio processo (workers <= 1, ex: dentro de uma requisição)."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def write_label_sheets(
+    out: str,
+    query: dict,
+    url_for: Callable[[str], str],
+    *,
+    layout: Optional[Dict[str, int]] = None,
+    workers: Optional[int] = None,
+    log: Optional[Callable[[str], None]] = None,
+) -> dict:
+    """
+    Gera o PDF `out` com as etiquetas dos produtos de `query`.
+    `workers`: processos do pool (None = nº de CPUs; <= 1 desenha no próprio processo).
+    """
+    layout = layout or sheet_layout()
+    per_page = layout["cols"] * layout["rows"]
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    log = log or (lambda msg: None)
+
+    collection = Products._get_collection()
+    total = collection.count_documents(query)
+    total_pages = (total + per_page - 1) // per_page
+    cursor = collection.find(query, LABEL_PROJECTION, batch_size=1000).sort("_id", 1)
+    stats = {"labels": 0, "pages": 0, "seconds": 0.0}
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else _Inline()
+    writer = PdfSheetWriter(out, layout)
+    started = last = time.perf_counter()
+    pending = deque()
+
+    def write_next():
+        nonlocal last
+        count, future = pending.popleft()
+        writer.add_page(future.result())
+        now = time.perf_counter()
+        stats["pages"] += 1
+        stats["labels"] += count
+        elapsed = now - last
+        last = now
+        log(f"página {stats['pages']}/{total_pages}: {count} etiquetas em {elapsed:.2f}s "
+            f"({count / elapsed if elapsed else 0:.1f} etiquetas/s)")
+
+    try:
+        for page in _pages(label_items(cursor, url_for), per_page):
+            pending.append((len(page), executor.submit(render_page, page, layout)))
+            if len(pending) >= 2 * max(1, workers):
+                write_next()
+        while pending:
+            write_next()
+        if not stats["pages"]:
+            # PDF sem página não abre: uma folha em branco
+            writer.add_page(render_page([], layout))
+        writer.close()
+    finally:
+        executor.shutdown(wait=True)
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
@@ -0,0 +1,231 @@
+# apps/products/listing.py
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+
+from apps.products.models import Products
+
+LIST_DEFAULT_LIMIT = 50
+LIST_MAX_LIMIT = 500
+
+# Ordenações aceitas pelo keyset (sempre com _id como desempate)
+LIST_ORDER_FIELDS = ("_id", "createdAt", "updatedAt")
+
+# Campos do card da listagem (products.js); mesmo formato do ProductsSerializer
+SUMMARY_FIELDS = (
+    "identification.brandName",
+    "identification.modelName",
+    "identification.isActive",
+    "identification.productCategory.primary",
+    "description",
+    "imageUrl",
+    "createdById",
+    "ownerUserId",
+    "companyUserId",
+    "parentId",
+    "createdAt",
+    "updatedAt",
+)
+
+
+class InvalidListParam(ValueError):
+    pass
+
+
+def visible_filter(profile, is_superuser: bool) -> Dict[str, Any]:
+    """Filtro cru dos produtos ativos que o perfil pode ver (mesma regra do `list`)."""
+    query: Dict[str, Any] = {"identification.isActive": True}
+    if not is_superuser:
+        acc_id = str(profile.id)
+        query["$or"] = [{"createdById": acc_id}, {"ownerUserId": acc_id}]
+    return query
+
+
+def aggregation_candidates_filter(acc_id: str, parent_id) -> Dict[str, Any]:
+    """Produtos ativos do usuário, sem pai e diferentes do próprio pai (aggregation_candidates)."""
+    return {
+        "identification.isActive": True,
+        "$and": [
+            {
+                "$or": [
+                    {"createdById": acc_id},
+                    {"ownerUserId": acc_id},
+                ]
+            },
+            {
+                "$or": [
+                    {"parentId": {"$exists": False}},
+                    {"parentId": None},
+                ]
+            },
+            {"_id": {"$ne": parent_id}},
+        ],
+    }
+
+
+def public_passport_filter(product_id) -> Dict[str, Any]:
+    """Passaporte público: só produtos ativos."""
+    return {"_id": product_id, "identification.isActive": True}
+
+
+def parse_fields(raw: Optional[str]) -> Optional[List[str]]:
+    """`fields=a,b.c` -> lista validada (o primeiro nível precisa ser campo de Products)."""
+    if not raw:
+        return None
+    fields = []
+    for f in raw.split(","):
+        f = f.strip()
+        if not f:
+            continue
+        top = f.split(".", 1)[0]
+        if f.startswith("$") or ".." in f or (top not in Products._fields and top != "_id"):
+            raise InvalidListParam(f"Campo inválido em 'fields': {f}")
+        fields.append(f)
+    return fields or None
+
+
+def parse_order(raw: Optional[str]) -> Tuple[str, bool]:
+    """`order=createdAt` / `order=-createdAt` -> (campo, desc)."""
+    raw = (raw or "_id").strip()
+    desc = raw.startswith("-")
+    field = raw.lstrip("-+")
+    if field == "id":
+        field = "_id"
+    if field not in LIST_ORDER_FIELDS:
+        raise InvalidListParam(f"'order' inválido (use {', '.join(LIST_ORDER_FIELDS)}).")
+    return field, desc
+
+
+def parse_limit(raw: Optional[str]) -> int:
+    try:
+        limit = int(raw) if raw else LIST_DEFAULT_LIMIT
+    except ValueError:
+        raise InvalidListParam("'limit' deve ser um inteiro.")
+    return max(1, min(limit, LIST_MAX_LIMIT))
+
+
+def encode_cursor(field: str, doc: dict) -> str:
+    token = json_util.dumps({"v": doc.get(field) if field != "_id" else None, "id": doc["_id"]})
+    return base64.urlsafe_b64encode(token.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(raw: str) -> Tuple[Any, ObjectId]:
+    try:
+        padded = raw + "=" * (-len(raw) % 4)
+        data = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        last_id = data["id"]
+        if not isinstance(last_id, ObjectId):
+            raise ValueError
+        return data.get("v"), last_id
+    except Exception:
+        raise InvalidListParam("'cursor' inválido.")
+
+
+def keyset_filter(field: str, desc: bool, value, last_id: ObjectId) -> Dict[str, Any]:
+    """Condição "depois do último item da página" para (campo, _id)."""
+    op = "$lt" if desc else "$gt"
+    if field == "_id":
+        return {"_id": {op: last_id}}
+    if value is None:
+        # Nulos vêm primeiro na ordem crescente e por último na decrescente
+        cond = [{field: None, "_id": {op: last_id}}]
+        if not desc:
+            cond.append({field: {"$ne": None}})
+        return {"$or": cond}
+    cond = [{field: {op: value}}, {field: value, "_id": {op: last_id}}]
+    if desc:
+        cond.append({field: None})
+    return {"$or": cond}
+
+
+def page_query(base: Dict[str, Any], field: str, desc: bool, cursor: Optional[str]) -> Dict[str, Any]:
+    if not cursor:
+        return base
+    value, last_id = decode_cursor(cursor)
+    return {"$and": [base, keyset_filter(field, desc, value, last_id)]}
+
+
+def sort_spec(field: str, desc: bool) -> List[Tuple[str, int]]:
+    direction = -1 if desc else 1
+    if field == "_id":
+        return [("_id", direction)]
+    return [(field, direction), ("_id", direction)]
+
+
+def _jsonable(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def raw_to_item(doc: dict) -> dict:
+    """Documento cru (projeção) no formato do ProductsSerializer: `id` + `_id: {"$oid"}`."""
+    oid = doc.pop("_id")
+    item = _jsonable(doc)
+    item["id"] = str(oid)
+    item["_id"] = {"$oid": str(oid)}
+    return item
+
+
+def fetch_raw_page(
+    query: Dict[str, Any],
+    *,
+    field: str,
+    desc: bool,
+    limit: int,
+    fields: Optional[List[str]] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Uma página de documentos crus direto do pymongo (todos os campos, ou só
+    `fields`). Retorna (documentos, próximo cursor ou None).
+    """
+    projection = None
+    if fields:
+        wanted = set(fields) | {field}
+        # "a" e "a.b" juntos dão path collision no Mongo: fica só o pai
+        projection = {
+            f: 1 for f in wanted
+            if not any(f.startswith(other + ".") for other in wanted)
+        }
+    cursor = (
+        Products._get_collection()
+        .find(query, projection)
+        .sort(sort_spec(field, desc))
+        .limit(limit + 1)
+    )
+    docs = list(cursor)
+    next_cursor = encode_cursor(field, docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+def fetch_page(
+    query: Dict[str, Any],
+    *,
+    field: str,
+    desc: bool,
+    limit: int,
+    fields: Optional[List[str]] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Página com só os campos pedidos (padrão: SUMMARY_FIELDS), já no formato da API."""
+    docs, next_cursor = fetch_raw_page(
+        query, field=field, desc=desc, limit=limit, fields=list(fields or SUMMARY_FIELDS)
+    )
+    return [raw_to_item(d) for d in docs], next_cursor
+
+
+def fetch_documents_page(
+    query: Dict[str, Any], *, field: str, desc: bool, limit: int
+) -> Tuple[list, Optional[str]]:
+    """Igual a `fetch_page`, mas devolve documentos mongoengine (para `view=full`)."""
+    order = [f"{'-' if desc else '+'}{'id' if f == '_id' else f}" for f, _ in sort_spec(field, desc)]
+    docs = list(Products.objects(__raw__=query).order_by(*order).limit(limit + 1))
+    next_cursor = None
+    if len(docs) > limit:
+        last = docs[limit - 1]
+        next_cursor = encode_cursor(field, {"_id": last.id, field: getattr(last, "id" if field == "_id" else field)})
+    return docs[:limit], next_cursor
@@ -0,0 +1,19 @@
+# apps/products/management/commands/backfill_attachment_index.py
+from django.core.management.base import BaseCommand
+
+from apps.products.attachments import backfill_attachment_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Preenche Products.attachmentIndex (usado pelo download de anexos de uso) nos produtos "
+        "gravados antes dele. Escreve direto no Mongo, sem save() nem auditoria."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Recalcula também os que já têm o índice.")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        updated = backfill_attachment_index(batch_size=opts["batch_size"], only_missing=not opts["all"])
+        self.stdout.write(self.style.SUCCESS(f"{updated} produto(s) atualizados."))
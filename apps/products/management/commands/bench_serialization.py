@@ -0,0 +1,144 @@
+# apps/products/management/commands/bench_serialization.py
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from apps.products.fast_serializers import dumps, orjson, serialize_product, serialize_products
+from apps.products.models import Products
+from apps.products.serializers import ProductsSerializer
+
+
+def _maybe(rng, value, p_missing=0.2, p_null=0.1):
+    roll = rng.random()
+    if roll < p_missing:
+        return _ABSENT
+    if roll < p_missing + p_null:
+        return None
+    return value
+
+
+_ABSENT = object()
+
+
+def _clean(d):
+    return {k: v for k, v in d.items() if v is not _ABSENT}
+
+
+def synthetic_product(rng: random.Random, history: int) -> dict:
+    """Documento cru variado: chaves ausentes, nulas, listas vazias, datas como datetime."""
+    base = datetime(2024, 1, 1)
+
+    def attachment(i):
+        return _clean({
+            "attachmentId": f"att-{i}",
+            "filename": _maybe(rng, f"laudo-{i}.pdf"),
+            "contentType": "application/pdf",
+            "size": _maybe(rng, rng.randrange(10**6)),
+            "uploadedAt": _maybe(rng, base + timedelta(hours=i)),
+        })
+
+    def op_range():
+        return _maybe(rng, _clean({"min": _maybe(rng, rng.random() * 10), "max": rng.random() * 100,
+                                   "unit": _maybe(rng, "V")}))
+
+    return _clean({
+        "_id": ObjectId(),
+        "identification": _clean({
+            "brandName": "ACME", "modelName": f"Esteira {rng.randrange(100)}",
+            "sku": _maybe(rng, "SKU-1"), "upc": _maybe(rng, "0001"),
+            "isActive": _maybe(rng, rng.random() < 0.9, p_null=0),
+            "productCategory": _maybe(rng, _clean({"primary": "Transporte", "secondary": _maybe(rng, "Esteira")})),
+        }),
+        "technicalSpecifications": _maybe(rng, _clean({
+            "operatingVoltage": op_range(), "operatingTemperature": op_range(),
+            "weight": _maybe(rng, {"value": rng.randrange(1, 500), "unit": "kg"}),
+            "ipRating": _maybe(rng, "IP65"),
+            "compliance": _maybe(rng, ["CE", "NR-12"]),
+            "additionalSpecs": _maybe(rng, _clean({"calibrationInterval": _maybe(rng, 12)})),
+        })),
+        "sustainability": _maybe(rng, _clean({
+            "recycling": _maybe(rng, {"isRecyclable": True, "recyclabilityPercentage": 80}),
+            "disassembly": _maybe(rng, _clean({"toolRequirements": _maybe(rng, ["chave"]), "difficultyRating": 2})),
+        })),
+        "productLifecycle": _maybe(rng, _clean({"endOfLifeDate": _maybe(rng, base + timedelta(days=3650))})),
+        "productionData": _maybe(rng, {"manufacturing": _clean({"city": "Recife",
+                                                                "productionDate": _maybe(rng, base)})}),
+        "usageData": _maybe(rng, _clean({
+            "condition": _maybe(rng, rng.choice(["new", "good", "worn"])),
+            "lastUsedAt": _maybe(rng, base + timedelta(days=10)),
+            "operationalData": _maybe(rng, {f"m{i}": rng.random() for i in range(30)}),
+            "maintenanceHistory": _maybe(rng, [
+                _clean({"date": base + timedelta(days=i), "type": "preventiva", "cost": _maybe(rng, 100.0 + i),
+                        "attachments": _maybe(rng, [attachment(i * 10 + j) for j in range(2)])})
+                for i in range(history)
+            ]),
+            "repairHistory": _maybe(rng, [
+                _clean({"date": base, "component": "motor", "underWarranty": _maybe(rng, False)})
+                for _ in range(history // 4)
+            ]),
+        })),
+        "description": _maybe(rng, "Esteira transportadora"),
+        "imageUrl": _maybe(rng, "https://example.com/x.png"),
+        "createdAt": _maybe(rng, base + timedelta(minutes=rng.randrange(10**5))),
+        "updatedAt": _maybe(rng, base + timedelta(days=1), p_null=0),
+        "createdById": _maybe(rng, "u1", p_null=0),
+        "ownerUserId": _maybe(rng, "u2"),
+        "parentId": _maybe(rng, None),
+        "childIds": _maybe(rng, [str(ObjectId()) for _ in range(3)], p_null=0),
+    })
+
+
+def _drf(raw: dict) -> dict:
+    return ProductsSerializer(Products._from_son(raw)).data
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o caminho rápido (as_pymongo + fast_serializers + orjson) com o DRF "
+        "(hidratação mongoengine + ProductsSerializer + json.dumps): mede list (N documentos) "
+        "e retrieve (1 documento). A paridade do JSON fica em apps/products/tests.py."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--docs", type=int, default=200, help="Documentos sintéticos.")
+        parser.add_argument("--history", type=int, default=20, help="Manutenções por documento.")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--from-db", type=int, default=0, metavar="N",
+                            help="Usa N documentos reais da coleção products em vez dos sintéticos.")
+        parser.add_argument("--seed", type=int, default=3)
+
+    def handle(self, *args, **opts):
+        if opts["from_db"]:
+            raws = list(Products._get_collection().find().limit(opts["from_db"]))
+            source = "coleção products"
+        else:
+            rng = random.Random(opts["seed"])
+            raws = [synthetic_product(rng, opts["history"]) for _ in range(opts["docs"])]
+            source = "sintéticos"
+        if not raws:
+            raise CommandError("Nenhum documento para comparar.")
+
+        self.stdout.write(f"{len(raws)} documentos ({source}); encoder: "
+                          f"{'orjson' if orjson else 'json (orjson não instalado)'}")
+
+        def timed(fn):
+            started = time.perf_counter()
+            for _ in range(opts["repeat"]):
+                fn()
+            return (time.perf_counter() - started) * 1000.0 / opts["repeat"]
+
+        list_drf = timed(lambda: json.dumps([_drf(r) for r in raws], cls=DjangoJSONEncoder))
+        list_fast = timed(lambda: dumps(serialize_products(raws)))
+        one = raws[0]
+        retrieve_drf = timed(lambda: [json.dumps(_drf(one), cls=DjangoJSONEncoder) for _ in range(100)]) / 100
+        retrieve_fast = timed(lambda: [dumps(serialize_product(one)) for _ in range(100)]) / 100
+
+        self.stdout.write(f"  list ({len(raws)} docs): DRF {list_drf:8.2f} ms | rápido {list_fast:8.2f} ms "
+                          f"({list_drf / list_fast:.1f}x)")
+        self.stdout.write(f"  retrieve (1 doc):   DRF {retrieve_drf:8.3f} ms | rápido {retrieve_fast:8.3f} ms "
+                          f"({retrieve_drf / retrieve_fast:.1f}x)")
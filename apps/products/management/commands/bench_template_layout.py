@@ -0,0 +1,37 @@
+# apps/products/management/commands/bench_template_layout.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_project import TemplateLayout
+from web_project.template_helpers import theme
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede TemplateLayout.init (chamado por ProductsViews, product_details, passaporte...): "
+        "com a classe de bootstrap do layout já resolvida (cache de TemplateHelper) e "
+        "resolvendo a cada chamada (find_spec + import_module, como antes do cache)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+
+    def handle(self, *args, **opts):
+        n = max(1, opts["iterations"])
+
+        def timed(before_each=None):
+            started = time.perf_counter()
+            for _ in range(n):
+                if before_each:
+                    before_each()
+                TemplateLayout.init(None, {})
+            return (time.perf_counter() - started) * 1e6 / n
+
+        TemplateLayout.init(None, {})  # resolve o layout uma vez
+        cached = timed()
+        uncached = timed(theme._bootstrap_classes.clear)
+
+        self.stdout.write(f"TemplateLayout.init ({n} chamadas):")
+        self.stdout.write(f"  sem cache: {uncached:8.2f} µs/chamada")
+        self.stdout.write(f"  com cache: {cached:8.2f} µs/chamada ({uncached / cached:.1f}x)")
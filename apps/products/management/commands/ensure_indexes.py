@@ -0,0 +1,91 @@
+# apps/products/management/commands/ensure_indexes.py
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.file_store import ensure_blob_index
+from apps.products.images import ensure_derivative_index
+from apps.products.listing import (
+    aggregation_candidates_filter, keyset_filter, public_passport_filter, sort_spec, visible_filter,
+)
+from apps.products.models import Products
+from apps.tracking.models import ProductAudit
+
+
+class _Profile:
+    def __init__(self, pk):
+        self.id = pk
+
+
+def _view_queries():
+    """(nome, filtro, sort) com o mesmo formato das consultas das views."""
+    user = _Profile(str(ObjectId()))
+    some_id = ObjectId()
+    queries = [
+        ("list (superuser)", visible_filter(user, True), sort_spec("_id", False)),
+        ("list (usuário)", visible_filter(user, False), sort_spec("_id", False)),
+        ("list (usuário, próxima página)",
+         {"$and": [visible_filter(user, False), keyset_filter("_id", False, None, some_id)]},
+         sort_spec("_id", False)),
+        ("list (superuser, order=-createdAt)", visible_filter(user, True), sort_spec("createdAt", True)),
+        ("aggregation_candidates", aggregation_candidates_filter(user.id, some_id), None),
+        ("passport_public", public_passport_filter(some_id), None),
+        ("retrieve", {"_id": some_id}, None),
+        ("usage_attachment (por id)", {"attachmentIndex.id": "0" * 32}, None),
+    ]
+    return queries
+
+
+def _stages(plan):
+    """Todos os estágios de um winningPlan (inclui inputStage/inputStages)."""
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            yield node["stage"]
+        for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+            if key in node:
+                stack.append(node[key])
+        stack.extend(node.get("inputStages") or [])
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria os índices declarados nos models (products, products_audit) e os do GridFS "
+        "(derivadas de imagem, hash dos uploads). "
+        "Com --check, roda explain() nas consultas das views e falha se alguma cair em COLLSCAN."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true",
+                            help="Depois de criar, valida os planos das consultas com explain().")
+
+    def handle(self, *args, **opts):
+        for document in (Products, ProductAudit):
+            document.ensure_indexes()
+            names = sorted(document._get_collection().index_information())
+            self.stdout.write(f"{document._get_collection_name()}: {', '.join(names)}")
+        ensure_derivative_index()
+        ensure_blob_index()
+
+        if not opts["check"]:
+            return
+
+        collection = Products._get_collection()
+        failures = []
+        for name, query, sort in _view_queries():
+            cursor = collection.find(query).limit(50)
+            if sort:
+                cursor = cursor.sort(sort)
+            explain = cursor.explain()
+            plan = (explain.get("queryPlanner") or {}).get("winningPlan") or {}
+            stages = list(_stages(plan))
+            status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+            self.stdout.write(f"  {name:38s} {status:9s} {' > '.join(stages)}")
+            if status != "ok":
+                failures.append(name)
+
+        if failures:
+            raise CommandError(f"Consultas sem índice (COLLSCAN): {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("Nenhuma consulta das views cai em COLLSCAN."))
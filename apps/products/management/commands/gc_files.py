@@ -0,0 +1,43 @@
+# apps/products/management/commands/gc_files.py
+from django.core.management.base import BaseCommand
+
+from apps.products.file_gc import collect_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        "Remove do GridFS os arquivos que nenhum produto referencia (manual, imagem, anexos de uso), "
+        "derivadas de imagens apagadas e chunks sem arquivo. Por padrão só relata (--dry-run); "
+        "use --delete para apagar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--delete", action="store_true", help="Apaga de fato (sem isso é dry-run).")
+        parser.add_argument("--bucket", default="fs", help="Bucket do GridFS (padrão: fs).")
+        parser.add_argument("--batch-size", type=int, default=500, help="Arquivos apagados por lote.")
+        parser.add_argument("--sleep", type=float, default=0.0, metavar="SECONDS",
+                            help="Pausa entre lotes (throttling).")
+        parser.add_argument("--grace-hours", type=float, default=1.0,
+                            help="Ignora arquivos enviados há menos que isso (upload antes do save).")
+        parser.add_argument("--fix-refcounts", action="store_true",
+                            help="Corrige metadata.refCount dos arquivos deduplicados.")
+
+    def handle(self, *args, **opts):
+        dry_run = not opts["delete"]
+        if dry_run:
+            self.stdout.write("Dry-run: nada será apagado (use --delete).")
+        stats = collect_garbage(
+            bucket=opts["bucket"],
+            dry_run=dry_run,
+            batch_size=opts["batch_size"],
+            sleep=opts["sleep"],
+            grace_seconds=int(opts["grace_hours"] * 3600),
+            fix_refcounts=opts["fix_refcounts"],
+            log=self.stdout.write,
+        )
+        verb = "seriam apagados" if dry_run else "apagados"
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['orphans'] + stats['orphan_derivatives']} arquivo(s) {verb} "
+            f"({stats['orphan_bytes'] / 1024 / 1024:.1f} MB, {stats['batches']} lote(s)); "
+            f"chunks sem arquivo: {stats['orphan_chunk_files']}; refCount corrigidos: {stats['refcounts_fixed']}"
+        ))
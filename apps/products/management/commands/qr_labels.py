@@ -0,0 +1,68 @@
+# apps/products/management/commands/qr_labels.py
+from bson import json_util
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.labels import PAGE_SIZES, label_query, sheet_layout, write_label_sheets
+from apps.products.qr import passport_url
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera um PDF de folhas de etiquetas (QR do passaporte público + marca/modelo/SKU) para os "
+        "produtos do filtro. As páginas são desenhadas num pool de processos e gravadas uma a uma."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--out", required=True, help="Arquivo PDF de saída.")
+        parser.add_argument("--filter", default=None,
+                            help="Consulta Mongo em JSON (extended JSON), "
+                                 'ex: \'{"identification.brandName": "ACME"}\'.')
+        parser.add_argument("--ids", default=None, help="Ids separados por vírgula.")
+        parser.add_argument("--brand", default=None)
+        parser.add_argument("--model", default=None)
+        parser.add_argument("--sku", default=None)
+        parser.add_argument("--include-inactive", action="store_true",
+                            help="Inclui produtos desativados (o QR deles dá 404 no passaporte público).")
+        parser.add_argument("--base-url", default=None,
+                            help="Origem das URLs no QR (padrão: settings.PASSPORT_BASE_URL).")
+        parser.add_argument("--cols", type=int, default=3)
+        parser.add_argument("--rows", type=int, default=8)
+        parser.add_argument("--dpi", type=int, default=300)
+        parser.add_argument("--page", default="a4", choices=sorted(PAGE_SIZES))
+        parser.add_argument("--workers", type=int, default=None, help="Processos do pool (padrão: nº de CPUs).")
+
+    def handle(self, *args, **opts):
+        try:
+            base = json_util.loads(opts["filter"]) if opts["filter"] else {}
+        except ValueError as e:
+            raise CommandError(f"--filter não é JSON válido: {e}")
+        if not isinstance(base, dict):
+            raise CommandError("--filter precisa ser um objeto JSON.")
+        if not opts["include_inactive"]:
+            base.setdefault("identification.isActive", True)
+        ids = [i.strip() for i in opts["ids"].split(",") if i.strip()] if opts["ids"] else None
+        query = label_query(base, ids=ids, brand=opts["brand"], model=opts["model"], sku=opts["sku"])
+
+        try:
+            layout = sheet_layout(opts["cols"], opts["rows"], opts["dpi"], opts["page"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        base_url = opts["base_url"]
+        if base_url:
+            def url_for(pid):
+                return base_url.rstrip("/") + f"/products/passport/{pid}/"
+        else:
+            try:
+                passport_url("0" * 24)
+            except ValueError as e:
+                raise CommandError(f"{e} Use --base-url.")
+            url_for = passport_url
+
+        stats = write_label_sheets(opts["out"], query, url_for, layout=layout,
+                                   workers=opts["workers"], log=self.stdout.write)
+        rate = stats["labels"] / stats["seconds"] if stats["seconds"] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['labels']} etiqueta(s) em {stats['pages']} página(s) -> {opts['out']} "
+            f"({stats['seconds']:.1f}s, {rate:.1f} etiquetas/s)"
+        ))
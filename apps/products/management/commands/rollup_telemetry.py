@@ -0,0 +1,52 @@
+# apps/products/management/commands/rollup_telemetry.py
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.rollups import catch_up_rollups, rollup_collection, rollup_mode, set_watermark
+
+
+class Command(BaseCommand):
+    help = (
+        "Atualiza os rollups de telemetria (minuto/hora/dia) a partir da coleção bruta, "
+        "continuando do último watermark. Use com TELEMETRY_ROLLUP_MODE = \"catchup\"."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", type=int, default=0, metavar="SECONDS",
+                            help="Roda continuamente, a cada SECONDS segundos.")
+        parser.add_argument("--lag", type=int, default=10,
+                            help="Ignora pontos mais novos que LAG segundos (podem ainda estar chegando).")
+        parser.add_argument("--window-minutes", type=int, default=60,
+                            help="Tamanho da janela processada por vez.")
+        parser.add_argument("--reset", action="store_true",
+                            help="Apaga os rollups e o watermark e recalcula tudo.")
+        parser.add_argument("--force", action="store_true",
+                            help="Roda mesmo com TELEMETRY_ROLLUP_MODE diferente de \"catchup\".")
+
+    def handle(self, *args, **opts):
+        mode = rollup_mode()
+        if mode != "catchup" and not opts["force"]:
+            raise CommandError(
+                f"TELEMETRY_ROLLUP_MODE = \"{mode}\": rodar o catch-up junto com os rollups na ingestão "
+                "contaria os pontos duas vezes. Use --force se souber o que está fazendo."
+            )
+
+        if opts["reset"]:
+            rollup_collection().delete_many({})
+            set_watermark(None)
+            self.stdout.write("Rollups e watermark apagados.")
+
+        window = timedelta(minutes=max(opts["window_minutes"], 1))
+        while True:
+            started = time.perf_counter()
+            result = catch_up_rollups(lag_seconds=opts["lag"], window=window)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{result['points']} pontos, {result['upserts']} upserts em {elapsed:.2f}s "
+                f"(watermark={result['watermark']})"
+            )
+            if not opts["loop"]:
+                break
+            time.sleep(opts["loop"])
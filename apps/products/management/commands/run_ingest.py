@@ -0,0 +1,130 @@
+# apps/products/management/commands/run_ingest.py
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _ingest_process(index: int, options: dict):
+    """Ponto de entrada de cada processo consumidor (spawn => Django do zero)."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    import django
+
+    django.setup()
+
+    import logging
+    from apps.products.mqtt_worker import run_ingest_consumer
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s [ingest-{index}] %(levelname)s %(name)s: %(message)s",
+    )
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    accept = None
+    if options["strategy"] == "partition":
+        total = options["processes"]
+
+        def accept(pid):
+            return bool(pid) and zlib.crc32(pid.encode("utf-8")) % total == index
+
+    run_ingest_consumer(
+        broker_host=options["host"],
+        broker_port=options["port"],
+        subscription=options["subscription"],
+        client_id=f"{options['client_prefix']}-{index}",
+        mqtt5=options["mqtt5"],
+        accept=accept,
+        stop_event=stop_event,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Sobe N processos consumidores de operational_data, fora do servidor web. "
+        "Por padrão usa shared subscription do MQTT 5 ($share/<grupo>/<tópico>), "
+        "então o broker distribui as mensagens entre os processos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=int(getattr(settings, "MQTT_INGEST_PROCESSES", 0))
+                            or os.cpu_count() or 1, help="Número de processos consumidores.")
+        parser.add_argument("--group", default=getattr(settings, "MQTT_SHARE_GROUP", "passport-ingest"),
+                            help="Nome do grupo do shared subscription.")
+        parser.add_argument("--topic", default=getattr(settings, "MQTT_TOPIC", "conveyor/operational_data/#"))
+        parser.add_argument("--host", default=getattr(settings, "MQTT_BROKER_HOST", "localhost"))
+        parser.add_argument("--port", type=int, default=int(getattr(settings, "MQTT_BROKER_PORT", 1883)))
+        parser.add_argument(
+            "--strategy", choices=("share", "partition"), default="share",
+            help=(
+                "share: $share/<grupo>/ (o broker balanceia; a ordem por produto entre processos "
+                "não é garantida). partition: todos assinam o tópico e cada processo só trata os "
+                "produtos do seu hash (mantém a ordem por produto, ao custo de receber tudo)."
+            ),
+        )
+        parser.add_argument("--mqtt311", action="store_true",
+                            help="Usa MQTT 3.1.1 em vez de MQTT 5 (brokers antigos).")
+
+    def handle(self, *args, **opts):
+        processes = opts["processes"]
+        if processes < 1:
+            raise CommandError("--processes deve ser >= 1")
+
+        topic = opts["topic"]
+        if opts["strategy"] == "share":
+            subscription = f"$share/{opts['group']}/{topic}"
+        else:
+            subscription = topic
+
+        options = {
+            "host": opts["host"],
+            "port": opts["port"],
+            "subscription": subscription,
+            "strategy": opts["strategy"],
+            "processes": processes,
+            "mqtt5": not opts["mqtt311"],
+            "client_prefix": f"ingest-{socket.gethostname()}-{os.getpid()}",
+        }
+
+        self.stdout.write(
+            f"Iniciando {processes} consumidor(es) em {opts['host']}:{opts['port']} "
+            f"assinando {subscription} (modo {getattr(settings, 'MQTT_INGEST_MODE', 'direct')})"
+        )
+
+        ctx = multiprocessing.get_context("spawn")
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+        def spawn(i):
+            proc = ctx.Process(target=_ingest_process, args=(i, options), name=f"ingest-{i}", daemon=False)
+            proc.start()
+            return proc
+
+        procs = {i: spawn(i) for i in range(processes)}
+        try:
+            while not stopping.is_set():
+                time.sleep(1.0)
+                for i, proc in list(procs.items()):
+                    if not proc.is_alive() and not stopping.is_set():
+                        self.stderr.write(f"Processo ingest-{i} saiu (exitcode={proc.exitcode}), reiniciando...")
+                        procs[i] = spawn(i)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stdout.write("Encerrando consumidores (flush das filas)...")
+            for proc in procs.values():
+                if proc.is_alive():
+                    proc.terminate()  # SIGTERM => stop_event no filho
+            for proc in procs.values():
+                proc.join(timeout=30)
+                if proc.is_alive():
+                    proc.kill()
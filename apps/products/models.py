@@ -162,10 +162,50 @@ class Products(DynamicDocument):
     usageData = EmbeddedDocumentField(UsageData, null=True)
     manualFile = FileField(null=True)
     imageFile = FileField(null=True)
+    # Nome/tipo do upload deste produto: o arquivo no GridFS pode ser
+    # compartilhado com outros produtos (apps/products/file_store.py)
+    manualFileName = StringField(null=True)
+    manualFileContentType = StringField(null=True)
+    imageFileName = StringField(null=True)
+    imageFileContentType = StringField(null=True)
     description = StringField(null=True)
     imageUrl = URLField(null=True)
     qr_code = URLField(null=True, blank=True)
     createdAt = DateTimeField(default=datetime.utcnow)
     parentId = StringField(null=True)
     childIds = ListField(StringField())
-    meta = {'collection': 'products'}
+    # Derivado de usageData (ver apps/products/attachments.py), recalculado no save()
+    attachmentIndex = ListField(DictField())
+    meta = {
+        'collection': 'products',
+        # Formatos de consulta das views (ver `manage.py ensure_indexes --check`):
+        # listagem/candidatos filtram isActive + $or createdById/ownerUserId e
+        # paginam por _id/createdAt/updatedAt; o passaporte público busca por _id.
+        'indexes': [
+            ('createdById', 'identification.isActive', 'id'),
+            ('ownerUserId', 'identification.isActive', 'id'),
+            ('identification.isActive', 'id'),
+            ('identification.isActive', 'createdAt', 'id'),
+            ('identification.isActive', 'updatedAt', 'id'),
+            'parentId',
+            {'fields': ['attachmentIndex.id'], 'sparse': True},
+        ],
+    }
+
+    def clean(self):
+        from apps.products.attachments import build_attachment_index
+        usage = self.usageData.to_mongo().to_dict() if self.usageData is not None else None
+        self.attachmentIndex = build_attachment_index(usage)
+
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        # import tardio: passport_cache importa este módulo
+        from apps.products.passport_cache import invalidate_passport
+        invalidate_passport(self.id)
+        return result
+
+    def delete(self, *args, **kwargs):
+        product_id = self.id
+        super().delete(*args, **kwargs)
+        from apps.products.passport_cache import invalidate_passport
+        invalidate_passport(product_id)
@@ -4,20 +4,197 @@
 import random
 import threading
 import time
+from datetime import datetime, timezone
 
 import paho.mqtt.client as mqtt
+from bson import ObjectId
 from django.conf import settings
 
-from apps.products.models import Products
 from apps.products.services import apply_operational_delta
 
 logger = logging.getLogger(__name__)
 
 _worker_started = False
+_consumer_pool = None
+
+
+def product_id_from_topic(topic: str):
+    """Esperamos: conveyor/operational_data/<productId>. Retorna None se inválido."""
+    parts = topic.split("/")
+    if len(parts) < 3:
+        return None
+    product_id = parts[-1]
+    return product_id if ObjectId.is_valid(product_id) else None
+
+
+def handle_operational_message(topic: str, payload: str, batch_writer=None, received_at: float | None = None):
+    """
+    Processa uma mensagem de operational_data (parse + escrita no Mongo).
+
+    `received_at` é o epoch de quando a mensagem chegou do broker (antes de
+    qualquer fila), usado como timestamp do histórico de telemetria.
+    """
+    received_dt = datetime.fromtimestamp(received_at or time.time(), tz=timezone.utc)
+    product_id = product_id_from_topic(topic)
+    if not product_id:
+        print(">>> Tópico inválido para operational_data:", topic)
+        return
+
+    try:
+        data = json.loads(payload)
+    except json.JSONDecodeError:
+        print(">>> Payload MQTT não é JSON válido:", payload)
+        return
+
+    if not isinstance(data, dict):
+        print(">>> Payload MQTT não é um objeto JSON:", payload)
+        return
+
+    # Modo em lote: só acumula, o batch writer faz o flush
+    if batch_writer is not None:
+        batch_writer.add(product_id, data, topic=topic, received_at=received_dt)
+        return
+
+    # CHAMADA DIRETA (sem try/except engolindo erro); uma única ida ao Mongo
+    print(">>> Chamando apply_operational_delta() para produto", product_id)
+    res = apply_operational_delta(
+        product_id=product_id,
+        delta=data,
+        source="broker",
+        source_channel="mqtt_backend",
+        actor_id=None,
+        actor_name=None,
+        notes="Atualização de dados operacionais via MQTT backend",
+        raw_topic=topic,
+        raw_payload=payload,
+        received_at=received_dt,
+    )
+    if not res.get("found", True):
+        print(f">>> Produto {product_id} não encontrado para tópico {topic}")
+        return
+    print(">>> apply_operational_delta() retornou:", res)
+
+
+def build_consumer_pool(batch_writer=None):
+    """
+    Pool de threads (sharded por produto) que tira o trabalho de banco da
+    thread de rede do paho. Retorna None se MQTT_CONSUMER_THREADS = 0.
+    """
+    workers = int(getattr(settings, "MQTT_CONSUMER_THREADS", 4))
+    if workers <= 0:
+        return None
+
+    from apps.products.consumer_pool import ShardedConsumerPool
+
+    def handler(item):
+        handle_operational_message(
+            item["topic"], item["payload"], batch_writer=batch_writer, received_at=item.get("receivedAt")
+        )
+
+    pool = ShardedConsumerPool(
+        handler,
+        workers=workers,
+        queue_size=int(getattr(settings, "MQTT_QUEUE_SIZE", 1000)),
+        policy=getattr(settings, "MQTT_BACKPRESSURE", "block"),
+        spill_dir=getattr(settings, "MQTT_SPILL_DIR", None),
+        name="mqtt-consumer",
+    )
+    pool.start()
+    return pool
+
+
+def create_client(client_id: str, *, mqtt5: bool = False):
+    if mqtt5:
+        return mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            client_id=client_id,
+            protocol=mqtt.MQTTv5,
+        )
+    return mqtt.Client(client_id=client_id)
+
+
+def run_ingest_consumer(
+    *,
+    broker_host: str,
+    broker_port: int,
+    subscription: str,
+    client_id: str,
+    mqtt5: bool = True,
+    accept=None,
+    stop_event=None,
+):
+    """
+    Loop de consumo bloqueante usado pelo `manage.py run_ingest` (um por processo).
+
+    - `subscription` pode ser um shared subscription do MQTT 5
+      (`$share/<grupo>/conveyor/operational_data/#`).
+    - `accept(product_id)` permite filtrar quais produtos este processo trata.
+    - Retorna quando `stop_event` é setado; o pool e o batch writer são
+      esvaziados antes de sair.
+    """
+    ingest_mode = getattr(settings, "MQTT_INGEST_MODE", "direct")
+    batch_writer = None
+    if ingest_mode == "batched":
+        from apps.products.batch_writer import get_batch_writer
+        batch_writer = get_batch_writer()
+    pool = build_consumer_pool(batch_writer=batch_writer)
+
+    def on_connect(client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            client.subscribe(subscription)
+            logger.info("[%s] conectado em %s:%s, subscribed em %s", client_id, broker_host, broker_port, subscription)
+        else:
+            logger.error("[%s] falha ao conectar MQTT (rc=%s)", client_id, rc)
+
+    def on_message(client, userdata, msg):
+        product_id = product_id_from_topic(msg.topic)
+        if accept is not None and not accept(product_id):
+            return
+        payload = msg.payload.decode("utf-8", errors="ignore")
+        if pool is not None:
+            pool.submit(
+                product_id or msg.topic,
+                {"topic": msg.topic, "payload": payload, "receivedAt": time.time()},
+            )
+        else:
+            handle_operational_message(msg.topic, payload, batch_writer=batch_writer)
+
+    stop_event = stop_event or threading.Event()
+    client = create_client(client_id, mqtt5=mqtt5)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+
+    try:
+        # Depois da primeira conexão o próprio paho reconecta (loop_start)
+        while not stop_event.is_set():
+            try:
+                client.connect(broker_host, broker_port, keepalive=60)
+                break
+            except Exception:
+                logger.exception("[%s] falha ao conectar no broker, nova tentativa em 5s...", client_id)
+                stop_event.wait(5)
+        else:
+            return
+
+        client.loop_start()
+        stop_event.wait()
+        client.disconnect()
+        client.loop_stop()
+    finally:
+        if pool is not None:
+            pool.stop()
+        if batch_writer is not None:
+            batch_writer.stop()
+
+
+def get_consumer_pool():
+    """Pool em uso neste processo (para métricas de profundidade/lag)."""
+    return _consumer_pool
 
 
 def start_mqtt_worker():
-    global _worker_started
+    global _worker_started, _consumer_pool
     if _worker_started:
         return
     _worker_started = True
@@ -25,8 +202,18 @@ def start_mqtt_worker():
     broker_host = getattr(settings, "MQTT_BROKER_HOST", "test.mosquitto.org")
     broker_port = int(getattr(settings, "MQTT_BROKER_PORT", 1883))
     topic = getattr(settings, "MQTT_TOPIC", "conveyor/operational_data/#")
+    ingest_mode = getattr(settings, "MQTT_INGEST_MODE", "direct")
+
+    batch_writer = None
+    if ingest_mode == "batched":
+        from apps.products.batch_writer import get_batch_writer
+        batch_writer = get_batch_writer()
+
+    pool = build_consumer_pool(batch_writer=batch_writer)
+    _consumer_pool = pool
 
-    print(f">>> start_mqtt_worker(): iniciando worker MQTT em {broker_host}:{broker_port}, tópico {topic}")
+    print(f">>> start_mqtt_worker(): iniciando worker MQTT em {broker_host}:{broker_port}, "
+          f"tópico {topic} (modo {ingest_mode})")
 
     def on_connect(client, userdata, flags, rc, properties=None):
         if rc == 0:
@@ -38,44 +225,18 @@ def on_connect(client, userdata, flags, rc, properties=None):
 
     def on_message(client, userdata, msg):
         topic = msg.topic
-        payload_bytes = msg.payload
+        payload = msg.payload.decode("utf-8", errors="ignore")
 
-        payload = payload_bytes.decode("utf-8", errors="ignore")
-        print(f">>> MQTT msg recebida em {topic}: {payload}")
-
-        parts = topic.split("/")
-        # Esperamos: conveyor/operational_data/<productId>
-        if len(parts) < 3:
-            print(">>> Tópico inválido para operational_data:", topic)
+        # Com pool: a thread de rede só enfileira; o banco roda nos workers
+        if pool is not None:
+            pool.submit(
+                product_id_from_topic(topic) or topic,
+                {"topic": topic, "payload": payload, "receivedAt": time.time()},
+            )
             return
 
-        product_id = parts[-1]
-
-        try:
-            data = json.loads(payload)
-        except json.JSONDecodeError:
-            print(">>> Payload MQTT não é JSON válido:", payload)
-            return
-
-        product = Products.objects(id=product_id).first()
-        if not product:
-            print(f">>> Produto {product_id} não encontrado para tópico {topic}")
-            return
-
-        # CHAMADA DIRETA (sem try/except engolindo erro)
-        print(">>> Chamando apply_operational_delta() para produto", product_id)
-        res = apply_operational_delta(
-            product=product,
-            delta=data,
-            source="broker",
-            source_channel="mqtt_backend",
-            actor_id=None,
-            actor_name=None,
-            notes="Atualização de dados operacionais via MQTT backend",
-            raw_topic=topic,
-            raw_payload=payload,
-        )
-        print(">>> apply_operational_delta() retornou:", res)
+        print(f">>> MQTT msg recebida em {topic}: {payload}")
+        handle_operational_message(topic, payload, batch_writer=batch_writer)
 
     def worker_loop():
         nonlocal broker_host, broker_port
@@ -83,7 +244,7 @@ def worker_loop():
             try:
                 client_id = f"django-backend-{random.randint(1000, 9999)}"
                 print(">>> Criando cliente MQTT", client_id)
-                client = mqtt.Client(client_id=client_id)
+                client = create_client(client_id)
                 client.on_connect = on_connect
                 client.on_message = on_message
 
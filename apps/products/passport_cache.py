@@ -0,0 +1,183 @@
+# apps/products/passport_cache.py
+"""
+Cache de leitura do passaporte público (a página aberta pelo QR code).
+
+Cada produto tem uma entrada com o JSON do produto e as páginas já
+renderizadas (uma por idioma), marcada com a versão do documento
+(apps.products.conditional.product_version: updatedAt + digest de
+operationalData). A view lê a versão atual numa consulta com projeção
+(a mesma que gera o ETag) e só serve entradas da mesma versão.
+
+A entrada também é removida em todo `Products.save()` e nas escritas
+diretas de operationalData (services / batch_writer), para não ocupar
+espaço até o TTL.
+
+Backends (PASSPORT_CACHE_BACKEND):
+- "locmem": LRU em memória do processo (cada worker do gunicorn tem o seu);
+- "django": um cache do Django (CACHES[PASSPORT_CACHE_ALIAS]), ex: arquivo
+  ou Redis, compartilhado entre workers;
+- "off": desligado.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from bson import ObjectId
+from django.conf import settings
+
+from apps.products.conditional import find_version, product_version
+from apps.products.listing import public_passport_filter
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "passport:"
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class LocalLRUBackend:
+    """LRU em memória com TTL; descarta a entrada menos usada quando cheio."""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max(1, int(max_entries))
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int]) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend:
+    """Adapta um cache do Django (CACHES[alias]) à mesma interface."""
+
+    def __init__(self, alias: str):
+        from django.core.cache import caches
+
+        self._cache = caches[alias]
+
+    def get(self, key: str) -> Any:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: Any, ttl: Optional[int]) -> None:
+        self._cache.set(key, value, timeout=ttl or None)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+class PassportCache:
+    def __init__(self, backend, ttl: Optional[int] = 300):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(product_id) -> str:
+        product_id = str(product_id)
+        if ObjectId.is_valid(product_id):
+            product_id = str(ObjectId(product_id))
+        return f"{KEY_PREFIX}{product_id}"
+
+    @staticmethod
+    def current_stamp(product_id) -> Optional[str]:
+        """Versão atual do passaporte público, ou None se o produto não existe ou está inativo."""
+        if not ObjectId.is_valid(str(product_id)):
+            return None
+        raw = find_version(public_passport_filter(ObjectId(str(product_id))))
+        return product_version(raw) if raw else None
+
+    def get(self, product_id, stamp: Optional[str]) -> Optional[dict]:
+        try:
+            entry = self.backend.get(self._key(product_id))
+        except Exception:
+            logger.warning("Falha ao ler o cache do passaporte %s", product_id, exc_info=True)
+            return None
+        if not entry:
+            return None
+        if entry.get("stamp") != stamp:
+            return None
+        return entry
+
+    def put(self, product_id, stamp: Optional[str], *, product_json: str,
+            language: Optional[str] = None, page: Optional[bytes] = None) -> None:
+        """Grava/atualiza a entrada; páginas de outros idiomas da mesma versão são mantidas."""
+        entry = self.get(product_id, stamp) or {}
+        pages = dict(entry.get("pages") or {})
+        if page is not None:
+            pages[language or ""] = page
+        try:
+            self.backend.set(
+                self._key(product_id),
+                {"stamp": stamp, "json": product_json, "pages": pages},
+                self.ttl,
+            )
+        except Exception:
+            logger.warning("Falha ao gravar o cache do passaporte %s", product_id, exc_info=True)
+
+    def invalidate(self, product_id) -> None:
+        try:
+            self.backend.delete(self._key(product_id))
+        except Exception:
+            logger.warning("Falha ao invalidar o cache do passaporte %s", product_id, exc_info=True)
+
+
+def _build_cache() -> Optional[PassportCache]:
+    backend_name = str(getattr(settings, "PASSPORT_CACHE_BACKEND", "locmem")).lower()
+    if backend_name in ("off", "none", ""):
+        return None
+    if backend_name == "django":
+        backend = DjangoCacheBackend(getattr(settings, "PASSPORT_CACHE_ALIAS", "passport"))
+    elif backend_name == "locmem":
+        backend = LocalLRUBackend(getattr(settings, "PASSPORT_CACHE_MAX_ENTRIES", 1000))
+    else:
+        raise ValueError(f"PASSPORT_CACHE_BACKEND inválido: {backend_name!r}")
+    return PassportCache(backend, ttl=getattr(settings, "PASSPORT_CACHE_TTL", 300))
+
+
+def get_passport_cache() -> Optional[PassportCache]:
+    """Cache configurado em settings (None quando desligado)."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = _build_cache() or False
+    return _cache or None
+
+
+def invalidate_passport(product_id) -> None:
+    """Remove o passaporte em cache do produto (chamado a cada escrita no produto)."""
+    if product_id is None:
+        return
+    cache = get_passport_cache()
+    if cache is not None:
+        cache.invalidate(product_id)
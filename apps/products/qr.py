@@ -0,0 +1,110 @@
+# apps/products/qr.py
+"""
+QR code do passaporte público gerado no servidor (`qrcode`, já em requirements).
+
+O conteúdo do QR é só a URL pública do passaporte
+(`PASSPORT_BASE_URL` + /products/passport/<id>/; sem a setting, o host da
+requisição), então a imagem depende apenas de (URL, formato, tamanho). Ela é
+gerada uma vez e guardada em QR_CACHE_DIR com o hash dessa chave no nome;
+como a chave não muda, o navegador pode guardar por QR_CACHE_MAX_AGE e o
+ETag é a própria chave (revalida sem ler o disco).
+
+Mesma correção de erro (H) e margem do QR que o conveyor-passport.js desenhava.
+"""
+import hashlib
+import io
+import os
+import uuid
+from typing import Optional
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.urls import reverse
+
+QR_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+QR_DEFAULT_SIZE = 300
+QR_MIN_SIZE = 64
+QR_MAX_SIZE = 2048
+QR_BORDER = 4
+
+
+def passport_url(product_id, request=None) -> str:
+    """URL absoluta do passaporte público (o texto do QR)."""
+    path = reverse("passport_public", args=[str(product_id)])
+    base = getattr(settings, "PASSPORT_BASE_URL", "")
+    if base:
+        return base.rstrip("/") + path
+    if request is None:
+        raise ValueError("PASSPORT_BASE_URL não configurada e sem requisição para montar a URL.")
+    return request.build_absolute_uri(path)
+
+
+def parse_size(value: Optional[str]) -> int:
+    """Lado em pixels (PNG); ValueError fora de QR_MIN_SIZE..QR_MAX_SIZE."""
+    if value in (None, ""):
+        return QR_DEFAULT_SIZE
+    size = int(value)
+    if not QR_MIN_SIZE <= size <= QR_MAX_SIZE:
+        raise ValueError(f"size deve estar entre {QR_MIN_SIZE} e {QR_MAX_SIZE}")
+    return size
+
+
+def qr_cache_key(url: str, fmt: str, size: int) -> str:
+    # SVG é vetorial: o tamanho não muda o arquivo
+    return hashlib.sha1(f"{url}|{fmt}|{size if fmt == 'png' else 0}".encode("utf-8")).hexdigest()
+
+
+def _matrix(url: str) -> qrcode.QRCode:
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_H, border=QR_BORDER)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr
+
+
+def qr_image(url: str, size: int = QR_DEFAULT_SIZE):
+    """
+    QR de `url` como imagem Pillow (modo "1"). Cada módulo tem um número
+    inteiro de pixels (sem borrar), então o lado final é o maior múltiplo que
+    cabe em `size`.
+    """
+    qr = _matrix(url)
+    qr.box_size = max(1, size // (qr.modules_count + 2 * QR_BORDER))
+    return qr.make_image(fill_color="black", back_color="white").get_image()
+
+
+def render_qr(url: str, fmt: str = "png", size: int = QR_DEFAULT_SIZE) -> bytes:
+    """QR de `url` em `fmt` (bytes do PNG ou do SVG)."""
+    out = io.BytesIO()
+    if fmt == "svg":
+        qr = _matrix(url)
+        qr.box_size = 10
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(out)
+        return out.getvalue()
+    qr_image(url, size).save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(settings.QR_CACHE_DIR, key[:2], key)
+
+
+def get_or_create_qr(url: str, fmt: str = "png", size: int = QR_DEFAULT_SIZE) -> bytes:
+    """Bytes do QR, do cache em disco ou gerados (e gravados) agora."""
+    path = _cache_path(qr_cache_key(url, fmt, size))
+    try:
+        with open(path, "rb") as fh:
+            return fh.read()
+    except FileNotFoundError:
+        pass
+    data = render_qr(url, fmt, size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return data
@@ -0,0 +1,230 @@
+# apps/products/rollups.py
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from mongoengine.connection import get_db
+from pymongo import ASCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Buckets do mais fino para o mais grosso (segundos por bucket)
+BUCKETS = (
+    ("minute", 60),
+    ("hour", 3600),
+    ("day", 86400),
+)
+BUCKET_SECONDS = dict(BUCKETS)
+
+WATERMARK_ID = "watermark"
+
+_ready = False
+_ready_lock = threading.Lock()
+
+
+def rollup_mode() -> str:
+    """"ingest" (atualiza ao gravar), "catchup" (job `rollup_telemetry`) ou "off"."""
+    return getattr(settings, "TELEMETRY_ROLLUP_MODE", "ingest")
+
+
+def _collection_name() -> str:
+    return getattr(settings, "TELEMETRY_ROLLUP_COLLECTION", "products_telemetry_rollup")
+
+
+def rollup_collection():
+    global _ready
+    coll = get_db()[_collection_name()]
+    if not _ready:
+        with _ready_lock:
+            if not _ready:
+                coll.create_index(
+                    [("productId", ASCENDING), ("bucket", ASCENDING), ("start", ASCENDING)],
+                    unique=True,
+                )
+                _ready = True
+    return coll
+
+
+def _state_collection():
+    return get_db()[f"{_collection_name()}_state"]
+
+
+def _as_utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def bucket_start(ts: datetime, bucket: str) -> datetime:
+    ts = _as_utc(ts)
+    if bucket == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if bucket == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _numeric_metrics(delta: Dict[str, Any]):
+    for key, value in (delta or {}).items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if not isinstance(key, str) or not key or "." in key or key.startswith("$"):
+            continue
+        yield key, value
+
+
+def build_rollup_ops(points: Iterable[Tuple[str, Dict[str, Any], datetime]]) -> List[UpdateOne]:
+    """
+    Agrega os pontos em memória por (produto, bucket, início) e gera um upsert
+    por grupo com $inc (sum/count), $min, $max e $set (last).
+    """
+    groups: Dict[tuple, Dict[str, dict]] = {}
+    for product_id, delta, received_at in points:
+        received_at = _as_utc(received_at or datetime.now(timezone.utc))
+        metrics = list(_numeric_metrics(delta))
+        if not metrics:
+            continue
+        for bucket, _ in BUCKETS:
+            key = (str(product_id), bucket, bucket_start(received_at, bucket))
+            group = groups.setdefault(key, {})
+            for name, value in metrics:
+                agg = group.get(name)
+                if agg is None:
+                    group[name] = {"min": value, "max": value, "sum": value, "count": 1,
+                                   "last": value, "lastAt": received_at}
+                    continue
+                agg["min"] = min(agg["min"], value)
+                agg["max"] = max(agg["max"], value)
+                agg["sum"] += value
+                agg["count"] += 1
+                if received_at >= agg["lastAt"]:
+                    agg["last"], agg["lastAt"] = value, received_at
+
+    ops = []
+    for (product_id, bucket, start), group in groups.items():
+        inc, mins, maxs, sets = {}, {}, {}, {}
+        for name, agg in group.items():
+            prefix = f"metrics.{name}"
+            inc[f"{prefix}.sum"] = agg["sum"]
+            inc[f"{prefix}.count"] = agg["count"]
+            mins[f"{prefix}.min"] = agg["min"]
+            maxs[f"{prefix}.max"] = agg["max"]
+            sets[f"{prefix}.last"] = agg["last"]
+            sets[f"{prefix}.lastAt"] = agg["lastAt"]
+        ops.append(UpdateOne(
+            {"productId": product_id, "bucket": bucket, "start": start},
+            {"$inc": inc, "$min": mins, "$max": maxs, "$set": sets},
+            upsert=True,
+        ))
+    return ops
+
+
+def apply_rollups(points: Iterable[Tuple[str, Dict[str, Any], datetime]]) -> int:
+    """Atualiza os rollups com os pontos dados. Retorna o número de upserts."""
+    ops = build_rollup_ops(points)
+    if ops:
+        rollup_collection().bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+# ---------------- catch-up com watermark ----------------
+
+def get_watermark() -> Optional[datetime]:
+    doc = _state_collection().find_one({"_id": WATERMARK_ID})
+    return _as_utc(doc["receivedAt"]) if doc and doc.get("receivedAt") else None
+
+
+def set_watermark(value: Optional[datetime]):
+    _state_collection().update_one(
+        {"_id": WATERMARK_ID}, {"$set": {"receivedAt": value}}, upsert=True
+    )
+
+
+def catch_up_rollups(*, lag_seconds: int = 10, window: timedelta = timedelta(hours=1)) -> dict:
+    """
+    Processa a telemetria bruta posterior ao watermark, em janelas de tempo.
+
+    - Cada janela é lida em streaming e agregada em memória (o volume em
+      memória é proporcional a produtos x buckets, não a pontos).
+    - O watermark só avança depois que a janela foi gravada, então uma queda
+      no meio repete no máximo a janela corrente.
+    - `lag_seconds` evita fechar pontos que ainda podem estar chegando.
+    """
+    from apps.products.telemetry import telemetry_collection
+
+    raw = telemetry_collection()
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=lag_seconds)
+    watermark = get_watermark()
+    if watermark is None:
+        first = raw.find_one({}, {"receivedAt": 1}, sort=[("receivedAt", ASCENDING)])
+        if not first:
+            return {"points": 0, "upserts": 0, "watermark": None}
+        watermark = _as_utc(first["receivedAt"]) - timedelta(microseconds=1)
+
+    points_total = upserts_total = 0
+    while watermark < cutoff:
+        window_end = min(watermark + window, cutoff)
+        cursor = raw.find(
+            {"receivedAt": {"$gt": watermark, "$lte": window_end}},
+            {"_id": 0, "productId": 1, "receivedAt": 1, "data": 1},
+        )
+        batch = [(doc["productId"], doc.get("data") or {}, doc["receivedAt"]) for doc in cursor]
+        upserts_total += apply_rollups(batch)
+        points_total += len(batch)
+        watermark = window_end
+        set_watermark(watermark)
+
+    return {"points": points_total, "upserts": upserts_total, "watermark": watermark}
+
+
+# ---------------- leitura ----------------
+
+def pick_bucket(start: datetime, end: datetime, max_points: int = 500) -> str:
+    """Menor bucket cujo número de pontos no intervalo cabe em `max_points`."""
+    span = (end - start).total_seconds()
+    for bucket, seconds in BUCKETS:
+        if span / seconds <= max_points:
+            return bucket
+    return BUCKETS[-1][0]
+
+
+def query_rollups(
+    product_id: str,
+    *,
+    bucket: str,
+    start: datetime,
+    end: datetime,
+    fields: Optional[List[str]] = None,
+) -> List[dict]:
+    """Buckets do produto no intervalo, com min/max/mean/count/last por métrica."""
+    projection = {"_id": 0, "start": 1}
+    if fields:
+        for f in fields:
+            projection[f"metrics.{f}"] = 1
+    else:
+        projection["metrics"] = 1
+
+    cursor = rollup_collection().find(
+        {
+            "productId": str(product_id),
+            "bucket": bucket,
+            "start": {"$gte": bucket_start(start, bucket), "$lt": end},
+        },
+        projection,
+    ).sort("start", ASCENDING)
+
+    out = []
+    for doc in cursor:
+        row = {"start": _as_utc(doc["start"])}
+        for name, agg in (doc.get("metrics") or {}).items():
+            count = agg.get("count") or 0
+            row[name] = {
+                "min": agg.get("min"),
+                "max": agg.get("max"),
+                "mean": (agg.get("sum") or 0) / count if count else None,
+                "count": count,
+                "last": agg.get("last"),
+            }
+        if len(row) > 1:
+            out.append(row)
+    return out
@@ -1,7 +1,51 @@
 # apps/products/services.py
-from apps.tracking.utils import log_product_audit
+import logging
+from copy import deepcopy
+from datetime import datetime
 from typing import Dict, Any, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+from apps.tracking.utils import log_operational_audit, log_product_audit, operational_audit_mode
 from apps.products.models import Products, UsageData
+from apps.products.passport_cache import invalidate_passport
+from apps.products.telemetry import record_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Caminho do dict de telemetria dentro do documento de Products
+OPERATIONAL_PATH = "usageData.operationalData"
+
+# Código do Mongo quando o $set cai em um pai nulo (ex: usageData = null)
+PATH_NOT_VIABLE = 28
+
+
+def clean_operational_delta(delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Descarta chaves que o Mongo não aceita em caminhos (vazias, com "." ou "$")."""
+    return {
+        key: value
+        for key, value in (delta or {}).items()
+        if isinstance(key, str) and key and "." not in key and not key.startswith("$")
+    }
+
+
+def operational_set_doc(delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte um delta em caminhos `$set` por chave de operationalData."""
+    return {f"{OPERATIONAL_PATH}.{key}": value for key, value in clean_operational_delta(delta).items()}
+
+
+def ensure_operational_container(collection, product_oid) -> None:
+    """
+    Garante que usageData e usageData.operationalData sejam dicts no documento,
+    para que os `$set` por chave possam ser aplicados.
+    """
+    collection.update_one({"_id": product_oid, "usageData": None}, {"$set": {"usageData": {}}})
+    collection.update_one(
+        {"_id": product_oid, OPERATIONAL_PATH: None},
+        {"$set": {OPERATIONAL_PATH: {}}},
+    )
 
 def apply_product_update_from_payload(
     *,
@@ -41,77 +85,101 @@ def apply_product_update_from_payload(
     return {"changed": True, "product": product}
 
 
+def _set_operational_atomic(collection, product_oid, set_doc: Dict[str, Any], projection=None):
+    """
+    Aplica o `$set` numa única ida ao Mongo e devolve o documento ANTES da escrita
+    (None = produto não existe).
+
+    O filtro é só o _id: quem chama compara o "antes" com o delta para saber
+    se algo mudou (um `$set` com os mesmos valores não escreve nada no Mongo).
+    `projection` limita o que volta do "antes" (a auditoria enxuta só precisa
+    de operationalData).
+    """
+    query = {"_id": product_oid}
+    try:
+        return collection.find_one_and_update(
+            query, {"$set": set_doc}, projection=projection, return_document=ReturnDocument.BEFORE
+        )
+    except OperationFailure as exc:
+        if exc.code != PATH_NOT_VIABLE:
+            raise
+        # usageData/operationalData nulos: cria o container e tenta de novo
+        ensure_operational_container(collection, product_oid)
+        return collection.find_one_and_update(
+            query, {"$set": set_doc}, projection=projection, return_document=ReturnDocument.BEFORE
+        )
+
+
 def apply_operational_delta(
     *,
-    product: Products,
     delta: Dict[str, Any],
     source: str,
     source_channel: str,
+    product: Optional[Products] = None,
+    product_id: Optional[str] = None,
     actor_id: Optional[str] = None,
     actor_name: Optional[str] = None,
     notes: Optional[str] = None,
     raw_topic: Optional[str] = None,
     raw_payload: Optional[str] = None,
+    received_at: Optional[datetime] = None,
 ):
-    print(">>> apply_operational_delta() chamado para product:", product.id)
-    print(">>> delta recebido:", delta)
-
-    if not delta:
-        print(">>> delta vazio, nada a fazer.")
-        return {"changed": False, "product": product}
-
-    # Snapshot ANTES
-    previous_data = product.to_mongo().to_dict()
-    print(">>> ANTES, usageData no snapshot:", previous_data.get("usageData"))
-
-    # Garante que usageData existe
-    usage = getattr(product, "usageData", None)
-    if usage is None:
-        print(">>> usageData era None, criando novo UsageData()")
-        usage = UsageData()
-        product.usageData = usage
-
-    # Transformar usageData.operationalData em dict normal
-    current_operational = getattr(usage, "operationalData", None)
-    if current_operational is None:
-        current_operational = {}
+    """
+    Aplica um delta em usageData.operationalData com um único find_one_and_update.
+
+    - Aceita o documento (`product`) ou só o id (`product_id`); não é preciso
+      carregar o produto antes.
+    - O estado "antes" para auditoria vem da própria escrita (ReturnDocument.BEFORE).
+    - Se nenhuma chave muda de valor (o "antes" já tem os mesmos valores;
+      chave ausente -> None conta como mudança), não há auditoria.
+    - Todo delta de um produto existente vai também para o histórico time-series.
+    - A auditoria segue OPERATIONAL_AUDIT_MODE; só o modo "full" guarda os
+      snapshots completos do produto (e por isso só ele lê o documento inteiro).
+    """
+    if product is not None:
+        product_oid = product.id
+    elif product_id and ObjectId.is_valid(str(product_id)):
+        product_oid = ObjectId(str(product_id))
     else:
-        if hasattr(current_operational, "to_mongo"):
-            current_operational = current_operational.to_mongo().to_dict()
-        elif not isinstance(current_operational, dict):
-            current_operational = dict(current_operational)
+        return {"changed": False, "found": False, "product": None, "operationalData": None}
 
-    print(">>> current_operational:", current_operational)
+    delta = clean_operational_delta(delta)
+    set_doc = operational_set_doc(delta)
+    if not set_doc:
+        return {"changed": False, "found": True, "product": product, "operationalData": None}
 
-    # Merge do delta em cima do estado atual
-    new_operational = {**current_operational, **delta}
-    print(">>> new_operational:", new_operational)
+    audit_mode = operational_audit_mode()
+    projection = None if audit_mode == "full" else {OPERATIONAL_PATH: 1}
 
-    # Se nada mudou de fato, nem salva nem audita
-    if new_operational == current_operational:
-        print(">>> new_operational == current_operational -> nada mudou, abortando.")
-        return {"changed": False, "product": product}
+    collection = Products._get_collection()
+    before = _set_operational_atomic(collection, product_oid, set_doc, projection)
 
-    # Atribui de volta
-    usage.operationalData = new_operational
-    product.usageData = usage
+    if before is None:
+        logger.debug("Produto %s não encontrado para o delta operacional", product_oid)
+        return {"changed": False, "found": False, "product": product, "operationalData": None}
 
-    print(
-        ">>> ANTES DO SAVE, product.usageData.operationalData (em memória):",
-        getattr(product.usageData, "operationalData", None),
-    )
+    record_telemetry(str(product_oid), delta, received_at=received_at)
 
-    # SALVA PRIMEIRO
-    product.save()
-    print(">>> product.save() chamado")
+    previous_data = before
+    previous_usage = previous_data.get("usageData") or {}
+    previous_operational = previous_usage.get("operationalData") or {}
+    if all(key in previous_operational and previous_operational[key] == value for key, value in delta.items()):
+        logger.debug("Delta sem mudanças para produto %s", product_oid)
+        return {"changed": False, "found": True, "product": product, "operationalData": None}
 
-    # RECARREGA DO MONGO E MOSTRA O QUE VOLTOU
-    product.reload()
-    snap_after = product.to_mongo().to_dict()
-    print(">>> DEPOIS DO SAVE+RELOAD, usageData:", snap_after.get("usageData"))
+    invalidate_passport(product_oid)
+    new_operational = {**previous_operational, **delta}
 
-    # Snapshot DEPOIS
-    new_data = snap_after
+    new_data = None
+    if audit_mode == "full":
+        new_data = deepcopy(previous_data)
+        new_data["usageData"] = {**previous_usage, "operationalData": new_operational}
+
+    # Mantém o documento em memória (se houver) coerente com o banco
+    if product is not None:
+        if product.usageData is None:
+            product.usageData = UsageData()
+        product.usageData.operationalData = new_operational
 
     # Monta notes final (inclui info crua do MQTT se existir)
     base_notes = notes or "Atualização de dados operacionais via MQTT/HTTP bridge"
@@ -123,25 +191,24 @@ def apply_operational_delta(
             extras.append(f"payload={raw_payload}")
         base_notes = f"{base_notes} | " + " ".join(extras)
 
-    audit = log_product_audit(
-        instance=product,
-        event_type="update",
+    audit = log_operational_audit(
+        product_id=str(product_oid),
+        previous_ops=previous_operational,
+        new_ops=new_operational,
         source=source,
         source_channel=source_channel,
         actor_id=actor_id,
         actor_name=actor_name,
-        previous_data=previous_data,
+        previous_data=previous_data if new_data is not None else None,
         new_data=new_data,
-        lifecycle_category="other",
-        lifecycle_type="operational_data_update",
-        related_product_id=None,
         notes=base_notes,
+        mode=audit_mode,
     )
 
-    print(">>> log_product_audit criado, id:", getattr(audit, "id", None))
-
     return {
         "changed": True,
+        "found": True,
         "product": product,
-        "audit_id": str(getattr(audit, "id", "")),
+        "operationalData": new_operational,
+        "audit_id": str(audit.id) if audit is not None else None,
     }
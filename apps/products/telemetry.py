@@ -0,0 +1,157 @@
+# apps/products/telemetry.py
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from mongoengine.connection import get_db
+from pymongo import ASCENDING
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from apps.products.rollups import apply_rollups, rollup_mode
+
+logger = logging.getLogger(__name__)
+
+_ready = False
+_ready_lock = threading.Lock()
+
+
+def _now_utc():
+    return datetime.now(timezone.utc)
+
+
+def telemetry_enabled() -> bool:
+    return bool(getattr(settings, "TELEMETRY_ENABLED", True))
+
+
+def _collection_name() -> str:
+    return getattr(settings, "TELEMETRY_COLLECTION", "products_telemetry")
+
+
+def ensure_telemetry_collection():
+    """
+    Cria a coleção time-series (metaField = productId, timeField = receivedAt).
+
+    Se já existe, só ajusta a expiração. Em Mongo < 5.0 (sem time-series)
+    cai para uma coleção comum com índice (productId, receivedAt) e TTL.
+    """
+    db = get_db()
+    name = _collection_name()
+    granularity = getattr(settings, "TELEMETRY_GRANULARITY", "seconds")
+    expire = getattr(settings, "TELEMETRY_EXPIRE_SECONDS", None)
+
+    options = {
+        "timeseries": {"timeField": "receivedAt", "metaField": "productId", "granularity": granularity},
+    }
+    if expire:
+        options["expireAfterSeconds"] = int(expire)
+
+    try:
+        db.create_collection(name, **options)
+        logger.info("Coleção time-series %s criada (granularity=%s, expire=%s)", name, granularity, expire)
+    except CollectionInvalid:
+        # Já existe: mantém a expiração alinhada com o settings
+        if expire:
+            try:
+                db.command("collMod", name, expireAfterSeconds=int(expire))
+            except OperationFailure as exc:
+                logger.warning("Não foi possível ajustar a expiração de %s: %s", name, exc)
+    except OperationFailure as exc:
+        logger.warning("Time-series indisponível (%s); usando coleção comum para %s", exc, name)
+        coll = db[name]
+        coll.create_index([("productId", ASCENDING), ("receivedAt", ASCENDING)])
+        if expire:
+            coll.create_index("receivedAt", expireAfterSeconds=int(expire), name="receivedAt_ttl")
+    return db[name]
+
+
+def telemetry_collection():
+    global _ready
+    if not _ready:
+        with _ready_lock:
+            if not _ready:
+                ensure_telemetry_collection()
+                _ready = True
+    return get_db()[_collection_name()]
+
+
+def _point(product_id: str, delta: Dict[str, Any], received_at: Optional[datetime]) -> dict:
+    return {
+        "productId": str(product_id),
+        "receivedAt": received_at or _now_utc(),
+        "data": delta,
+    }
+
+
+def record_telemetry(product_id: str, delta: Dict[str, Any], *, received_at: Optional[datetime] = None):
+    """Grava um ponto de telemetria (um delta recebido)."""
+    if not delta or not telemetry_enabled():
+        return
+    point = _point(product_id, delta, received_at)
+    try:
+        telemetry_collection().insert_one(point)
+    except Exception:
+        # Histórico não pode derrubar a atualização do passaporte
+        logger.exception("Falha ao gravar telemetria do produto %s", product_id)
+        return
+    _update_rollups([point])
+
+
+def record_telemetry_many(points: Iterable[Tuple[str, Dict[str, Any], Optional[datetime]]]):
+    """Grava vários pontos (product_id, delta, received_at) num único insert_many."""
+    if not telemetry_enabled():
+        return
+    docs = [_point(pid, delta, ts) for pid, delta, ts in points if delta]
+    if not docs:
+        return
+    try:
+        telemetry_collection().insert_many(docs, ordered=False)
+    except Exception:
+        logger.exception("Falha ao gravar lote de telemetria (%d pontos)", len(docs))
+        return
+    _update_rollups(docs)
+
+
+def _update_rollups(docs: List[dict]):
+    """Rollups incrementais no momento da ingestão (TELEMETRY_ROLLUP_MODE = "ingest")."""
+    if rollup_mode() != "ingest":
+        return
+    try:
+        apply_rollups((d["productId"], d["data"], d["receivedAt"]) for d in docs)
+    except Exception:
+        logger.exception("Falha ao atualizar rollups de telemetria")
+
+
+def query_telemetry(
+    product_id: str,
+    *,
+    start: datetime,
+    end: datetime,
+    fields: Optional[List[str]] = None,
+    limit: int = 5000,
+) -> List[dict]:
+    """Pontos de um produto no intervalo [start, end), em ordem cronológica."""
+    projection = {"_id": 0, "receivedAt": 1}
+    if fields:
+        for f in fields:
+            projection[f"data.{f}"] = 1
+    else:
+        projection["data"] = 1
+
+    cursor = (
+        telemetry_collection()
+        .find({"productId": str(product_id), "receivedAt": {"$gte": start, "$lt": end}}, projection)
+        .sort("receivedAt", ASCENDING)
+        .limit(limit)
+    )
+    out = []
+    for doc in cursor:
+        data = doc.get("data") or {}
+        if fields and not data:
+            continue
+        received_at = doc["receivedAt"]
+        if received_at.tzinfo is None:
+            received_at = received_at.replace(tzinfo=timezone.utc)
+        out.append({"receivedAt": received_at, **data})
+    return out
@@ -1,3 +1,76 @@
-from django.test import TestCase
+import json
+import random
+from datetime import datetime, timezone
+from unittest import mock
 
-# Create your tests here.
+from bson import ObjectId
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import SimpleTestCase
+
+from apps.products import fast_serializers
+from apps.products.fast_serializers import dumps, serialize_product, serialize_products
+from apps.products.management.commands.bench_serialization import synthetic_product
+from apps.products.models import Products, UsageAttachment
+from apps.products.serializers import ProductsSerializer
+
+FIXED_NOW = datetime(2024, 6, 1, 12, 30, tzinfo=timezone.utc)
+
+
+class FastSerializationParityTests(SimpleTestCase):
+    """
+    serialize_product(raw) tem de gerar o mesmo JSON (chaves, ordem e valores)
+    que ProductsSerializer(Products._from_son(raw)).data.
+
+    Campos ausentes ou nulos com default "agora" (createdAt, uploadedAt)
+    recebem um relógio fixo nos dois caminhos, para poderem ser comparados.
+    """
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(Products._fields["createdAt"], "default", lambda: FIXED_NOW.replace(tzinfo=None)),
+            mock.patch.object(UsageAttachment._fields["uploadedAt"], "default", lambda: FIXED_NOW),
+            mock.patch.object(fast_serializers, "_plan", None),  # o plano guarda os defaults
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertParity(self, raw):
+        expected = json.loads(json.dumps(ProductsSerializer(Products._from_son(raw)).data, cls=DjangoJSONEncoder))
+        got = json.loads(dumps(serialize_product(raw)))
+        self.assertEqual(got, expected)
+        self.assertEqual(list(got), list(expected))
+
+    def test_minimal_document(self):
+        self.assertParity({"_id": ObjectId(), "identification": {"brandName": "ACME", "modelName": "E1"}})
+
+    def test_top_level_nulls(self):
+        raw = {"_id": ObjectId(), "identification": {"brandName": "ACME", "modelName": "E1", "isActive": None}}
+        for name in ProductsSerializer().fields:
+            if name not in ("id", "_id", "identification"):
+                raw[name] = None
+        self.assertParity(raw)
+
+    def test_attachment_uploaded_at_missing_or_null(self):
+        attachments = [
+            {"attachmentId": "a1"},
+            {"attachmentId": "a2", "uploadedAt": None, "filename": None, "size": None},
+            {"attachmentId": "a3", "uploadedAt": datetime(2024, 1, 2, 3, 4, 5), "filename": "laudo.pdf"},
+        ]
+        self.assertParity({
+            "_id": ObjectId(),
+            "identification": {"brandName": "ACME", "modelName": "E1"},
+            "createdAt": None,
+            "usageData": {"maintenanceHistory": [{"type": "preventiva", "attachments": attachments}, {}]},
+        })
+
+    def test_synthetic_documents(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            raw = synthetic_product(rng, history=6)
+            with self.subTest(id=str(raw["_id"])):
+                self.assertParity(raw)
+
+    def test_serialize_products_matches_single(self):
+        rng = random.Random(7)
+        raws = [synthetic_product(rng, history=2) for _ in range(5)]
+        self.assertEqual(serialize_products(raws), [serialize_product(raw) for raw in raws])
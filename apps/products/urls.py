@@ -1,6 +1,6 @@
-from django.urls import path
+from django.urls import path, re_path
 from rest_framework.routers import DefaultRouter
-from .views import ProductsViews, product_details, ProductsViewSet, passport_public
+from .views import ProductsViews, product_details, ProductsViewSet, passport_public, passport_qr
 
 router = DefaultRouter()
 router.register(r'api/products', ProductsViewSet, basename='products')
@@ -9,5 +9,6 @@
     path('', ProductsViews.as_view(template_name='products.html'), name='products'),
     path('products/<str:product_id>/', product_details, name='product_details'),
     path('passport/<str:product_id>/', passport_public, name='passport_public'),
+    re_path(r'^passport/(?P<product_id>[^/]+)/qr\.(?P<qr_format>png|svg)$', passport_qr, name='passport_qr'),
     
 ] + router.urls
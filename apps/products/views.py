@@ -4,14 +4,20 @@
 from apps.utils.menu_utils import get_menu_items
 from rest_framework import viewsets, status
 from apps.products.serializers import ProductsSerializer
+from apps.accounts.profiles import actor_info, get_profile
 from rest_framework.response import Response
 from apps.products.models import Products, UsageData, MaintenanceItem, RepairItem, UsageAttachment
 from rest_framework.decorators import action
-from django.http import FileResponse, Http404
-import json, os, mimetypes
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+import json, os, mimetypes, tempfile, threading
 from uuid import uuid4
 from django.utils.text import slugify
-from datetime import datetime, timezone
+from django.urls import reverse
+from django.utils.translation import get_language
+from datetime import datetime, timezone, timedelta
+from django.utils.dateparse import parse_date, parse_datetime
+from bson import ObjectId
 from django.contrib.auth.mixins import LoginRequiredMixin 
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
@@ -19,8 +25,28 @@
 import re
 from django.utils.html import mark_safe
 from apps.products.forms import *
-from django.core.serializers.json import DjangoJSONEncoder
 from apps.products.services import apply_operational_delta
+from apps.products.listing import (
+    InvalidListParam, aggregation_candidates_filter, fetch_documents_page, fetch_page, fetch_raw_page, page_query,
+    parse_fields, parse_limit, parse_order, public_passport_filter, visible_filter,
+)
+from apps.products.fast_serializers import (
+    dumps as dumps_json, fast_serialization_enabled, raw_product, serialize_product, serialize_products,
+)
+from apps.products.conditional import (
+    children_versions, find_version, make_etag, not_modified, product_version,
+    set_validators,
+)
+from apps.products import file_store
+from apps.products.attachments import find_attachment
+from apps.products.gridfs_stream import gridfs_response
+from apps.products.images import IMAGE_FORMATS, IMAGE_SIZES, get_or_create_derivative, image_changed, pick_format
+from apps.products.labels import DEFAULT_COLS, DEFAULT_ROWS, label_query, sheet_layout, write_label_sheets
+from apps.products.qr import QR_FORMATS, get_or_create_qr, parse_size, passport_url, qr_cache_key
+from apps.products.passport_cache import PassportCache, get_passport_cache
+from apps.products.telemetry import query_telemetry
+from apps.products.rollups import BUCKET_SECONDS, pick_bucket, query_rollups, rollup_mode
+from apps.tracking.history import product_as_of
 from apps.tracking.utils import log_product_audit
 
 
@@ -36,6 +62,9 @@ def clean_empty_strings(data):
 
 MAX_PDF_MB = 10
 MAX_IMG_MB = 5
+TELEMETRY_DEFAULT_LIMIT = 5000
+TELEMETRY_MAX_LIMIT = 50000
+TELEMETRY_DEFAULT_POINTS = 500
 ALLOWED_IMG_MIME = {"image/png", "image/jpeg", "image/webp"}
 RE_NIF  = re.compile(r"^\d{9}$")
 RE_NISS = re.compile(r"^\d{11}$")
@@ -77,6 +106,22 @@ def _safe_filename(original_name, content_type):
     stem = slugify(os.path.splitext(original_name)[0]) or "file"
     return f"{stem}-{uuid4().hex}{ext}"
 
+def _store_product_file(product, field, upload, replace=False):
+    """
+    Grava `upload` em `product.<field>` (manualFile/imageFile). Nome e tipo
+    ficam no produto: o arquivo no GridFS pode ser de vários produtos.
+    """
+    filename = _safe_filename(upload.name, upload.content_type)
+    save = file_store.replace if replace else file_store.store
+    save(getattr(product, field), upload, content_type=upload.content_type, filename=filename)
+    setattr(product, f"{field}Name", filename)
+    setattr(product, f"{field}ContentType", upload.content_type)
+
+def _product_file_name(product, field, default):
+    # produtos anteriores a manualFileName/imageFileName: nome gravado no próprio GridFS
+    return (getattr(product, f"{field}Name", None)
+            or getattr(getattr(product, field), "filename", None) or default)
+
 # ---------------- sessão/roles ----------------
 
 def _get_current_user_id(request):
@@ -84,13 +129,8 @@ def _get_current_user_id(request):
 
 
 def _get_profile(uid: str):
-    if not uid:
-        return None
-    try:
-        from apps.accounts.models import User 
-        return User.objects(id=uid).only("id", "is_superuser", "is_company").first()
-    except Exception:
-        return None
+    # resolvido uma vez por requisição (apps.accounts.profiles.AccountProfileMiddleware)
+    return get_profile(uid)
 
 def _is_superuser(profile) -> bool:
     return bool(profile and getattr(profile, "is_superuser", False))
@@ -154,9 +194,52 @@ def _inject_usage_attachment_urls(request, product, data):
                     base + att['attachmentId'] + "/"
                 )
 
+def _scan_usage_attachment(pk, attachment_id):
+    """Busca o anexo percorrendo o histórico (produtos sem attachmentIndex)."""
+    product = Products.objects(id=pk).only("usageData").first()
+    u = getattr(product, "usageData", None)
+    if not u:
+        return None
+    for group in (u.maintenanceHistory or [], u.repairHistory or []):
+        for it in group:
+            for a in (it.attachments or []):
+                if a.attachmentId == attachment_id:
+                    return {"file": a.file.grid_id if a.file else None,
+                            "filename": a.filename, "contentType": a.contentType}
+    return None
+
+def _qr_response(request, product_id, qr_format):
+    """QR do passaporte público (apps.products.qr), com cache longo no navegador."""
+    try:
+        size = parse_size(request.GET.get("size"))
+    except ValueError as e:
+        return HttpResponse(f"size inválido: {e}", status=400, content_type="text/plain; charset=utf-8")
+    url = passport_url(product_id, request)
+    etag = make_etag("qr", qr_cache_key(url, qr_format, size), weak=False)
+    cache_control = f"public, max-age={settings.QR_CACHE_MAX_AGE}"
+    response = not_modified(request, etag=etag, cache_control=cache_control)
+    if response is not None:
+        return response
+    response = HttpResponse(get_or_create_qr(url, qr_format, size), content_type=QR_FORMATS[qr_format])
+    return set_validators(response, etag=etag, cache_control=cache_control)
+
 def _now_utc():
     return datetime.now(timezone.utc)
 
+def _parse_query_datetime(value):
+    """Aceita ISO 8601 (data ou data/hora); sem fuso assume UTC."""
+    if not value:
+        return None
+    dt = parse_datetime(value)
+    if dt is None:
+        d = parse_date(value)
+        if d is None:
+            return None
+        dt = datetime(d.year, d.month, d.day)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
 def _prune_by_spec(payload: dict, spec: dict) -> dict:
     if not isinstance(payload, dict) or not isinstance(spec, dict):
         return {}
@@ -263,27 +346,34 @@ def render_custom_fields(fields_config, title=None, icon=None):
     html.append('</div>')
     return mark_safe(''.join(html))
 
-def _get_actor_info(uid: str):
-    if not uid:
-        return None, "Unknown"
+# payloads de form/admin e form/common: {(nome, idioma): (json, etag)}
+_FORM_TABS = {}
+_FORM_TABS_LOCK = threading.Lock()
 
-    try:
-        from apps.accounts.models import User
-        user = User.objects(id=uid).first()
-        if not user:
-            return str(uid), f"User {uid}"
-        
-        # tenta nome completo -> username -> email -> ID
-        name = (
-            getattr(user, "full_name", None)
-            or getattr(user, "name", None)
-            or getattr(user, "username", None)
-            or getattr(user, "email", None)
-            or f"User {uid}"
-        )
-        return str(user.id), name
-    except Exception:
-        return str(uid), f"User {uid}"
+def _form_tabs_response(request, name, build):
+    """
+    As abas dos formulários são iguais para todos os usuários: montadas uma
+    vez por processo (na primeira chamada) e servidas da memória, com ETag do
+    próprio conteúdo. Os Form de apps/products/forms.py só mudam quando o
+    processo recarrega (deploy, autoreload do runserver), o que também
+    esvazia este cache.
+    """
+    key = (name, get_language())
+    entry = _FORM_TABS.get(key)
+    if entry is None:
+        with _FORM_TABS_LOCK:
+            entry = _FORM_TABS.get(key)
+            if entry is None:
+                body = dumps_json({'tabs': build()})
+                entry = _FORM_TABS[key] = (body, make_etag("form", name, body, weak=False))
+    body, etag = entry
+    response = not_modified(request, etag=etag)
+    if response is not None:
+        return response
+    return set_validators(HttpResponse(body, content_type="application/json"), etag=etag)
+
+def _get_actor_info(uid: str):
+    return actor_info(uid)
 
 def _child_summaries_for_aggregate(profile, parent_product, child_ids):
     if not child_ids:
@@ -315,27 +405,52 @@ class ProductsViewSet(LoginRequiredMixin, TemplateView, viewsets.ViewSet):
     serializer_class = ProductsSerializer
 
     def list(self, request):
+        """
+        Listagem paginada por keyset.
+
+        - `view=summary` (padrão): só os campos do card (listing.SUMMARY_FIELDS),
+          lidos crus do pymongo, sem hidratar documentos.
+        - `fields=a,b.c`: projeção pedida pelo cliente (também crua).
+        - `view=full`: documento completo pelo ProductsSerializer.
+        - `limit` (padrão 50, máx. 500), `order` (_id, createdAt, updatedAt;
+          "-" para decrescente) e `cursor` (o `nextCursor` da página anterior).
+        """
         try:
             uid = _get_current_user_id(request)
             profile = _get_profile(uid)
             if not uid or not profile:
                 return Response({"success": False, "detail": "Não autenticado."}, status=status.HTTP_401_UNAUTHORIZED)
 
-            if _is_superuser(profile):
-                qs = Products.objects.filter(identification__isActive=True)
+            params = request.query_params
+            view = (params.get("view") or "summary").lower()
+            if view not in ("summary", "full"):
+                return Response({"success": False, "detail": "'view' inválido (summary, full)."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                fields = parse_fields(params.get("fields"))
+                order_field, desc = parse_order(params.get("order"))
+                limit = parse_limit(params.get("limit"))
+                query = page_query(
+                    visible_filter(profile, _is_superuser(profile)), order_field, desc, params.get("cursor")
+                )
+            except InvalidListParam as e:
+                return Response({"success": False, "detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            if view == "full" and not fields and fast_serialization_enabled():
+                raws, next_cursor = fetch_raw_page(query, field=order_field, desc=desc, limit=limit)
+                data = serialize_products(raws)
+            elif view == "full" and not fields:
+                docs, next_cursor = fetch_documents_page(query, field=order_field, desc=desc, limit=limit)
+                data = self.serializer_class(docs, many=True).data
             else:
-                acc_id = str(profile.id)
-                qs = Products.objects.filter(
-                    identification__isActive=True
-                ).filter(__raw__={
-                    "$or": [
-                        {"createdById": acc_id},
-                        {"ownerUserId": acc_id},
-                    ]
-                })
-
-            serializer = self.serializer_class(qs, many=True)
-            return Response({"success": True, "data": serializer.data}, status=status.HTTP_200_OK)
+                data, next_cursor = fetch_page(query, field=order_field, desc=desc, limit=limit, fields=fields)
+
+            return Response({
+                "success": True,
+                "count": len(data),
+                "nextCursor": next_cursor,
+                "data": data,
+            }, status=status.HTTP_200_OK)
         except Exception as e:
             print(f"Erro no MongoDB: {str(e)}")
             return Response({
@@ -375,11 +490,7 @@ def create(self, request):
                 if not ok:
                     return Response({"success": False, "errors": {"manualFile": [msg]}},
                                     status=status.HTTP_400_BAD_REQUEST)
-                product.manualFile.put(
-                    file,
-                    content_type=file.content_type,
-                    filename=_safe_filename(file.name, file.content_type)
-                )
+                _store_product_file(product, "manualFile", file)
 
             if 'imageFile' in request.FILES:
                 img = request.FILES['imageFile']
@@ -387,16 +498,18 @@ def create(self, request):
                 if not ok:
                     return Response({"success": False, "errors": {"imageFile": [msg]}},
                                     status=status.HTTP_400_BAD_REQUEST)
-                product.imageFile.put(
-                    img,
-                    content_type=img.content_type,
-                    filename=_safe_filename(img.name, img.content_type)
-                )
+                _store_product_file(product, "imageFile", img)
                 product.imageUrl = request.build_absolute_uri(
                     f"/products/api/products/{product.id}/image/"
                 )
 
+            if not product.qr_code:
+                # rota pública (sem login): etiquetas e e-mails
+                product.qr_code = request.build_absolute_uri(reverse("passport_qr", args=[str(product.id), "png"]))
+
             product.save()
+            if product.imageFile:
+                image_changed(new_id=product.imageFile.grid_id)
               # -------- AUDITORIA: snapshot depois --------
             new_data = product.to_mongo().to_dict()
             actor_id, actor_name = _get_actor_info(uid)
@@ -432,38 +545,59 @@ def create(self, request):
 
     def retrieve(self, request, pk=None):
         try:
-            product = Products.objects.get(id=pk)
+            # Versão + permissão numa consulta com projeção: com If-None-Match
+            # igual ao ETag, responde 304 sem ler/serializar o documento.
+            version = find_version({"_id": ObjectId(str(pk))}) if ObjectId.is_valid(str(pk)) else None
+            if version is None:
+                raise Products.DoesNotExist
 
             uid = _get_current_user_id(request)
             profile = _get_profile(uid)
-            if not uid or not profile or not _can_view(profile, product):
+            if not uid or not profile or not _can_view(profile, raw_product(version)):
                 return Response(
                     {"success": False, "detail": "Sem permissão para visualizar este produto."},
                     status=status.HTTP_403_FORBIDDEN
                 )
 
-            serializer = self.serializer_class(product)
-            data = serializer.data
+            etag = make_etag(
+                "product", version["_id"], product_version(version), uid,
+                *children_versions(version.get("childIds") or []),
+            )
+            response = not_modified(request, etag=etag)
+            if response is not None:
+                return response
+
+            if fast_serialization_enabled():
+                raw = Products._get_collection().find_one({"_id": version["_id"]})
+                if raw is None:
+                    raise Products.DoesNotExist
+                product = raw_product(raw)
+                data = serialize_product(raw)
+            else:
+                product = Products.objects.get(id=pk)
+                serializer = self.serializer_class(product)
+                data = serializer.data
 
             if product.imageFile:
                 data['imageUrl'] = request.build_absolute_uri(
                     f"/products/api/products/{product.id}/image/"
                 )
-                data['imageFileName'] = getattr(product.imageFile, "filename", None) or "image"
+                data['imageFileName'] = _product_file_name(product, "imageFile", "image")
 
             if product.manualFile:
                 data['manualUrl'] = request.build_absolute_uri(
                     f"/products/api/products/{product.id}/manual/"
                 )
-                data['manualFileName'] = getattr(product.manualFile, "filename", None) or "manual.pdf"
+                data['manualFileName'] = _product_file_name(product, "manualFile", "manual.pdf")
 
             _inject_usage_attachment_urls(request, product, data)
             
             child_ids = list(getattr(product, "childIds", []) or [])
             data["childSummaries"] = _child_summaries_for_aggregate(profile, product, child_ids)
 
-
-            return Response(data, status=status.HTTP_200_OK)
+            response = Response(data, status=status.HTTP_200_OK)
+            response["Vary"] = "Cookie"
+            return set_validators(response, etag=etag)
 
         except Products.DoesNotExist:
             return Response(
@@ -580,9 +714,10 @@ def _truthy(v): return str(v).lower() in {"1", "true", "on", "yes"}
                                 if att.attachmentId in remove_ids:
                                     try:
                                         if getattr(att, "file", None):
-                                            att.file.delete()
-                                    except Exception:
-                                        pass
+                                            file_store.release(att.file)
+                                    except Exception as e:
+                                        # o anexo sai do produto mesmo assim; o blob fica para o gc_files
+                                        print(f"Erro ao remover anexo {att.attachmentId}: {e}")
                                     continue
                                 kept.append(att)
                             item.attachments = kept
@@ -612,8 +747,8 @@ def _truthy(v): return str(v).lower() in {"1", "true", "on", "yes"}
                     contentType=getattr(file, "content_type", None),
                     size=getattr(file, "size", None),
                 )
-                att.file.put(
-                    file,
+                file_store.store(
+                    att.file, file,
                     content_type=att.contentType or "application/octet-stream",
                     filename=_safe_filename(att.filename or "file", att.contentType or "application/octet-stream"),
                 )
@@ -644,8 +779,8 @@ def _truthy(v): return str(v).lower() in {"1", "true", "on", "yes"}
                     contentType=getattr(file, "content_type", None),
                     size=getattr(file, "size", None),
                 )
-                att.file.put(
-                    file,
+                file_store.store(
+                    att.file, file,
                     content_type=att.contentType or "application/octet-stream",
                     filename=_safe_filename(att.filename or "file", att.contentType or "application/octet-stream"),
                 )
@@ -654,13 +789,17 @@ def _truthy(v): return str(v).lower() in {"1", "true", "on", "yes"}
             updated_product.updatedById = str(uid)
             updated_product.updatedAt = _now_utc()
 
+            old_image_id = updated_product.imageFile.grid_id if updated_product.imageFile else None
+
             # Remover manual / imagem se marcado
             if _truthy(request.data.get("removeManual")) and updated_product.manualFile:
-                updated_product.manualFile.delete()
+                file_store.release(updated_product.manualFile)
                 updated_product.manualFile = None
+                updated_product.manualFileName = updated_product.manualFileContentType = None
             if _truthy(request.data.get("removeImage")) and updated_product.imageFile:
-                updated_product.imageFile.delete()
+                file_store.release(updated_product.imageFile)
                 updated_product.imageFile = None
+                updated_product.imageFileName = updated_product.imageFileContentType = None
                 updated_product.imageUrl = None
 
             # Substituir manualFile / imageFile se enviados (apenas se full ou superuser – opcional)
@@ -675,15 +814,7 @@ def _truthy(v): return str(v).lower() in {"1", "true", "on", "yes"}
                 if not ok:
                     return Response({"success": False, "errors": {"manualFile": [msg]}},
                                     status=status.HTTP_400_BAD_REQUEST)
-                target = updated_product.manualFile
-                if target:
-                    target.replace(file, content_type=file.content_type,
-                                filename=_safe_filename(file.name, file.content_type))
-                else:
-                    updated_product.manualFile.put(
-                        file, content_type=file.content_type,
-                        filename=_safe_filename(file.name, file.content_type)
-                    )
+                _store_product_file(updated_product, "manualFile", file, replace=True)
 
             if "imageFile" in request.FILES:
                 if not full and not _is_superuser(profile):
@@ -696,20 +827,15 @@ def _truthy(v): return str(v).lower() in {"1", "true", "on", "yes"}
                 if not ok:
                     return Response({"success": False, "errors": {"imageFile": [msg]}},
                                     status=status.HTTP_400_BAD_REQUEST)
-                target = updated_product.imageFile
-                if target:
-                    target.replace(img, content_type=img.content_type,
-                                filename=_safe_filename(img.name, img.content_type))
-                else:
-                    updated_product.imageFile.put(
-                        img, content_type=img.content_type,
-                        filename=_safe_filename(img.name, img.content_type)
-                    )
+                _store_product_file(updated_product, "imageFile", img, replace=True)
                 updated_product.imageUrl = request.build_absolute_uri(
                     f"/products/api/products/{updated_product.id}/image/"
                 )
 
             updated_product.save()
+            new_image_id = updated_product.imageFile.grid_id if updated_product.imageFile else None
+            if new_image_id != old_image_id:
+                image_changed(old_id=old_image_id, new_id=new_image_id)
             
             # -------- AUDITORIA: snapshot depois --------
             new_data = updated_product.to_mongo().to_dict()
@@ -738,13 +864,13 @@ def _truthy(v): return str(v).lower() in {"1", "true", "on", "yes"}
                 response_data['imageUrl'] = request.build_absolute_uri(
                     f"/products/api/products/{updated_product.id}/image/"
                 )
-                response_data['imageFileName'] = getattr(updated_product.imageFile, "filename", None) or "image"
+                response_data['imageFileName'] = _product_file_name(updated_product, "imageFile", "image")
 
             if updated_product.manualFile:
                 response_data['manualUrl'] = request.build_absolute_uri(
                     f"/products/api/products/{updated_product.id}/manual/"
                 )
-                response_data['manualFileName'] = getattr(updated_product.manualFile, "filename", None) or "manual.pdf"
+                response_data['manualFileName'] = _product_file_name(updated_product, "manualFile", "manual.pdf")
 
             # Re-injetar URLs dos anexos de usageData
             _inject_usage_attachment_urls(request, updated_product, response_data)
@@ -814,21 +940,112 @@ def manual(self, request, pk=None):
         product = _get_product_or_404(pk)
         if not product.manualFile:
             return Response(status=status.HTTP_404_NOT_FOUND)
-        resp = FileResponse(product.manualFile, content_type='application/pdf')
-        filename = getattr(product.manualFile, "filename", None) or "manual.pdf"
-        resp["Content-Disposition"] = f'inline; filename="{filename}"'
-        return resp
+        filename = _product_file_name(product, "manualFile", "manual.pdf")
+        return gridfs_response(request, product.manualFile.get(), content_type='application/pdf', filename=filename)
 
     @action(detail=True, methods=['get'], url_path='image')
     def image(self, request, pk=None):
+        """
+        Imagem principal. `size=thumb|medium` serve a derivada (apps.products.images);
+        `type=webp|jpeg|png` escolhe a codificação (sem ele, WebP se o Accept permite;
+        `format` não serve, é reservado pelo DRF para escolher o renderer).
+        """
         product = _get_product_or_404(pk)
         if not product.imageFile:
             return Response(status=status.HTTP_404_NOT_FOUND)
-        ct = getattr(product.imageFile, "content_type", None) or "application/octet-stream"
-        resp = FileResponse(product.imageFile, content_type=ct)
-        filename = getattr(product.imageFile, "filename", None) or "image"
-        resp["Content-Disposition"] = f'inline; filename="{filename}"'
-        return resp
+        ct = (product.imageFileContentType or getattr(product.imageFile, "content_type", None)
+              or "application/octet-stream")
+        filename = _product_file_name(product, "imageFile", "image")
+        source = product.imageFile.get()
+
+        size = request.query_params.get("size") or "original"
+        fmt = request.query_params.get("type") or None
+        if size != "original" and size not in IMAGE_SIZES:
+            return Response({"success": False, "error": f"size inválido. Use: original, {', '.join(IMAGE_SIZES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if fmt is not None and fmt not in IMAGE_FORMATS:
+            return Response({"success": False, "error": f"type inválido. Use: {', '.join(IMAGE_FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if size == "original" or source is None:
+            return gridfs_response(request, source, content_type=ct, filename=filename)
+
+        chosen = pick_format(fmt, request.META.get("HTTP_ACCEPT", ""), ct)
+        derivative = get_or_create_derivative(source, size, chosen)
+        if derivative is None:
+            # original que o Pillow não abre: serve como está
+            return gridfs_response(request, source, content_type=ct, filename=filename)
+        # a derivada é compartilhada como a original: o nome vem deste produto
+        response = gridfs_response(request, derivative, content_type=derivative.content_type,
+                                   filename=f"{os.path.splitext(filename)[0]}-{size}.{chosen}")
+        if fmt is None:
+            response["Vary"] = "Accept"
+        return response
+
+    @action(detail=True, methods=['get'], url_path=r'qr\.(?P<qr_format>png|svg)')
+    def qr(self, request, pk=None, qr_format=None):
+        """
+        QR code do passaporte; `size` = lado em pixels do PNG (padrão 300). Só
+        para quem pode ver o produto; o público usa `passport_qr`.
+        """
+        uid = _get_current_user_id(request)
+        profile = _get_profile(uid)
+        if not uid or not profile:
+            return Response({"success": False, "detail": "Não autenticado."},
+                            status=status.HTTP_401_UNAUTHORIZED)
+        product = None
+        if ObjectId.is_valid(str(pk)):
+            product = Products.objects(id=pk).only("id", "createdById", "ownerUserId").first()
+        if not product:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if not _can_view(profile, product):
+            return Response({"success": False, "detail": "Sem permissão para visualizar este produto."},
+                            status=status.HTTP_403_FORBIDDEN)
+        return _qr_response(request, pk, qr_format)
+
+    @action(detail=False, methods=['post'], url_path='qr-labels')
+    def qr_labels(self, request):
+        """
+        PDF de etiquetas (apps.products.labels) dos produtos visíveis ao usuário.
+        Corpo: `ids` (lista) e/ou `brandName`, `modelName`, `sku`; `cols`, `rows`
+        opcionais. No máximo QR_LABELS_API_MAX produtos por pedido (lotes maiores:
+        `manage.py qr_labels`).
+        """
+        uid = _get_current_user_id(request); profile = _get_profile(uid)
+        if not uid or not profile:
+            return Response({"success": False, "detail": "Não autenticado."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        data = request.data
+        ids = data.get("ids")
+        if ids is not None and not isinstance(ids, list):
+            return Response({"success": False, "error": "'ids' deve ser uma lista."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            layout = sheet_layout(int(data.get("cols") or DEFAULT_COLS), int(data.get("rows") or DEFAULT_ROWS))
+        except (TypeError, ValueError) as e:
+            return Response({"success": False, "error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        query = label_query(
+            visible_filter(profile, _is_superuser(profile)),
+            ids=ids, brand=data.get("brandName"), model=data.get("modelName"), sku=data.get("sku"),
+        )
+        count = Products._get_collection().count_documents(query)
+        if not count:
+            return Response({"success": False, "error": "Nenhum produto encontrado."},
+                            status=status.HTTP_404_NOT_FOUND)
+        if count > settings.QR_LABELS_API_MAX:
+            return Response({"success": False,
+                             "error": f"{count} produtos; o limite por pedido é {settings.QR_LABELS_API_MAX}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            path = tmp.name
+        try:
+            write_label_sheets(path, query, lambda pid: passport_url(pid, request), layout=layout,
+                               workers=settings.QR_LABELS_API_WORKERS)
+            fh = open(path, "rb")
+        finally:
+            os.unlink(path)  # o arquivo aberto continua legível até o fim da resposta
+        return FileResponse(fh, as_attachment=True, filename="etiquetas.pdf", content_type="application/pdf")
 
     @action(detail=True, methods=['post'], url_path='associate-owner')
     def associate_owner(self, request, pk=None):
@@ -904,32 +1121,33 @@ def associate_owner(self, request, pk=None):
  
     @action(detail=True, methods=['get'], url_path='usage-attachment/(?P<attachment_id>[a-f0-9]{32})')
     def usage_attachment(self, request, pk=None, attachment_id=None):
-        product = _get_product_or_404(pk)
+        # Resolve pelo attachmentIndex (uma consulta com projeção, ver apps.products.attachments)
+        found = find_attachment(pk, attachment_id)
+        if found is None:
+            raise Http404("Produto não encontrado")
         uid = _get_current_user_id(request); profile = _get_profile(uid)
-        if not uid or not profile or not _can_view(profile, product):
+        if not uid or not profile or not _can_view(profile, raw_product(found)):
             return Response(status=status.HTTP_403_FORBIDDEN)
 
-        u = getattr(product, "usageData", None)
-        if not u: return Response(status=status.HTTP_404_NOT_FOUND)
-        att = None
-        for it in (u.maintenanceHistory or []):
-            for a in (it.attachments or []):
-                if a.attachmentId == attachment_id: att = a; break
-        if not att:
-            for it in (u.repairHistory or []):
-                for a in (it.attachments or []):
-                    if a.attachmentId == attachment_id: att = a; break
-        if not att or not att.file:
+        entry = found.get("attachment")
+        if entry is None:
+            # produto ainda sem attachmentIndex (ver manage.py backfill_attachment_index)
+            entry = _scan_usage_attachment(pk, attachment_id)
+        if not entry or not entry.get("file"):
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        resp = FileResponse(att.file, content_type=att.contentType or "application/octet-stream")
-        resp["Content-Disposition"] = f'inline; filename="{att.filename or "attachment"}"'
-        return resp
+        grid_out = UsageAttachment._fields["file"].to_python(entry["file"]).get()
+        return gridfs_response(request, grid_out, content_type=entry.get("contentType"),
+                               filename=entry.get("filename") or "attachment")
    
     # apps/products/views.py  (dentro de ProductsViewSet.form_admin)
 
     @action(detail=False, methods=['get'], url_path='form/admin')
     def form_admin(self, request):
+        return _form_tabs_response(request, "admin", self._admin_tabs)
+
+    @staticmethod
+    def _admin_tabs():
         ctx = _build_admin_forms_ctx()
 
         ident_form = ctx['ident']
@@ -1102,10 +1320,14 @@ def form_admin(self, request):
             'step-4': step4_html,
             'extra-prod': extra_prod_html
         }
-        return Response({'tabs': tabs})
+        return tabs
 
     @action(detail=False, methods=['get'], url_path='form/common')
     def form_common(self, request):
+        return _form_tabs_response(request, "common", self._common_tabs)
+
+    @staticmethod
+    def _common_tabs():
         ctx = _build_common_forms_ctx()
         tabs = {
             'extra-prod': ''.join([
@@ -1125,17 +1347,10 @@ def form_common(self, request):
             ]),
             'extra-eol': render_form_rows(ctx['eol'], title="End of Life", icon="bx bx-time-five", cols=3)
         }
-        return Response({'tabs': tabs})
+        return tabs
 
     @action(detail=True, methods=["post"], url_path="operational/update")
     def operational_update(self, request, pk=None):
-        product = Products.objects(id=pk).first()
-        if not product:
-            return Response(
-                {"detail": "Product not found."},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
         try:
             raw_body = request.body.decode("utf-8") or "{}"
             payload = json.loads(raw_body)
@@ -1163,7 +1378,7 @@ def operational_update(self, request, pk=None):
             )
 
         result = apply_operational_delta(
-            product=product,
+            product_id=pk,
             delta=delta,
             source="api",
             source_channel="web_operational_update",
@@ -1174,8 +1389,18 @@ def operational_update(self, request, pk=None):
             raw_payload=json.dumps(delta),
         )
 
-        usage = getattr(result["product"], "usageData", None)
-        operational = getattr(usage, "operationalData", None) if usage else None
+        if not result.get("found", True):
+            return Response(
+                {"detail": "Product not found."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        operational = result.get("operationalData")
+        if operational is None:
+            # Sem mudança: devolve o estado atual só com a projeção necessária
+            current = Products.objects(id=pk).only("usageData.operationalData").first()
+            usage = getattr(current, "usageData", None)
+            operational = getattr(usage, "operationalData", None) if usage else None
 
         return Response(
             {
@@ -1187,6 +1412,102 @@ def operational_update(self, request, pk=None):
             status=status.HTTP_200_OK,
         )
 
+    @action(detail=True, methods=['get'], url_path='telemetry')
+    def telemetry(self, request, pk=None):
+        uid = _get_current_user_id(request)
+        profile = _get_profile(uid)
+        if not uid or not profile:
+            return Response({"success": False, "detail": "Não autenticado."},
+                            status=status.HTTP_401_UNAUTHORIZED)
+
+        product = None
+        if ObjectId.is_valid(str(pk)):
+            product = Products.objects(id=pk).only("id", "createdById", "ownerUserId").first()
+        if not product:
+            return Response({"success": False, "detail": "Produto não encontrado."},
+                            status=status.HTTP_404_NOT_FOUND)
+        if not _can_view(profile, product):
+            return Response({"success": False, "detail": "Sem permissão para visualizar este produto."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        end = _parse_query_datetime(request.query_params.get("to")) or _now_utc()
+        start = _parse_query_datetime(request.query_params.get("from")) or (end - timedelta(hours=24))
+        if start >= end:
+            return Response({"success": False, "detail": "'from' deve ser anterior a 'to'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fields = [f.strip() for f in (request.query_params.get("fields") or "").split(",") if f.strip()]
+        if any("." in f or f.startswith("$") for f in fields):
+            return Response({"success": False, "detail": "Campo inválido em 'fields'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = int(request.query_params.get("limit") or TELEMETRY_DEFAULT_LIMIT)
+        except ValueError:
+            limit = TELEMETRY_DEFAULT_LIMIT
+        # limit(0) no pymongo é "sem limite": nunca deixa passar
+        limit = max(1, min(limit, TELEMETRY_MAX_LIMIT))
+
+        # Gráficos leem rollups; "raw" força os pontos brutos
+        default_resolution = "raw" if rollup_mode() == "off" else "auto"
+        resolution = (request.query_params.get("resolution") or default_resolution).lower()
+        if resolution not in ("auto", "raw", *BUCKET_SECONDS):
+            return Response({"success": False, "detail": "'resolution' inválida (auto, raw, minute, hour, day)."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if resolution == "auto":
+            try:
+                max_points = int(request.query_params.get("points") or TELEMETRY_DEFAULT_POINTS)
+            except ValueError:
+                max_points = TELEMETRY_DEFAULT_POINTS
+            resolution = pick_bucket(start, end, max_points=max(max_points, 1))
+
+        if resolution == "raw":
+            points = query_telemetry(str(product.id), start=start, end=end, fields=fields or None, limit=limit)
+        else:
+            points = query_rollups(str(product.id), bucket=resolution, start=start, end=end, fields=fields or None)
+
+        return Response({
+            "success": True,
+            "from": start,
+            "to": end,
+            "fields": fields or None,
+            "resolution": resolution,
+            "count": len(points),
+            "data": points,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='as-of')
+    def as_of(self, request, pk=None):
+        """Estado do passaporte em `?at=<ISO 8601>`, reconstruído a partir da auditoria."""
+        uid = _get_current_user_id(request)
+        profile = _get_profile(uid)
+        if not uid or not profile:
+            return Response({"success": False, "detail": "Não autenticado."},
+                            status=status.HTTP_401_UNAUTHORIZED)
+
+        product = None
+        if ObjectId.is_valid(str(pk)):
+            product = Products.objects(id=pk).only("id", "createdById", "ownerUserId").first()
+        if not product:
+            return Response({"success": False, "detail": "Produto não encontrado."},
+                            status=status.HTTP_404_NOT_FOUND)
+        if not _can_view(profile, product):
+            return Response({"success": False, "detail": "Sem permissão para visualizar este produto."},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        at = _parse_query_datetime(request.query_params.get("at"))
+        if at is None:
+            return Response({"success": False, "detail": "Informe 'at' (ISO 8601)."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        state = product_as_of(str(product.id), at)
+        if state is None:
+            return Response({"success": False, "detail": "O produto não existia nesse instante."},
+                            status=status.HTTP_404_NOT_FOUND)
+
+        data = self.serializer_class(Products._from_son(state)).data
+        return Response({"success": True, "at": at, "data": data}, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['get'], url_path='aggregation-candidates')
     def aggregation_candidates(self, request, pk=None):
         uid = _get_current_user_id(request)
@@ -1205,32 +1526,12 @@ def aggregation_candidates(self, request, pk=None):
             return Response({"success": False, "detail": "Sem permissão para gerenciar agregação neste passaporte."},
                             status=status.HTTP_403_FORBIDDEN)
 
-        acc_id = str(profile.id)
-
-        raw_parent_free = {
-            "$or": [
-                {"parentId": {"$exists": False}},
-                {"parentId": None},
-            ]
-        }
-
-        qs = Products.objects.filter(
-            identification__isActive=True
-        ).filter(__raw__={
-            "$and": [
-                {
-                    "$or": [
-                        {"createdById": acc_id},
-                        {"ownerUserId": acc_id},
-                    ]
-                },
-                raw_parent_free,
-                {"_id": {"$ne": parent.id}},
-            ]
-        })
-
-        serializer = self.serializer_class(qs, many=True)
-        return Response({"success": True, "data": serializer.data}, status=status.HTTP_200_OK)
+        query = aggregation_candidates_filter(str(profile.id), parent.id)
+        if fast_serialization_enabled():
+            data = serialize_products(Products._get_collection().find(query))
+        else:
+            data = self.serializer_class(Products.objects(__raw__=query), many=True).data
+        return Response({"success": True, "data": data}, status=status.HTTP_200_OK)
     
     @action(detail=True, methods=['post'], url_path='aggregate-child')
     def aggregate_child(self, request, pk=None):
@@ -1536,7 +1837,7 @@ def product_details(request, product_id):
 
     _inject_usage_attachment_urls(request, product, data)
 
-    product_json = json.dumps(data, cls=DjangoJSONEncoder)
+    product_json = dumps_json(data)
 
     context = TemplateLayout.init(
         request,
@@ -1549,16 +1850,18 @@ def product_details(request, product_id):
 
     return render(request, "productDetail.html", context)
 
-def passport_public(request, product_id):
+def _passport_public_data(product_id):
+    """Dados serializados do passaporte público, ou None se não existe/inativo."""
+    if fast_serialization_enabled():
+        raw = None
+        if ObjectId.is_valid(str(product_id)):
+            raw = Products._get_collection().find_one(public_passport_filter(ObjectId(str(product_id))))
+        return serialize_product(raw) if raw else None
     product = Products.objects(id=product_id, identification__isActive=True).first()
-    if not product:
-        return render(request, '404.html', status=404)
-
-    serializer = ProductsSerializer(product)
-    data = serializer.data
+    return ProductsSerializer(product).data if product else None
 
-    product_json = json.dumps(data, cls=DjangoJSONEncoder)
 
+def _render_passport_public(request, data, product_json):
     context = TemplateLayout.init(request, {
         'product': data,
         'product_json': product_json,
@@ -1568,3 +1871,51 @@ def passport_public(request, product_id):
     context['PUBLIC_MODE'] = True
 
     return render(request, 'passportPublic.html', context)
+
+
+def passport_public(request, product_id):
+    """
+    Passaporte público (QR code). A versão do produto (conditional.product_version)
+    vira o ETag da página: scanners revalidam com If-None-Match e recebem 304.
+    Com o cache ligado (PASSPORT_CACHE_BACKEND), página e JSON saem de
+    apps.products.passport_cache enquanto a versão não muda.
+    """
+    cache = get_passport_cache()
+    stamp = PassportCache.current_stamp(product_id)
+    if stamp is None:
+        return render(request, '404.html', status=404)
+
+    language = get_language()
+    etag = make_etag("passport", product_id, stamp, language)
+    cache_control = "public, no-cache"
+    response = not_modified(request, etag=etag, cache_control=cache_control)
+    if response is not None:
+        return response
+
+    entry = (cache.get(product_id, stamp) if cache else None) or {}
+    page = (entry.get("pages") or {}).get(language or "")
+    if page is not None:
+        return set_validators(HttpResponse(page), etag=etag, cache_control=cache_control)
+
+    product_json = entry.get("json")
+    if product_json is not None:
+        data = json.loads(product_json)
+    else:
+        data = _passport_public_data(product_id)
+        if data is None:
+            return render(request, '404.html', status=404)
+        product_json = dumps_json(data)
+
+    response = _render_passport_public(request, data, product_json)
+    if cache:
+        cache.put(product_id, stamp, product_json=product_json, language=language, page=response.content)
+    return set_validators(response, etag=etag, cache_control=cache_control)
+
+
+def passport_qr(request, product_id, qr_format):
+    """QR do passaporte público sem login (etiquetas, e-mails, a própria página pública)."""
+    if not ObjectId.is_valid(str(product_id)) or not Products._get_collection().find_one(
+        public_passport_filter(ObjectId(str(product_id))), {"_id": 1}
+    ):
+        return HttpResponse(status=404)
+    return _qr_response(request, product_id, qr_format)
@@ -0,0 +1,334 @@
+# apps/tracking/audit_sink.py
+import atexit
+import glob
+import logging
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from bson import ObjectId, json_util
+from django.conf import settings
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from apps.tracking.models import ProductAudit
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+RETRY_BASE_SECONDS = 0.5
+RETRY_MAX_SECONDS = 30.0
+
+
+class AuditSink:
+    """
+    Grava auditorias em segundo plano, em lotes (insert_many).
+
+    - `submit()` só enfileira: a request / callback MQTT não espera o Mongo.
+    - Uma thread esvazia a fila a cada `flush_ms` ou quando junta `batch_size`.
+    - Com `spool_dir`, cada auditoria é antes escrita num segmento JSONL em
+      disco; o segmento só é apagado depois do insert, então uma queda do
+      processo não perde auditorias (os segmentos órfãos são regravados na
+      próxima subida). O _id é gerado no submit, o que torna o replay
+      idempotente (duplicados são ignorados).
+    - Se a fila em memória encher, grava de forma síncrona (não descarta).
+    - Falha do Mongo (rede, troca de primário...): o lote não é descartado. Na
+      fila em memória ele fica guardado e é o primeiro da próxima tentativa;
+      no spool o segmento volta a `.ready`. As tentativas seguem com backoff
+      exponencial (RETRY_BASE_SECONDS até RETRY_MAX_SECONDS). Outros erros
+      (documento inválido) não se resolvem tentando de novo: o lote é
+      registrado no log e, no spool, o segmento vira `.failed`.
+    """
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = 200,
+        flush_ms: int = 500,
+        queue_size: int = 10000,
+        spool_dir: Optional[str] = None,
+        fsync: bool = False,
+    ):
+        self.batch_size = max(int(batch_size), 1)
+        self.flush_interval = max(int(flush_ms), 10) / 1000.0
+        self.spool_dir = spool_dir
+        self.fsync = fsync
+
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max(int(queue_size), 1))
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._spool_file = None
+        self._spool_path = None
+        self._spool_lines = 0
+        self._spool_seq = 0
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._thread = None
+        self._failed_batch: Optional[List[dict]] = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+        self.stats = {
+            "submitted": 0,
+            "written": 0,
+            "batches": 0,
+            "syncFallbacks": 0,
+            "errors": 0,
+            "retries": 0,
+            "lastBatchMs": 0.0,
+        }
+
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._recover_spool()
+
+    # ---------------- ciclo de vida ----------------
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="audit-sink", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 30.0):
+        """Para a thread e grava tudo o que ainda estiver pendente."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self.flush()
+        if self.depth() and not self.spool_dir:
+            logger.error("%d auditoria(s) não gravadas ao encerrar (Mongo indisponível)", self.depth())
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.stats["errors"] += 1
+                logger.exception("Falha ao gravar lote de auditoria")
+
+    # ---------------- entrada ----------------
+
+    def submit(self, audit: ProductAudit):
+        """Enfileira a auditoria (já validada). Atribui o _id na hora."""
+        if audit.id is None:
+            audit.id = ObjectId()
+        doc = audit.to_mongo().to_dict()
+        self.stats["submitted"] += 1
+
+        if self.spool_dir:
+            self._append_spool(doc)
+        else:
+            try:
+                self._queue.put_nowait(doc)
+            except queue.Full:
+                # Sem espaço: melhor pagar a latência do que perder a auditoria
+                self.stats["syncFallbacks"] += 1
+                self._insert([doc])
+                return audit
+
+        with self._pending_lock:
+            self._pending += 1
+            pending = self._pending
+        if pending >= self.batch_size:
+            self._wake.set()
+        return audit
+
+    def depth(self) -> int:
+        """Auditorias aceitas e ainda não gravadas no Mongo."""
+        return self._pending
+
+    def snapshot_stats(self) -> dict:
+        s = dict(self.stats)
+        s["pending"] = self.depth()
+        s["spool"] = bool(self.spool_dir)
+        return s
+
+    # ---------------- gravação ----------------
+
+    def flush(self):
+        """Grava agora tudo o que está pendente (pode ser chamada de qualquer thread)."""
+        with self._drain_lock:
+            if not self._stopping.is_set() and time.monotonic() < self._retry_at:
+                return
+            try:
+                if self.spool_dir:
+                    self._flush_spool()
+                else:
+                    self._flush_queue()
+            except PyMongoError as exc:
+                self._failures += 1
+                delay = min(RETRY_BASE_SECONDS * 2 ** (self._failures - 1), RETRY_MAX_SECONDS)
+                self._retry_at = time.monotonic() + delay
+                self.stats["errors"] += 1
+                self.stats["retries"] += 1
+                logger.warning("Falha ao gravar auditorias (%s); nova tentativa em %.1fs", exc, delay)
+                return
+            self._failures = 0
+            self._retry_at = 0.0
+
+    def _flush_queue(self):
+        while True:
+            # lote que falhou antes vai primeiro (os _id já vêm do submit: reenvio idempotente)
+            batch, self._failed_batch = self._failed_batch, None
+            while batch is None or len(batch) < self.batch_size:
+                batch = batch or []
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self._insert(batch)
+            except PyMongoError:
+                self._failed_batch = batch
+                raise
+            except Exception:
+                self.stats["errors"] += len(batch)
+                logger.exception("Lote de %d auditoria(s) descartado (erro não recuperável)", len(batch))
+            self._done(len(batch))
+
+    def _flush_spool(self):
+        self._rotate_spool()
+        claimed = self._claim_ready_segments()
+        for i, path in enumerate(claimed):
+            try:
+                self._drain_segment(path)
+            except PyMongoError:
+                for pending in claimed[i:]:
+                    os.replace(pending, pending.split(".draining-")[0] + ".ready")
+                raise
+            except Exception:
+                failed = path.split(".draining-")[0] + ".failed"
+                os.replace(path, failed)
+                self.stats["errors"] += 1
+                logger.exception("Segmento de auditoria com erro não recuperável mantido em %s", failed)
+
+    def _done(self, count: int):
+        with self._pending_lock:
+            self._pending = max(self._pending - count, 0)
+
+    def _insert(self, docs: List[dict]):
+        started = time.perf_counter()
+        try:
+            ProductAudit._get_collection().insert_many(docs, ordered=False)
+            written = len(docs)
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            real = [e for e in errors if e.get("code") != DUPLICATE_KEY]
+            written = exc.details.get("nInserted", 0)
+            if real:
+                self.stats["errors"] += len(real)
+                logger.error("Falha ao gravar %d auditoria(s): %s", len(real), real[0].get("errmsg"))
+        self.stats["written"] += written
+        self.stats["batches"] += 1
+        self.stats["lastBatchMs"] = round((time.perf_counter() - started) * 1000.0, 2)
+
+    # ---------------- spool em disco ----------------
+
+    def _append_spool(self, doc: dict):
+        line = json_util.dumps(doc) + "\n"
+        with self._spool_lock:
+            if self._spool_file is None:
+                self._spool_seq += 1
+                self._spool_path = os.path.join(
+                    self.spool_dir, f"audit-{os.getpid()}-{int(time.time() * 1000)}-{self._spool_seq}.jsonl"
+                )
+                self._spool_file = open(self._spool_path, "a", encoding="utf-8")
+            self._spool_file.write(line)
+            self._spool_file.flush()
+            if self.fsync:
+                os.fsync(self._spool_file.fileno())
+            self._spool_lines += 1
+
+    def _rotate_spool(self):
+        """Fecha o segmento corrente e o marca como pronto para gravar."""
+        with self._spool_lock:
+            if self._spool_file is None:
+                return
+            self._spool_file.close()
+            os.replace(self._spool_path, self._spool_path[: -len(".jsonl")] + ".ready")
+            self._spool_file = None
+            self._spool_path = None
+            self._spool_lines = 0
+
+    def _claim_ready_segments(self) -> List[str]:
+        claimed = []
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "*.ready"))):
+            target = path[: -len(".ready")] + f".draining-{os.getpid()}"
+            try:
+                os.replace(path, target)  # rename atômico: só um processo pega o segmento
+            except FileNotFoundError:
+                continue
+            claimed.append(target)
+        return claimed
+
+    def _drain_segment(self, path: str):
+        with open(path, "r", encoding="utf-8") as fh:
+            docs = [json_util.loads(line) for line in fh if line.strip()]
+        for i in range(0, len(docs), self.batch_size):
+            self._insert(docs[i:i + self.batch_size])
+        self._done(len(docs))
+        os.remove(path)
+
+    def _recover_spool(self):
+        """Segmentos deixados por processos que morreram voltam a ficar prontos."""
+        for path in glob.glob(os.path.join(self.spool_dir, "audit-*")):
+            name = os.path.basename(path)
+            try:
+                pid = int(name.split("-")[1])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            if name.endswith(".jsonl") or ".draining-" in name:
+                base = name.rsplit(".", 1)[0] if name.endswith(".jsonl") else name.split(".draining-")[0]
+                os.replace(path, os.path.join(self.spool_dir, base + ".ready"))
+        recovered = glob.glob(os.path.join(self.spool_dir, "*.ready"))
+        if recovered:
+            logger.warning("Regravando %d segmento(s) de auditoria do spool", len(recovered))
+            self._wake.set()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def audit_write_mode() -> str:
+    """"async" (AuditSink em segundo plano) ou "sync" (save() na hora)."""
+    return getattr(settings, "AUDIT_WRITE_MODE", "async")
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_audit_sink() -> AuditSink:
+    """Instância única (por processo) do sink, já iniciada."""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = AuditSink(
+                batch_size=int(getattr(settings, "AUDIT_SINK_BATCH_SIZE", 200)),
+                flush_ms=int(getattr(settings, "AUDIT_SINK_FLUSH_MS", 500)),
+                queue_size=int(getattr(settings, "AUDIT_SINK_QUEUE_SIZE", 10000)),
+                spool_dir=getattr(settings, "AUDIT_SINK_SPOOL_DIR", None),
+                fsync=bool(getattr(settings, "AUDIT_SINK_FSYNC", False)),
+            )
+            _sink.start()
+            atexit.register(_sink.stop)
+        return _sink
@@ -0,0 +1,260 @@
+# apps/tracking/history.py
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING
+
+from apps.tracking.models import ProductAudit
+
+# Quantos produtos manter no contador em memória (por processo)
+_COUNTER_MAX = 10000
+
+_counters: "OrderedDict[str, int]" = OrderedDict()
+_counters_lock = threading.Lock()
+
+# Só snapshots completos (to_mongo().to_dict()) carregam o _id do produto
+CHECKPOINT_FILTER = {"newData._id": {"$exists": True}}
+
+
+def audit_storage_mode() -> str:
+    """
+    "full": previousData + newData + diff em todo evento (formato antigo, padrão).
+    "diff": só o diff; newData completo (checkpoint) a cada AUDIT_CHECKPOINT_EVERY eventos por produto.
+    """
+    return getattr(settings, "AUDIT_STORAGE_MODE", "full")
+
+
+def checkpoint_every() -> int:
+    return max(int(getattr(settings, "AUDIT_CHECKPOINT_EVERY", 20)), 1)
+
+
+def is_full_snapshot(data: Optional[Dict[str, Any]]) -> bool:
+    return bool(data) and "_id" in data
+
+
+def _last_checkpoint_seq(product_id: str) -> Optional[int]:
+    """`checkpointSeq` da auditoria mais recente do produto (None se nenhuma tem)."""
+    last = ProductAudit._get_collection().find_one(
+        {"productId": product_id, "checkpointSeq": {"$exists": True}},
+        {"checkpointSeq": 1},
+        sort=[("createdAt", DESCENDING)],
+    )
+    return last["checkpointSeq"] if last else None
+
+
+def next_checkpoint_seq(product_id: str, has_full_snapshot: bool) -> int:
+    """
+    `checkpointSeq` do próximo evento do produto: quantos eventos desde o
+    último checkpoint (0 = este evento guarda o snapshot completo).
+
+    O número fica gravado em cada auditoria; o contador em memória só é
+    inicializado pela auditoria mais recente na primeira vez que o produto
+    aparece no processo (uma consulta pelo índice productId/-createdAt).
+    Com vários processos o intervalo entre checkpoints é aproximado, o que
+    só afeta o custo da reconstrução.
+    """
+    product_id = str(product_id)
+    with _counters_lock:
+        last = _counters.get(product_id)
+    if last is None:
+        last = _last_checkpoint_seq(product_id)
+        if last is None:
+            last = checkpoint_every()  # sem histórico no formato "diff": começa com checkpoint
+
+    seq = 0 if has_full_snapshot and last + 1 >= checkpoint_every() else last + 1
+    _remember_seq(product_id, seq)
+    return seq
+
+
+def mark_checkpoint(product_id: str) -> int:
+    """Evento com snapshot completo fora do ciclo (ex: create); devolve o seq (0)."""
+    _remember_seq(str(product_id), 0)
+    return 0
+
+
+def _remember_seq(product_id: str, seq: int):
+    with _counters_lock:
+        _counters[product_id] = seq
+        _counters.move_to_end(product_id)
+        while len(_counters) > _COUNTER_MAX:
+            _counters.popitem(last=False)
+
+
+# ---------------- aplicação de diffs ----------------
+
+def _split(path: str):
+    return path.split(".")
+
+
+def _path_order(path: str):
+    """Ordena caminhos com índices de lista numericamente (".10" depois de ".9")."""
+    return [(0, int(p), "") if p.isdigit() else (1, 0, p) for p in _split(path)]
+
+
+def _list_pos(items: list, part: str) -> Optional[int]:
+    """Posição do item na lista: índice ("3") ou id ("attachmentId=ab12")."""
+    if "=" in part:
+        key, _, value = part.partition("=")
+        for i, item in enumerate(items):
+            if isinstance(item, dict) and str(item.get(key)) == value:
+                return i
+        return None
+    if part.isdigit():
+        i = int(part)
+        return i if i < len(items) else None
+    return None
+
+
+def _child(node, part: str):
+    if isinstance(node, list):
+        pos = _list_pos(node, part)
+        return node[pos] if pos is not None else None
+    if isinstance(node, dict):
+        return node.get(part)
+    return None
+
+
+def _set_path(doc: dict, path: str, value):
+    parts = _split(path)
+    node = doc
+    for part in parts[:-1]:
+        child = _child(node, part)
+        if not isinstance(child, (dict, list)):
+            child = {}
+            if isinstance(node, list):
+                node.append(child)
+            else:
+                node[part] = child
+        node = child
+    last = parts[-1]
+    if isinstance(node, list):
+        pos = _list_pos(node, last)
+        if pos is None:
+            node.append(deepcopy(value))
+        else:
+            node[pos] = deepcopy(value)
+    else:
+        node[last] = deepcopy(value)
+
+
+def _unset_path(doc: dict, path: str):
+    parts = _split(path)
+    node = doc
+    for part in parts[:-1]:
+        node = _child(node, part)
+        if not isinstance(node, (dict, list)):
+            return
+    last = parts[-1]
+    if isinstance(node, list):
+        pos = _list_pos(node, last)
+        if pos is not None:
+            node.pop(pos)
+    else:
+        node.pop(last, None)
+
+
+def _sets(state: dict, items: Dict[str, Any]):
+    for path in sorted(items, key=_path_order):
+        _set_path(state, path, items[path])
+
+
+def _unsets(state: dict, paths):
+    # De trás pra frente: remover o índice 5 antes do 4 mantém as posições válidas
+    for path in sorted(paths, key=_path_order, reverse=True):
+        _unset_path(state, path)
+
+
+def apply_diff(state: dict, diff: Dict[str, dict]) -> dict:
+    """Aplica um diff de `_compute_diff` (old -> new) sobre `state`, no lugar."""
+    for path, change in (diff.get("changed") or {}).items():
+        _set_path(state, path, change.get("new"))
+    _sets(state, diff.get("added") or {})
+    _unsets(state, diff.get("removed") or {})
+    return state
+
+
+def revert_diff(state: dict, diff: Dict[str, dict]) -> dict:
+    """Desfaz um diff (new -> old) sobre `state`, no lugar."""
+    for path, change in (diff.get("changed") or {}).items():
+        _set_path(state, path, change.get("old"))
+    _unsets(state, diff.get("added") or {})
+    _sets(state, diff.get("removed") or {})
+    return state
+
+
+def _event_diff(event: dict) -> Dict[str, dict]:
+    """Diff do evento; registros agrupados de telemetria ("bucket") viram um diff equivalente."""
+    if event.get("diff"):
+        return event["diff"]
+    changes = event.get("operationalChanges") or {}
+    return {
+        "changed": {
+            f"usageData.operationalData.{key}": {"old": c.get("old"), "new": c.get("new")}
+            for key, c in changes.items()
+        },
+        "added": {},
+        "removed": {},
+    }
+
+
+def _as_utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def product_as_of(product_id: str, timestamp: datetime) -> Optional[dict]:
+    """
+    Estado (documento cru do Mongo) do produto no instante `timestamp`.
+
+    - Parte do checkpoint mais recente <= timestamp e aplica os diffs seguintes.
+    - Sem checkpoint anterior (histórico antigo ou produto com poucos eventos),
+      parte do documento atual e desfaz os diffs posteriores ao instante.
+    - Retorna None se o produto ainda não existia (ou já tinha sido excluído).
+
+    Registros agrupados de telemetria contam pelo `createdAt` (primeiro tick
+    da janela), então dentro de uma janela o resultado é aproximado.
+    """
+    product_id = str(product_id)
+    timestamp = _as_utc(timestamp)
+    coll = ProductAudit._get_collection()
+
+    checkpoint = coll.find_one(
+        {"productId": product_id, "createdAt": {"$lte": timestamp}, **CHECKPOINT_FILTER},
+        sort=[("createdAt", DESCENDING), ("_id", DESCENDING)],
+    )
+    if checkpoint is not None:
+        state = deepcopy(checkpoint["newData"])
+        events = coll.find(
+            {"productId": product_id, "createdAt": {"$gt": checkpoint["createdAt"], "$lte": timestamp}},
+            sort=[("createdAt", ASCENDING), ("_id", ASCENDING)],
+        )
+        for event in events:
+            if event.get("eventType") == "delete":
+                state = None
+            elif event.get("eventType") == "create" or is_full_snapshot(event.get("newData")):
+                state = deepcopy(event["newData"])
+            elif state is not None:
+                apply_diff(state, _event_diff(event))
+        return state
+
+    from apps.products.models import Products
+
+    oid = ObjectId(product_id) if ObjectId.is_valid(product_id) else product_id
+    state = Products._get_collection().find_one({"_id": oid})
+    events = coll.find(
+        {"productId": product_id, "createdAt": {"$gt": timestamp}},
+        sort=[("createdAt", DESCENDING), ("_id", DESCENDING)],
+    )
+    for event in events:
+        if event.get("eventType") == "delete":
+            state = deepcopy(event.get("previousData"))
+        elif event.get("eventType") == "create":
+            state = None
+        elif state is not None:
+            revert_diff(state, _event_diff(event))
+    return state
+
@@ -0,0 +1,110 @@
+# apps/tracking/management/commands/bench_audit_diff.py
+import random
+import time
+from copy import deepcopy
+
+import bson
+from django.core.management.base import BaseCommand
+
+from apps.tracking.utils import _compute_diff
+
+
+def _legacy_diff(old: dict, new: dict, path: str = "") -> dict:
+    """Algoritmo anterior (recursivo, só entra em dicts) para comparação."""
+    changed, added, removed = {}, {}, {}
+    old = old or {}
+    new = new or {}
+    for key in set(old.keys()) | set(new.keys()):
+        full_key = f"{path}.{key}" if path else key
+        old_val = old.get(key)
+        new_val = new.get(key)
+        if isinstance(old_val, dict) and isinstance(new_val, dict):
+            sub = _legacy_diff(old_val, new_val, path=full_key)
+            changed.update(sub["changed"])
+            added.update(sub["added"])
+            removed.update(sub["removed"])
+        elif key not in old and key in new:
+            added[full_key] = new_val
+        elif key in old and key not in new:
+            removed[full_key] = old_val
+        elif old_val != new_val:
+            changed[full_key] = {"old": old_val, "new": new_val}
+    return {"changed": changed, "added": added, "removed": removed}
+
+
+def _passport(rng: random.Random, history: int) -> dict:
+    def attachment(i, j):
+        return {"attachmentId": f"att-{i}-{j}", "fileName": f"laudo-{i}-{j}.pdf", "size": rng.randrange(10**6)}
+
+    return {
+        "identification": {"serialNumber": "SN-1", "model": "Esteira X", "brand": "ACME"},
+        "technicalSpecifications": {f"spec{i}": rng.random() for i in range(200)},
+        "usageData": {
+            "operationalData": {f"m{i}": rng.random() for i in range(200)},
+            "maintenanceHistory": [
+                {"date": f"2024-{i % 12 + 1:02d}-01", "description": "revisão preventiva " * 5,
+                 "attachments": [attachment(i, j) for j in range(3)]}
+                for i in range(history)
+            ],
+            "repairHistory": [{"date": "2024-01-01", "description": f"reparo {i}"} for i in range(history // 4)],
+        },
+        "childIds": [str(i) for i in range(history)],
+        "technicalCompliance": [f"NR-{i}" for i in range(50)],
+    }
+
+
+def _size(diff: dict):
+    entries = sum(len(diff[k]) for k in ("changed", "added", "removed"))
+    return entries, len(bson.encode(diff))
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark do diff da auditoria (atual x anterior) em passaportes sintéticos grandes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--history", type=int, default=2000, help="Itens em maintenanceHistory.")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        base = _passport(rng, opts["history"])
+
+        def scenario_append(doc):
+            doc["usageData"]["maintenanceHistory"].append(
+                {"date": "2025-01-01", "description": "nova", "attachments": []}
+            )
+
+        def scenario_tick(doc):
+            doc["usageData"]["operationalData"]["m7"] = -1.0
+
+        def scenario_attachment(doc):
+            doc["usageData"]["maintenanceHistory"][10]["attachments"].pop(0)
+
+        def scenario_child(doc):
+            doc["childIds"].append("novo")
+
+        scenarios = [
+            ("sem mudança (cópia)", lambda doc: None),
+            ("append em maintenanceHistory", scenario_append),
+            ("tick em operationalData", scenario_tick),
+            ("remove 1 anexo", scenario_attachment),
+            ("append em childIds", scenario_child),
+        ]
+
+        self.stdout.write(f"Passaporte sintético com {opts['history']} manutenções, {opts['repeat']} repetições")
+        for name, mutate in scenarios:
+            new = deepcopy(base)
+            mutate(new)
+            results = []
+            for fn in (_legacy_diff, _compute_diff):
+                started = time.perf_counter()
+                for _ in range(opts["repeat"]):
+                    diff = fn(base, new)
+                ms = (time.perf_counter() - started) * 1000.0 / opts["repeat"]
+                results.append((ms, _size(diff)))
+            (old_ms, (old_n, old_b)), (new_ms, (new_n, new_b)) = results
+            self.stdout.write(
+                f"  {name:30s} anterior {old_ms:7.3f} ms, {old_n} entrada(s), {old_b:>8d} B | "
+                f"atual {new_ms:7.3f} ms, {new_n} entrada(s), {new_b:>6d} B"
+            )
@@ -0,0 +1,97 @@
+# apps/tracking/management/commands/bench_audit_storage.py
+import random
+import time
+from copy import deepcopy
+from datetime import datetime, timedelta, timezone
+
+import bson
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+
+from apps.tracking.history import apply_diff
+from apps.tracking.utils import _compute_diff
+
+
+def _synthetic_product(rng: random.Random) -> dict:
+    return {
+        "_id": ObjectId(),
+        "identification": {"serialNumber": "SN-0001", "internalCode": "IC-0001", "model": "Esteira X"},
+        "technicalSpecifications": {f"spec{i}": rng.random() for i in range(40)},
+        "documentation": {"notes": "x" * 2000},
+        "usageData": {"operationalData": {f"m{i}": 0.0 for i in range(20)}},
+        "maintenanceHistory": [],
+        "createdAt": datetime(2024, 1, 1, tzinfo=timezone.utc),
+    }
+
+
+def _mutate(doc: dict, rng: random.Random, n: int):
+    roll = rng.random()
+    if roll < 0.7:
+        doc["usageData"]["operationalData"][f"m{rng.randrange(20)}"] = rng.random()
+    elif roll < 0.9:
+        doc["technicalSpecifications"][f"spec{rng.randrange(40)}"] = rng.random()
+    else:
+        doc["maintenanceHistory"].append({"date": f"2024-01-{n % 28 + 1:02d}", "description": "revisão " * 10})
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara, em memória, o formato antigo da auditoria (previousData + newData + diff) "
+        "com o formato \"diff\" (só diff + checkpoint a cada K eventos): tamanho em BSON "
+        "e custo de reconstruir o estado num instante (product_as_of)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=2000)
+        parser.add_argument("--checkpoint-every", type=int, default=20)
+        parser.add_argument("--queries", type=int, default=500)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        k = max(opts["checkpoint_every"], 1)
+        state = _synthetic_product(rng)
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+        full_events, diff_events = [], []
+        for n in range(opts["events"]):
+            before = deepcopy(state)
+            _mutate(state, rng, n)
+            after = deepcopy(state)
+            diff = _compute_diff(before, after)
+            created = start + timedelta(seconds=n)
+            full_events.append({"previousData": before, "newData": after, "diff": diff, "createdAt": created})
+            event = {"diff": diff, "createdAt": created}
+            if n % k == 0:
+                event["newData"] = after
+            diff_events.append(event)
+
+        full_bytes = sum(len(bson.encode(e)) for e in full_events)
+        diff_bytes = sum(len(bson.encode(e)) for e in diff_events)
+        self.stdout.write(f"{opts['events']} eventos, checkpoint a cada {k}")
+        self.stdout.write(f"  full: {full_bytes / 1024:.1f} KiB ({full_bytes / len(full_events):.0f} B/evento)")
+        self.stdout.write(f"  diff: {diff_bytes / 1024:.1f} KiB ({diff_bytes / len(diff_events):.0f} B/evento)"
+                          f" -> {100.0 * diff_bytes / full_bytes:.1f}% do formato antigo")
+
+        targets = [rng.randrange(len(full_events)) for _ in range(opts["queries"])]
+
+        t0 = time.perf_counter()
+        for i in targets:
+            deepcopy(full_events[i]["newData"])
+        full_ms = (time.perf_counter() - t0) * 1000.0 / len(targets)
+
+        t0 = time.perf_counter()
+        mismatches = 0
+        for i in targets:
+            cp = i - (i % k)
+            rebuilt = deepcopy(diff_events[cp]["newData"])
+            for event in diff_events[cp + 1:i + 1]:
+                apply_diff(rebuilt, event["diff"])
+            if rebuilt != full_events[i]["newData"]:
+                mismatches += 1
+        diff_ms = (time.perf_counter() - t0) * 1000.0 / len(targets)
+
+        self.stdout.write(f"  reconstrução full: {full_ms:.3f} ms/consulta")
+        self.stdout.write(f"  reconstrução diff: {diff_ms:.3f} ms/consulta (até {k - 1} diffs aplicados)")
+        if mismatches:
+            self.stderr.write(f"  {mismatches} reconstruções divergiram do snapshot completo!")
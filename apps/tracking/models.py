@@ -5,6 +5,7 @@
     DateTimeField,
     DictField,
     BooleanField,
+    IntField,
 )
 from datetime import datetime, timezone
 
@@ -58,6 +59,16 @@ class ProductAudit(DynamicDocument):
 
     notes = StringField(null=True)
 
+    # Auditoria agrupada de telemetria (OPERATIONAL_AUDIT_MODE = "bucket")
+    bucketStart = DateTimeField(null=True)
+    lastTickAt = DateTimeField(null=True)
+    tickCount = IntField(null=True)
+    operationalChanges = DictField(null=True)
+
+    # AUDIT_STORAGE_MODE = "diff": eventos desde o último checkpoint (0 = newData completo);
+    # ausente nos outros modos
+    checkpointSeq = IntField()
+
     createdAt = DateTimeField(default=now_utc)
 
     meta = {
@@ -69,5 +80,7 @@ class ProductAudit(DynamicDocument):
             'lifecycleCategory',
             'relatedProductId',
             '-createdAt',
+            ('productId', 'lifecycleType', 'bucketStart'),
+            ('productId', '-createdAt'),  # replay do product_as_of
         ]
     }
@@ -1,12 +1,36 @@
 # apps/tracking/utils.py
+import threading
+from collections import OrderedDict
 from typing import Optional, Dict, Any
 from copy import deepcopy
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from apps.tracking.audit_sink import audit_write_mode, get_audit_sink
+from apps.tracking.history import audit_storage_mode, is_full_snapshot, mark_checkpoint, next_checkpoint_seq
 from apps.tracking.models import ProductAudit
 
 
-def _compute_diff(old: dict, new: dict, path: str = "") -> Dict[str, dict]:
+# Listas de dicts casadas pelo id do item (e não pela posição): nome do campo -> chave
+DIFF_LIST_KEYS = {
+    "attachments": "attachmentId",
+}
+
+
+def _keyed(items: list, key: str):
+    """{id: item} se todos os itens forem dicts com `key` única; senão None."""
+    out = {}
+    for item in items:
+        if not isinstance(item, dict) or key not in item or item[key] in out:
+            return None
+        out[item[key]] = item
+    return out
+
+
+def _compute_diff(old: dict, new: dict, path: str = "", list_keys: Optional[Dict[str, str]] = None) -> Dict[str, dict]:
     """
-    Calcula as diferenças entre dois dicts (old x new), de forma recursiva.
+    Calcula as diferenças entre dois dicts (old x new).
 
     Retorna:
     {
@@ -17,39 +41,81 @@ def _compute_diff(old: dict, new: dict, path: str = "") -> Dict[str, dict]:
 
     Onde "campo" pode ser algo como:
     - "identification.serialNumber"
-    - "usageData.maintenanceHistory.0.description"
+    - "usageData.maintenanceHistory.0.description"   (listas: item a item, pela posição)
+    - "usageData.maintenanceHistory.0.attachments.attachmentId=ab12.fileName"
+      (listas de DIFF_LIST_KEYS: casadas pelo id do item; a ordem não é registrada)
     etc.
+
+    Percorre a árvore com uma pilha (sem recursão) e descarta subárvores
+    idênticas logo na comparação do pai (mesmo objeto ou `==`, feito em C).
     """
     changed = {}
     added = {}
     removed = {}
+    list_keys = DIFF_LIST_KEYS if list_keys is None else list_keys
 
-    old = old or {}
-    new = new or {}
-
-    all_keys = set(old.keys()) | set(new.keys())
-    for key in all_keys:
-        full_key = f"{path}.{key}" if path else key
-        old_val = old.get(key)
-        new_val = new.get(key)
+    stack = [(old or {}, new or {}, path, None)]
+    while stack:
+        old_val, new_val, prefix, field = stack.pop()
 
-        if isinstance(old_val, dict) and isinstance(new_val, dict):
-            sub = _compute_diff(old_val, new_val, path=full_key)
-            changed.update(sub["changed"])
-            added.update(sub["added"])
-            removed.update(sub["removed"])
+        if isinstance(old_val, dict):
+            children = []
+            for key, ov in old_val.items():
+                full_key = f"{prefix}.{key}" if prefix else key
+                if key not in new_val:
+                    removed[full_key] = ov
+                    continue
+                children.append((ov, new_val[key], full_key, key))
+            for key, nv in new_val.items():
+                if key not in old_val:
+                    added[f"{prefix}.{key}" if prefix else key] = nv
         else:
-            if key not in old and key in new:
-                added[full_key] = new_val
-            elif key in old and key not in new:
-                removed[full_key] = old_val
-            elif old_val != new_val:
-                changed[full_key] = {"old": old_val, "new": new_val}
+            keyed = None
+            id_key = list_keys.get(field)
+            if id_key:
+                old_map = _keyed(old_val, id_key)
+                new_map = _keyed(new_val, id_key) if old_map is not None else None
+                if new_map is not None:
+                    keyed = (old_map, new_map)
+
+            children = []
+            if keyed is not None:
+                old_map, new_map = keyed
+                for item_id, ov in old_map.items():
+                    full_key = f"{prefix}.{id_key}={item_id}"
+                    if item_id not in new_map:
+                        removed[full_key] = ov
+                    else:
+                        children.append((ov, new_map[item_id], full_key, None))
+                for item_id, nv in new_map.items():
+                    if item_id not in old_map:
+                        added[f"{prefix}.{id_key}={item_id}"] = nv
+            else:
+                common = min(len(old_val), len(new_val))
+                # Prefixo igual (ex: só append) sai numa comparação em C; senão só
+                # as posições que diferem viram filhos
+                if old_val[:common] != new_val[:common]:
+                    for i, (ov, nv) in enumerate(zip(old_val, new_val)):
+                        if ov is not nv and ov != nv:
+                            children.append((ov, nv, f"{prefix}.{i}", None))
+                for i in range(common, len(new_val)):
+                    added[f"{prefix}.{i}"] = new_val[i]
+                for i in range(common, len(old_val)):
+                    removed[f"{prefix}.{i}"] = old_val[i]
+
+        for ov, nv, full_key, key in children:
+            if ov is nv:
+                continue
+            if isinstance(ov, dict) and isinstance(nv, dict) or isinstance(ov, list) and isinstance(nv, list):
+                if ov != nv:
+                    stack.append((ov, nv, full_key, key))
+            elif ov != nv:
+                changed[full_key] = {"old": ov, "new": nv}
 
     return {"changed": changed, "added": added, "removed": removed}
 
 
-def log_product_audit(
+def build_product_audit(
     *,
     instance,                     # instância de Products (mongoengine)
     event_type: str,
@@ -67,11 +133,16 @@ def log_product_audit(
     notes: Optional[str] = None,
 ):
     """
-    Função genérica de auditoria/tracking para Products.
+    Monta (sem salvar) o documento de auditoria de um Products.
 
     - `previous_data` e `new_data` devem ser dicts (ex: instance.to_mongo().to_dict()).
-    - Pode ser chamada de serializers, views, serviços, brokers, etc.
+    - `instance` pode ser o documento ou apenas o id do produto.
+    - Útil para quem grava várias auditorias de uma vez (insert em lote).
+    - Com AUDIT_STORAGE_MODE = "diff", updates guardam só o diff e, a cada
+      AUDIT_CHECKPOINT_EVERY eventos do produto, o newData completo como
+      checkpoint (ver apps.tracking.history.product_as_of).
     """
+    product_id = str(getattr(instance, "id", instance))
 
     if previous_data is None and event_type in ("update", "delete", "relation_change", "lifecycle_event"):
         raise ValueError("previous_data é obrigatório para eventos de update/delete/relation_change/lifecycle_event")
@@ -114,8 +185,17 @@ def log_product_audit(
     base_data = previous_data or new_data or {}
     identification = base_data.get("identification") or {}
 
+    checkpoint_seq = None
+    if audit_storage_mode() == "diff":
+        if diff_data is not None:
+            checkpoint_seq = next_checkpoint_seq(product_id, is_full_snapshot(new_data))
+            previous_data = None
+            new_data = new_data if checkpoint_seq == 0 else None
+        elif is_full_snapshot(new_data):
+            checkpoint_seq = mark_checkpoint(product_id)
+
     audit = ProductAudit(
-        productId=str(getattr(instance, "id", None)),
+        productId=product_id,
         productCode=identification.get("serialNumber") or identification.get("internalCode"),
 
         eventType=event_type,
@@ -139,6 +219,197 @@ def log_product_audit(
         hasLifecycleChange=has_lifecycle_change,
 
         notes=notes,
+        checkpointSeq=checkpoint_seq,
+    )
+    return audit
+
+
+def log_product_audit(**kwargs):
+    """
+    Função genérica de auditoria/tracking para Products.
+
+    - Aceita os mesmos argumentos de `build_product_audit`.
+    - Pode ser chamada de serializers, views, serviços, brokers, etc.
+    - Com AUDIT_WRITE_MODE = "async" só valida e enfileira no AuditSink
+      (a gravação sai da latência da request); o _id já vem preenchido.
+    """
+    audit = build_product_audit(**kwargs)
+    _write_audit(audit)
+    return audit
+
+
+def _write_audit(audit: ProductAudit):
+    if audit_write_mode() == "async":
+        audit.validate()
+        get_audit_sink().submit(audit)
+    else:
+        audit.save()
+
+
+# ---------------- auditoria de dados operacionais (telemetria) ----------------
+
+OPERATIONAL_LIFECYCLE_TYPE = "operational_data_update"
+OPERATIONAL_AUDIT_MODES = ("full", "changes", "bucket", "sample")
+
+# Quantos produtos manter no contador do modo "sample" (por processo)
+_SAMPLE_COUNTER_MAX = 10000
+
+_sample_counters: "OrderedDict[str, int]" = OrderedDict()
+_sample_lock = threading.Lock()
+
+
+def operational_audit_mode() -> str:
+    """
+    Política de auditoria para `lifecycle_type="operational_data_update"`:
+
+    - "full":    snapshots completos + diff (igual às edições de usuário)
+    - "changes": só o diff das chaves alteradas, sem previousData/newData
+    - "bucket":  um registro por produto por janela de tempo, acumulando as mudanças
+    - "sample":  grava 1 a cada N ticks por produto (formato "full")
+    """
+    mode = getattr(settings, "OPERATIONAL_AUDIT_MODE", "full")
+    return mode if mode in OPERATIONAL_AUDIT_MODES else "full"
+
+
+def _sampled(product_id: str) -> bool:
+    every = max(int(getattr(settings, "OPERATIONAL_AUDIT_SAMPLE_EVERY", 10)), 1)
+    with _sample_lock:
+        n = _sample_counters.get(product_id, 0)
+        _sample_counters[product_id] = n + 1
+        _sample_counters.move_to_end(product_id)
+        while len(_sample_counters) > _SAMPLE_COUNTER_MAX:
+            _sample_counters.popitem(last=False)
+    return n % every == 0
+
+
+def build_operational_audit(
+    *,
+    product_id: str,
+    previous_ops: Dict[str, Any],
+    new_ops: Dict[str, Any],
+    source: Optional[str] = None,
+    source_channel: Optional[str] = None,
+    actor_id: Optional[str] = None,
+    actor_name: Optional[str] = None,
+    previous_data: Optional[Dict[str, Any]] = None,
+    new_data: Optional[Dict[str, Any]] = None,
+    notes: Optional[str] = None,
+    mode: Optional[str] = None,
+) -> Optional[ProductAudit]:
+    """
+    Monta a auditoria de um tick de telemetria conforme a política ("full",
+    "changes" ou "sample"). Retorna None quando o tick não deve ser gravado.
+
+    `previous_data`/`new_data` (snapshots completos) são opcionais e só são
+    usados no modo "full"; nos demais os snapshots ficam restritos a
+    usageData.operationalData.
+    """
+    mode = mode or operational_audit_mode()
+    if mode != "full":
+        previous_data = new_data = None
+    if mode == "sample":
+        if not _sampled(str(product_id)):
+            return None
+        every = getattr(settings, "OPERATIONAL_AUDIT_SAMPLE_EVERY", 10)
+        notes = f"{notes or ''} (amostra 1/{every})".strip()
+
+    audit = build_product_audit(
+        instance=str(product_id),
+        event_type="update",
+        source=source,
+        source_channel=source_channel,
+        actor_id=actor_id,
+        actor_name=actor_name,
+        actor_type="user" if actor_id else "system",
+        previous_data=previous_data or {"usageData": {"operationalData": previous_ops}},
+        new_data=new_data or {"usageData": {"operationalData": new_ops}},
+        lifecycle_category="other",
+        lifecycle_type=OPERATIONAL_LIFECYCLE_TYPE,
+        notes=notes,
+    )
+    if mode == "changes":
+        audit.previousData = None
+        audit.newData = None
+    return audit
+
+
+def upsert_operational_bucket(
+    *,
+    product_id: str,
+    previous_ops: Dict[str, Any],
+    new_ops: Dict[str, Any],
+    source: Optional[str] = None,
+    source_channel: Optional[str] = None,
+    notes: Optional[str] = None,
+):
+    """
+    Acumula o tick no registro de auditoria do produto para a janela atual
+    (OPERATIONAL_AUDIT_BUCKET_SECONDS), com um único upsert atômico.
+
+    O registro guarda em `operationalChanges` o primeiro "old" e o último
+    "new" de cada chave na janela, além de `tickCount`.
+    """
+    changes = {
+        k: (previous_ops.get(k), v)
+        for k, v in new_ops.items()
+        if (k not in previous_ops or previous_ops.get(k) != v)
+        and isinstance(k, str) and "." not in k and not k.startswith("$")
+    }
+    if not changes:
+        return None
+
+    seconds = max(int(getattr(settings, "OPERATIONAL_AUDIT_BUCKET_SECONDS", 300)), 1)
+    now = datetime.now(timezone.utc)
+    bucket_start = datetime.fromtimestamp(int(now.timestamp()) // seconds * seconds, tz=timezone.utc)
+
+    def keep(field, value):
+        # Mantém o valor existente; só define no primeiro tick da janela
+        return {"$cond": [{"$eq": [{"$type": f"${field}"}, "missing"]}, {"$literal": value}, f"${field}"]}
+
+    stage = {
+        "eventType": keep("eventType", "update"),
+        "source": keep("source", source),
+        "sourceChannel": keep("sourceChannel", source_channel),
+        "actorType": keep("actorType", "system"),
+        "lifecycleCategory": keep("lifecycleCategory", "other"),
+        "hasStructChange": keep("hasStructChange", False),
+        "hasLifecycleChange": keep("hasLifecycleChange", True),
+        "notes": keep("notes", notes),
+        "createdAt": keep("createdAt", now),
+        "lastTickAt": {"$literal": now},
+        "tickCount": {"$add": [{"$ifNull": ["$tickCount", 0]}, 1]},
+    }
+    for key, (old, new) in changes.items():
+        stage[f"operationalChanges.{key}.old"] = keep(f"operationalChanges.{key}.old", old)
+        stage[f"operationalChanges.{key}.new"] = {"$literal": new}
+
+    return ProductAudit._get_collection().update_one(
+        {
+            "productId": str(product_id),
+            "lifecycleType": OPERATIONAL_LIFECYCLE_TYPE,
+            "bucketStart": bucket_start,
+        },
+        [{"$set": stage}],
+        upsert=True,
     )
-    audit.save()
+
+
+def log_operational_audit(**kwargs):
+    """
+    Grava a auditoria de um tick de telemetria conforme OPERATIONAL_AUDIT_MODE.
+    Aceita os argumentos de `build_operational_audit`.
+    """
+    if operational_audit_mode() == "bucket":
+        upsert_operational_bucket(
+            product_id=kwargs["product_id"],
+            previous_ops=kwargs["previous_ops"],
+            new_ops=kwargs["new_ops"],
+            source=kwargs.get("source"),
+            source_channel=kwargs.get("source_channel"),
+            notes=kwargs.get("notes"),
+        )
+        return None
+    audit = build_operational_audit(**kwargs)
+    if audit is not None:
+        _write_audit(audit)
     return audit
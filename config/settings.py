@@ -77,6 +77,109 @@
 MQTT_BROKER_PORT = 1883
 MQTT_TOPIC = "conveyor/operational_data/#"
 
+# "direct": uma escrita + auditoria por mensagem
+# "batched": acumula deltas por produto e grava com um único bulk_write por janela
+MQTT_INGEST_MODE = os.environ.get("MQTT_INGEST_MODE", "direct")
+MQTT_BATCH_WINDOW_MS = int(os.environ.get("MQTT_BATCH_WINDOW_MS", 250))
+MQTT_BATCH_MAX_MESSAGES = int(os.environ.get("MQTT_BATCH_MAX_MESSAGES", 500))
+MQTT_BATCH_AUDIT = True  # uma auditoria por produto por flush
+
+# Pool de consumo: tira o trabalho de banco da thread de rede do paho.
+# MQTT_CONSUMER_THREADS = 0 processa inline (comportamento antigo).
+MQTT_CONSUMER_THREADS = int(os.environ.get("MQTT_CONSUMER_THREADS", 4))
+MQTT_QUEUE_SIZE = int(os.environ.get("MQTT_QUEUE_SIZE", 1000))
+MQTT_BACKPRESSURE = os.environ.get("MQTT_BACKPRESSURE", "block")  # block | drop_oldest | spill
+MQTT_SPILL_DIR = os.environ.get("MQTT_SPILL_DIR", str(BASE_DIR / "var" / "mqtt_spill"))
+
+# Ingestão standalone (`manage.py run_ingest --processes N`).
+# Com MQTT_RUN_IN_WEB = False o runserver não sobe o worker embutido.
+MQTT_RUN_IN_WEB = os.environ.get("MQTT_RUN_IN_WEB", "True").lower() in ["true", "yes", "1"]
+MQTT_INGEST_PROCESSES = int(os.environ.get("MQTT_INGEST_PROCESSES", 0))  # 0 = número de CPUs
+MQTT_SHARE_GROUP = os.environ.get("MQTT_SHARE_GROUP", "passport-ingest")
+
+# Histórico de telemetria (coleção time-series; exige MongoDB >= 5.0,
+# em versões anteriores cai para uma coleção comum com TTL)
+TELEMETRY_ENABLED = True
+TELEMETRY_COLLECTION = "products_telemetry"
+TELEMETRY_GRANULARITY = "seconds"  # seconds | minutes | hours
+TELEMETRY_EXPIRE_SECONDS = 90 * 24 * 60 * 60  # None = não expira
+
+# Rollups min/max/mean/count/last por minuto/hora/dia
+# "ingest": atualizados na gravação | "catchup": `manage.py rollup_telemetry` | "off"
+TELEMETRY_ROLLUP_MODE = os.environ.get("TELEMETRY_ROLLUP_MODE", "ingest")
+TELEMETRY_ROLLUP_COLLECTION = "products_telemetry_rollup"
+
+# Auditoria de operational_data_update (edições de usuário sempre têm auditoria completa):
+# "full" (snapshots completos, padrão), "changes" (só as chaves alteradas),
+# "bucket" (um registro por produto a cada OPERATIONAL_AUDIT_BUCKET_SECONDS)
+# ou "sample" (1 a cada OPERATIONAL_AUDIT_SAMPLE_EVERY ticks por produto)
+OPERATIONAL_AUDIT_MODE = os.environ.get("OPERATIONAL_AUDIT_MODE", "full")
+OPERATIONAL_AUDIT_BUCKET_SECONDS = int(os.environ.get("OPERATIONAL_AUDIT_BUCKET_SECONDS", 300))
+OPERATIONAL_AUDIT_SAMPLE_EVERY = int(os.environ.get("OPERATIONAL_AUDIT_SAMPLE_EVERY", 10))
+
+# Gravação das auditorias: "async" (fila + insert_many em segundo plano) ou "sync" (save() na request)
+AUDIT_WRITE_MODE = os.environ.get("AUDIT_WRITE_MODE", "async")
+AUDIT_SINK_BATCH_SIZE = int(os.environ.get("AUDIT_SINK_BATCH_SIZE", 200))
+AUDIT_SINK_FLUSH_MS = int(os.environ.get("AUDIT_SINK_FLUSH_MS", 500))
+AUDIT_SINK_QUEUE_SIZE = int(os.environ.get("AUDIT_SINK_QUEUE_SIZE", 10000))
+# Spool em disco (durável a quedas do processo); None = só memória
+AUDIT_SINK_SPOOL_DIR = os.environ.get("AUDIT_SINK_SPOOL_DIR") or None
+AUDIT_SINK_FSYNC = False
+
+# Armazenamento da auditoria: "full" (previousData/newData em todo evento, padrão) ou
+# "diff" (só o diff + snapshot completo a cada AUDIT_CHECKPOINT_EVERY eventos por produto)
+AUDIT_STORAGE_MODE = os.environ.get("AUDIT_STORAGE_MODE", "full")
+AUDIT_CHECKPOINT_EVERY = int(os.environ.get("AUDIT_CHECKPOINT_EVERY", 20))
+
+# Leitura de produtos sem hidratar no mongoengine (apps/products/fast_serializers.py)
+PRODUCTS_FAST_SERIALIZATION = os.environ.get("PRODUCTS_FAST_SERIALIZATION", "True").lower() in ["true", "yes", "1"]
+
+# Cache do passaporte público (apps/products/passport_cache.py): "locmem" (LRU por processo),
+# "django" (CACHES[PASSPORT_CACHE_ALIAS], compartilhado entre workers) ou "off"
+PASSPORT_CACHE_BACKEND = os.environ.get("PASSPORT_CACHE_BACKEND", "locmem")
+PASSPORT_CACHE_ALIAS = "passport"
+PASSPORT_CACHE_MAX_ENTRIES = int(os.environ.get("PASSPORT_CACHE_MAX_ENTRIES", 1000))
+PASSPORT_CACHE_TTL = int(os.environ.get("PASSPORT_CACHE_TTL", 300))
+
+# Downloads do GridFS (apps/products/gridfs_stream.py): com GRIDFS_ACCEL_REDIRECT o arquivo é
+# copiado para GRIDFS_ACCEL_ROOT e servido pelo nginx (location interna GRIDFS_ACCEL_PREFIX)
+GRIDFS_ACCEL_REDIRECT = os.environ.get("GRIDFS_ACCEL_REDIRECT", "False").lower() in ["true", "yes", "1"]
+GRIDFS_ACCEL_ROOT = os.environ.get("GRIDFS_ACCEL_ROOT", str(BASE_DIR / "var" / "gridfs"))
+GRIDFS_ACCEL_PREFIX = os.environ.get("GRIDFS_ACCEL_PREFIX", "/protected-files/")
+
+# Derivadas da imagem principal (apps/products/images.py): geradas no upload num pool em
+# segundo plano (ou na primeira requisição de `image?size=`)
+IMAGE_DERIVATIVES_ON_UPLOAD = os.environ.get("IMAGE_DERIVATIVES_ON_UPLOAD", "True").lower() in ["true", "yes", "1"]
+IMAGE_DERIVATIVE_WORKERS = int(os.environ.get("IMAGE_DERIVATIVE_WORKERS", 2))
+
+# Uploads (manual, imagem, anexos) deduplicados por sha256 com contagem de referências
+# (apps/products/file_store.py)
+FILE_DEDUP_ENABLED = os.environ.get("FILE_DEDUP_ENABLED", "True").lower() in ["true", "yes", "1"]
+
+# QR code do passaporte gerado no servidor (apps/products/qr.py). PASSPORT_BASE_URL é a origem
+# gravada no QR (ex: https://passaporte.exemplo.pt); vazia = host da requisição
+PASSPORT_BASE_URL = os.environ.get("PASSPORT_BASE_URL", "")
+QR_CACHE_DIR = os.environ.get("QR_CACHE_DIR", str(BASE_DIR / "var" / "cache" / "qr"))
+QR_CACHE_MAX_AGE = int(os.environ.get("QR_CACHE_MAX_AGE", 30 * 24 * 3600))
+# Etiquetas pela API (POST qr-labels): limite de produtos e processos do pool (1 = no próprio worker)
+QR_LABELS_API_MAX = int(os.environ.get("QR_LABELS_API_MAX", 2000))
+QR_LABELS_API_WORKERS = int(os.environ.get("QR_LABELS_API_WORKERS", 1))
+
+# Perfil da conta logada (apps/accounts/profiles.py): cache por processo, invalidado em User.save()
+ACCOUNT_PROFILE_CACHE_TTL = int(os.environ.get("ACCOUNT_PROFILE_CACHE_TTL", 30))
+ACCOUNT_PROFILE_CACHE_MAX_ENTRIES = int(os.environ.get("ACCOUNT_PROFILE_CACHE_MAX_ENTRIES", 5000))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "passport": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("PASSPORT_CACHE_DIR", str(BASE_DIR / "var" / "cache" / "passport")),
+        "OPTIONS": {"MAX_ENTRIES": PASSPORT_CACHE_MAX_ENTRIES},
+    },
+}
+
 
 # Application definition
 
@@ -112,6 +215,7 @@
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "apps.accounts.profiles.AccountProfileMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
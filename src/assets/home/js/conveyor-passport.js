@@ -25,32 +25,6 @@ function updateText(selector, value, fallback = "Dado não fornecido") {
   }
 }
 
-// ----------------- QR Code -----------------
-
-function generateQRCode(data) {
-  const qrCodeContainer = document.getElementById("qrcode");
-  if (!qrCodeContainer) {
-    console.warn('Elemento #qrcode não encontrado. QR não será gerado.');
-    return;
-  }
-
-  qrCodeContainer.innerHTML = "";
-
-  const QR_BASE_PATH = "/products/passport/";
-  const fullUrl = `${window.location.origin}${QR_BASE_PATH}${data.id}/`;
-
-  // global QRCode vindo do qrcode.min.js
-  // text = URL pública do passaporte
-  new QRCode(qrCodeContainer, {
-    text: fullUrl,
-    width: 150,
-    height: 150,
-    colorDark: "#000000",
-    colorLight: "#ffffff",
-    correctLevel: QRCode.CorrectLevel.H,
-  });
-}
-
 // ----------------- Mapa -----------------
 
 function initMap() {
@@ -389,8 +363,6 @@ $(document).ready(function () {
     return;
   }
 
-  generateQRCode(productData);
-
   renderProductionFromProductData();
   renderEndOfLifeFromProductData();
   renderAttachmentsFromProductData();
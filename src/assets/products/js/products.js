@@ -49,33 +49,54 @@ function unlockAllEditFields() {
   $('#manualFile').prop('disabled', false);
 }
 
-function fetchProducts(callback) {
-  $.ajax({
-    url: '/products/api/products/',
-    type: 'GET',
-    dataType: 'json',
-    headers: {
-      'X-CSRFToken': getCookie('csrftoken'),
-      Accept: 'application/json'
-    },
-    success: function (response) {
-      if (response.success) {
-        if (callback) callback(response.data);
-      } else {
-        showBootstrapAlert('danger', 'Erro', response.error || 'Erro ao carregar produtos');
-        if (callback) callback([]);
-      }
-    },
-    error: function (xhr) {
-      if (xhr.status === 401) {
-        window.location = '/accounts/login/?next=' + encodeURIComponent(window.location.pathname);
-        return;
+const PRODUCTS_PAGE_SIZE = 100;
+
+// Busca a listagem resumida (view=summary) página a página, seguindo o nextCursor.
+// onPage(items) é chamado a cada página; callback(todos) no fim.
+function fetchProducts(callback, onPage) {
+  const all = [];
+
+  function loadPage(cursor) {
+    const params = { view: 'summary', limit: PRODUCTS_PAGE_SIZE };
+    if (cursor) params.cursor = cursor;
+
+    $.ajax({
+      url: '/products/api/products/',
+      type: 'GET',
+      dataType: 'json',
+      data: params,
+      headers: {
+        'X-CSRFToken': getCookie('csrftoken'),
+        Accept: 'application/json'
+      },
+      success: function (response) {
+        if (response.success) {
+          const items = response.data || [];
+          all.push(...items);
+          if (onPage) onPage(items);
+          if (response.nextCursor) {
+            loadPage(response.nextCursor);
+          } else if (callback) {
+            callback(all);
+          }
+        } else {
+          showBootstrapAlert('danger', 'Erro', response.error || 'Erro ao carregar produtos');
+          if (callback) callback(all);
+        }
+      },
+      error: function (xhr) {
+        if (xhr.status === 401) {
+          window.location = '/accounts/login/?next=' + encodeURIComponent(window.location.pathname);
+          return;
+        }
+        console.error('Erro ao buscar produtos:', xhr);
+        showBootstrapAlert('danger', 'Erro', 'Falha ao carregar produtos');
+        if (callback) callback(all);
       }
-      console.error('Erro ao buscar produtos:', xhr);
-      showBootstrapAlert('danger', 'Erro', 'Falha ao carregar produtos');
-      if (callback) callback([]);
-    }
-  });
+    });
+  }
+
+  loadPage(null);
 }
 
 function fetchProductById(id, callback) {
@@ -134,19 +155,32 @@ function loadProductsGrid() {
     '<div class="col-12 text-center py-5"><div class="spinner-border text-primary" role="status"></div></div>'
   );
 
-  fetchProducts(function (products) {
-    $grid.empty();
+  let first = true;
+  fetchProducts(
+    function (products) {
+      if (first) $grid.empty();
+      if (!products.length) {
+        $grid.append('<div class="col-12 text-center">Nenhum produto cadastrado</div>');
+      }
+    },
+    function (page) {
+      // Renderiza cada página assim que chega
+      if (first) {
+        $grid.empty();
+        first = false;
+      }
+      page.forEach(p => $grid.append(cardHtml(p)));
 
-    if (!products.length) {
-      $grid.append('<div class="col-12 text-center">Nenhum produto cadastrado</div>');
-      return;
+      if (typeof rebindProductCardEvents === 'function') rebindProductCardEvents();
+      bindAssociateButtons();
     }
+  );
+}
 
-    products.forEach(p => $grid.append(cardHtml(p)));
-
-    if (typeof rebindProductCardEvents === 'function') rebindProductCardEvents();
-    bindAssociateButtons();
-  });
+// Imagens servidas pela API têm derivadas (?size=thumb|medium); URLs externas ficam como estão
+function sizedImageUrl(url, size) {
+  if (!url || !/\/products\/api\/products\/[^/]+\/image\/?$/.test(url)) return url;
+  return `${url}${url.endsWith('/') ? '' : '/'}?size=${size}`;
 }
 
 function cardHtml(product) {
@@ -155,7 +189,7 @@ function cardHtml(product) {
   const model = product.identification?.modelName || '---';
   const active = product.identification?.isActive === false ? false : true;
   const image =
-    product.imageUrl ||
+    sizedImageUrl(product.imageUrl, 'thumb') ||
     'https://img.freepik.com/premium-vector/default-image-icon-vector-missing-picture-page-website-design-mobile-app-no-photo-available_87543-11093.jpg?w=360';
   const desc = product.description || 'Sem descrição';
   const category = product.identification?.productCategory?.primary || '';
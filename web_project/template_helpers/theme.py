@@ -1,8 +1,14 @@
 from django.conf import settings
-from pprint import pprint
+import logging
 import os
 from importlib import import_module, util
 
+logger = logging.getLogger(__name__)
+
+# (THEME_LAYOUT_DIR, layout) -> imported TemplateBootstrap class.
+# find_spec/import_module only run for the first page of each layout.
+_bootstrap_classes = {}
+
 
 # Core TemplateHelper class
 class TemplateHelper:
@@ -35,28 +41,38 @@ def set_layout(view, context={}):
         # Extract layout from the view path
         layout = os.path.splitext(view)[0].split("/")[0]
 
+        TemplateHelper.get_bootstrap_class(layout).init(context)
+
+        return f"{settings.THEME_LAYOUT_DIR}/{view}"
+
+    # Resolve (once per layout) the bootstrap class of the theme
+    def get_bootstrap_class(layout):
+        key = (settings.THEME_LAYOUT_DIR, layout)
+        TemplateBootstrap = _bootstrap_classes.get(key)
+        if TemplateBootstrap is not None:
+            return TemplateBootstrap
+
         # Get module path
         module = f"templates.{settings.THEME_LAYOUT_DIR.replace('/', '.')}.bootstrap.{layout}"
 
         # Check if the bootstrap file is exist
         if util.find_spec(module) is not None:
-            # Auto import and init the default bootstrap.py file from the theme
+            # Auto import the bootstrap.py file from the theme
             TemplateBootstrap = TemplateHelper.import_class(
                 module, f"TemplateBootstrap{layout.title().replace('_', '')}"
             )
-            TemplateBootstrap.init(context)
         else:
             module = f"templates.{settings.THEME_LAYOUT_DIR.replace('/', '.')}.bootstrap.default"
 
             TemplateBootstrap = TemplateHelper.import_class(
                 module, "TemplateBootstrapDefault"
             )
-            TemplateBootstrap.init(context)
 
-        return f"{settings.THEME_LAYOUT_DIR}/{view}"
+        _bootstrap_classes[key] = TemplateBootstrap
+        return TemplateBootstrap
 
     # Import a module by string
     def import_class(fromModule, import_className):
-        pprint(f"Loading {import_className} from {fromModule}")
+        logger.debug("Loading %s from %s", import_className, fromModule)
         module = import_module(fromModule)
         return getattr(module, import_className)